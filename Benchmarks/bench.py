@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import resource
+import statistics
+import subprocess
+import datetime
+import torch
+
+### Shared pieces of the benchmark suite: timing, memory, run metadata and result files
+# Results are JSON lines, one record per benchmark case, each with the metadata of the run
+# (commit, torch version, machine), so result files of different commits can be compared.
+
+def synchronize(device):
+    if torch.device(device).type == 'cuda':
+        torch.cuda.synchronize(device)
+
+def time_call(fn, repeat=5, number=None, min_time=0.2, device='cpu'):
+    """
+    Median and best time per call of fn (seconds). fn is called number times per repeat; by default
+    number is chosen so that one repeat takes at least min_time. One warm-up call is not timed.
+    """
+    fn()
+    synchronize(device)
+    if number is None:
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            synchronize(device)
+            if time.perf_counter() - start >= min_time or number >= 1 << 20:
+                break
+            number *= 2
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        synchronize(device)
+        times.append((time.perf_counter() - start) / number)
+    return {'median_s': statistics.median(times), 'best_s': min(times), 'calls': number, 'repeat': repeat}
+
+def peak_rss_mb():
+    """ Peak resident set size of this process so far (MB). """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 if sys.platform != 'darwin' else rss / 1024**2 # kB on Linux, bytes on macOS
+
+def current_rss_mb():
+    """ Current resident set size of this process (MB, Linux only; None elsewhere). """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024**2
+    except (OSError, ValueError):
+        return None
+
+def git_commit(path=None):
+    path = path or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=path, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def metadata():
+    """ Description of the code version and machine the benchmarks ran on. """
+    from Utils.device import default_num_threads
+    return {'commit': git_commit(), 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'host': socket.gethostname(), 'platform': platform.platform(), 'python': platform.python_version(),
+            'torch': torch.__version__, 'cores': default_num_threads(),
+            'cpu': platform.processor() or platform.machine()}
+
+
+class ResultWriter:
+    """ Appends benchmark records (dicts) to a JSON-lines file and prints a one-line summary of each. """
+    def __init__(self, path=None):
+        self.path = path
+        self.meta = metadata()
+        self.records = []
+
+    def __call__(self, record):
+        record = {**record, **self.meta}
+        self.records.append(record)
+        if self.path:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        print(summary(record), flush=True)
+        return record
+
+    def __repr__(self):
+        return f"ResultWriter(path={self.path}, records={len(self.records)})"
+
+
+def summary(record):
+    keys = [k for k in ('benchmark', 'N', 'batch', 'threads', 'precision', 'scheme', 'format') if k in record]
+    case = ' '.join(f"{k}={record[k]}" for k in keys)
+    if 'error' in record:
+        return f"{case}: failed ({record['error']})"
+    if 'steps_per_s' in record:
+        return f"{case}: {record['steps_per_s']:.2f} steps/s, peak RSS {record['peak_rss_mb']:.0f} MB"
+    return f"{case}: {record['median_s']*1e3:.3f} ms"
+
+def load_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+CASE_KEYS = ('benchmark', 'N', 'batch', 'threads', 'precision', 'scheme', 'format', 'device')
+
+def compare(base_path, new_path, threshold=0.1):
+    """
+    Compares two result files case by case (matched on CASE_KEYS). Returns a list of
+    (case, base, new, relative change) of the time per step / per call; slower is positive.
+    Changes above threshold are flagged as regressions by the CLI.
+    """
+    def time_of(r):
+        return 1/r['steps_per_s'] if 'steps_per_s' in r else r.get('median_s')
+    base = {tuple(r.get(k) for k in CASE_KEYS): r for r in load_results(base_path) if 'error' not in r}
+    rows = []
+    for r in load_results(new_path):
+        key = tuple(r.get(k) for k in CASE_KEYS)
+        if 'error' in r or key not in base:
+            continue
+        t0, t1 = time_of(base[key]), time_of(r)
+        rows.append((dict(zip(CASE_KEYS, key)), t0, t1, t1/t0 - 1))
+    return rows
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import itertools
+import warnings
+import torch
+
+from Benchmarks.bench import time_call
+
+### Micro-benchmarks of the solver kernels and the snapshot writers
+# Each kernel is timed on a random field of the case's size; writers are timed per snapshot
+# written into a temporary directory (for the background writer: the time the loop is blocked).
+
+KERNELS = ('jacobian_pq', 'jacobian', 'dealias', 'cos_forcing', 'CosForcing', 'spectrum')
+WRITERS = ('npy', 'hdf5', 'spectral', 'background')
+
+
+def _setup(N, batch, device, precision='float32'):
+    from Grid.grid import Grid
+    from Operators.operators import SpectralDerivatives, NonlinearOperator
+    from Initial_forcing.ics import init_randn
+
+    class pde_params:
+        mu = 2e-2; nu = 1.025e-4; B = 2.5; nv = 1
+    class forcing_params:
+        option = 1; A = -1/10; B = 2; C = 0.5; D = 1/10; E = 2; F = 0.3
+
+    grid = Grid(Nx=N, Ny=N, device=device, precision=precision)
+    sd = SpectralDerivatives(grid)
+    seed = list(range(495, 495 + batch)) if batch > 1 else 495
+    q, p, u, v = (f.to(device) for f in init_randn(0.01, [3.0, 5.0], grid, sd, seed))
+    return grid, sd, NonlinearOperator(sd, pde_params), forcing_params, (q, p, u, v)
+
+
+def kernel_functions(grid, sd, nlo, forcing_params, fields):
+    """ Zero-argument callables of every kernel. """
+    from Operators.spectral_conversion import dealias
+    from Initial_forcing.forcing import cos_forcing, CosForcing
+    from Plotting.plots import energy_enstrophy_spectra
+    q, p, u, v = fields
+    out = torch.empty_like(q)
+    y = q.clone()
+    cos = CosForcing()
+    t = iter(itertools.count())
+    return {'jacobian_pq': lambda: nlo.jacobian_pq(q, p, u, v),
+            'jacobian': lambda: nlo.jacobian(q, u[..., 0, 0], v[..., 0, 0], out),
+            'dealias': lambda: dealias(y, sd, 1/3),
+            'cos_forcing': lambda: cos_forcing(grid, sd, forcing_params, 1e-3*next(t)),
+            'CosForcing': lambda: cos(grid, sd, forcing_params, 1e-3*next(t)),
+            'spectrum': lambda: energy_enstrophy_spectra(q, sd)}
+
+
+def writer_functions(grid, sd, nlo, fields, directory):
+    """ Zero-argument callables writing one snapshot with every writer. """
+    from Output.writers import NpyWriter, BackgroundWriter
+    from Output.spectral import SpectralWriter, pack_spectral
+    from Operators.spectral_conversion import to_physical
+    q, p, u, v = fields
+    physical = torch.stack([to_physical(f) for f in fields], dim=-3).float()
+    packed = pack_spectral(q, u[..., 0, 0], v[..., 0, 0], sd.dealias_mask(1/3))
+    writers = {'npy': (NpyWriter(os.path.join(directory, 'fields.npy')), physical),
+               'spectral': (SpectralWriter(os.path.join(directory, 'spectral.npy'), grid), packed),
+               'background': (BackgroundWriter(NpyWriter(os.path.join(directory, 'background.npy'))), physical)}
+    try:
+        from Output.writers import HDF5Writer
+        writers['hdf5'] = (HDF5Writer(os.path.join(directory, 'fields.h5')), physical)
+    except ImportError:
+        pass
+    return {name: (writer, (lambda w=writer, f=snapshot: w.write(w.count, f)))
+            for name, (writer, snapshot) in writers.items()}
+
+
+def run_kernel_benchmarks(results, grids, batches=(1,), precisions=('float32',), kernels=KERNELS, writers=WRITERS,
+                          device='cpu', repeat=5):
+    """ Times every kernel and writer for each grid size, batch size and precision. """
+    for N, batch, precision in itertools.product(grids, batches, precisions):
+        case = {'N': N, 'batch': batch, 'precision': precision, 'threads': torch.get_num_threads(), 'device': str(device)}
+        try:
+            grid, sd, nlo, forcing_params, fields = _setup(N, batch, device, precision)
+            functions = kernel_functions(grid, sd, nlo, forcing_params, fields)
+        except Exception as e:
+            results({'benchmark': 'setup', **case, 'error': f"{type(e).__name__}: {e}"})
+            continue
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            for name in kernels:
+                try:
+                    results({'benchmark': name, **case, **time_call(functions[name], repeat=repeat, device=device)})
+                except Exception as e:
+                    results({'benchmark': name, **case, 'error': f"{type(e).__name__}: {e}"})
+
+        with tempfile.TemporaryDirectory() as directory:
+            for name, (writer, write) in writer_functions(grid, sd, nlo, fields, directory).items():
+                if name not in writers:
+                    continue
+                try:
+                    timing = time_call(write, repeat=3, number=2, device=device)
+                    writer.close()
+                    size_mb = os.path.getsize(writer.writer.path if name == 'background' else writer.path) / writer.count / 1024**2
+                    results({'benchmark': 'writer', 'format': name, **case, **timing,
+                             'snapshot_mb': size_mb, 'mb_per_s': size_mb / timing['median_s']})
+                except Exception as e:
+                    writer.close()
+                    results({'benchmark': 'writer', 'format': name, **case, 'error': f"{type(e).__name__}: {e}"})
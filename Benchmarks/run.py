@@ -0,0 +1,65 @@
+import argparse
+import torch
+
+from Benchmarks.bench import ResultWriter, compare
+from Benchmarks.solver import solver_cases, run_solver_benchmarks
+from Benchmarks.kernels import run_kernel_benchmarks, KERNELS, WRITERS
+
+### Benchmark suite entry point (runs on a plain CPU box)
+# python -m Benchmarks.run solver --grids 128 256 512 --threads 1 4 --out bench.jsonl
+# python -m Benchmarks.run kernels --grids 256 1024 --out bench.jsonl
+# python -m Benchmarks.run compare base.jsonl new.jsonl
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='QG solver benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def common(p):
+        p.add_argument('--grids', type=int, nargs='+', default=[128, 256, 512, 1024, 2048], help='Grid sizes N (N x N)')
+        p.add_argument('--batches', type=int, nargs='+', default=[1], help='Ensemble sizes')
+        p.add_argument('--precisions', nargs='+', default=['float32'], help='float32 and/or float64')
+        p.add_argument('--device', default='cpu')
+        p.add_argument('--out', default=None, help='JSON-lines file the records are appended to')
+
+    solver = sub.add_parser('solver', help='Steps/second and peak RSS of Simulation.time_step')
+    common(solver)
+    solver.add_argument('--threads', type=int, nargs='+', default=None, help='Intra-op thread counts (default: all cores)')
+    solver.add_argument('--schemes', nargs='+', default=['ab2cn'], help='Time integrators (time_params.scheme)')
+    solver.add_argument('--steps', type=int, default=20, help='Timed steps per case')
+    solver.add_argument('--warmup', type=int, default=3, help='Untimed steps per case')
+
+    kernels = sub.add_parser('kernels', help='Micro-benchmarks of kernels and snapshot writers')
+    common(kernels)
+    kernels.add_argument('--threads', type=int, default=None, help='Intra-op threads (default: all cores)')
+    kernels.add_argument('--kernels', nargs='+', default=list(KERNELS), help=f'Subset of {KERNELS}')
+    kernels.add_argument('--writers', nargs='+', default=list(WRITERS), help=f'Subset of {WRITERS}')
+
+    comp = sub.add_parser('compare', help='Compare two result files (time per step / call)')
+    comp.add_argument('base')
+    comp.add_argument('new')
+    comp.add_argument('--threshold', type=float, default=0.1, help='Relative slow-down reported as a regression')
+
+    args = parser.parse_args(argv)
+    from Utils.device import default_num_threads
+
+    if args.command == 'solver':
+        results = ResultWriter(args.out)
+        threads = args.threads or [default_num_threads()]
+        run_solver_benchmarks(results, solver_cases(args.grids, threads, args.batches, args.precisions, args.schemes,
+                                                    args.steps, args.warmup, args.device))
+    elif args.command == 'kernels':
+        torch.set_num_threads(args.threads or default_num_threads())
+        results = ResultWriter(args.out)
+        run_kernel_benchmarks(results, args.grids, args.batches, args.precisions, args.kernels, args.writers, args.device)
+    else:
+        regressions = 0
+        for case, t0, t1, change in compare(args.base, args.new, args.threshold):
+            flag = 'REGRESSION' if change > args.threshold else ''
+            name = ' '.join(f"{k}={v}" for k, v in case.items() if v is not None)
+            print(f"{name}: {t0*1e3:.3f} ms -> {t1*1e3:.3f} ms ({change:+.1%}) {flag}")
+            regressions += change > args.threshold
+        return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
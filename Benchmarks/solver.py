@@ -0,0 +1,81 @@
+import time
+import itertools
+import multiprocessing as mp
+import torch
+
+### Solver throughput: steps/second and peak RSS of Simulation.time_step
+# Every case runs in a fresh (spawned) process, so its peak RSS is not inflated by earlier cases.
+
+
+class StepTimer:
+    """ Simulation monitor recording the wall time after every step. """
+    interval = 1
+
+    def __init__(self):
+        self.times = []
+
+    def start(self, simulation):
+        self.times = [time.perf_counter()]
+
+    def __call__(self, simulation):
+        self.times.append(time.perf_counter())
+
+    def close(self):
+        pass
+
+    def steps_per_s(self, warmup):
+        return (len(self.times) - 1 - warmup) / (self.times[-1] - self.times[warmup])
+
+
+def _solver_case(case):
+    """ One throughput case (run in a child process). Returns the result record. """
+    from Benchmarks.bench import peak_rss_mb, current_rss_mb
+    try:
+        torch.set_num_threads(case['threads'])
+        from Grid.grid import Grid
+        from Operators.operators import SpectralDerivatives, LinearOperator, NonlinearOperator
+        from Initial_forcing.ics import init_randn
+        from Initial_forcing.forcing import make_forcing
+        from Simulation.simulation import Simulation
+        from Output.writers import NullWriter
+
+        class pde_params:
+            mu = 2e-2; nu = 1.025e-4; B = 2.5; nv = 1
+        class forcing_params:
+            option = 1; A = -1/10; B = 2; C = 0; D = 1/10; E = 2; F = 0
+        class time_params:
+            dt = 1e-4
+            T = (case['warmup'] + case['steps'] + 1.5) * 1e-4
+            save_int = 10**9 # Only the IC snapshot
+            scheme = case['scheme']
+
+        rss_start = current_rss_mb()
+        N = case['N']
+        grid = Grid(Nx=N, Ny=N, device=case['device'], precision=case['precision'])
+        sd = SpectralDerivatives(grid)
+        seed = list(range(495, 495 + case['batch'])) if case['batch'] > 1 else 495
+        ic = init_randn(0.01, [3.0, 5.0], grid, sd, seed)
+        timer = StepTimer()
+        sim = Simulation(grid, pde_params, sd, LinearOperator(sd, pde_params), NonlinearOperator(sd, pde_params), ic,
+                         time_params, forcing_params, make_forcing(forcing_params), NullWriter(), monitors=[timer])
+        sim.run()
+        steps_per_s = timer.steps_per_s(case['warmup'])
+        return {**case, 'steps_per_s': steps_per_s, 'member_steps_per_s': steps_per_s*case['batch'],
+                'peak_rss_mb': peak_rss_mb(), 'start_rss_mb': rss_start}
+    except Exception as e:
+        return {**case, 'error': f"{type(e).__name__}: {e}"}
+
+
+def solver_cases(grids, threads, batches, precisions, schemes=('ab2cn',), steps=20, warmup=3, device='cpu'):
+    """ Cross product of the benchmark parameters. """
+    for N, n_threads, batch, precision, scheme in itertools.product(grids, threads, batches, precisions, schemes):
+        yield {'benchmark': 'solver', 'N': N, 'threads': n_threads, 'batch': batch, 'precision': precision,
+               'scheme': scheme, 'steps': steps, 'warmup': warmup, 'device': str(device)}
+
+
+def run_solver_benchmarks(results, cases):
+    """ Runs every case in its own process and passes the records to results (a ResultWriter). """
+    ctx = mp.get_context('spawn')
+    for case in cases:
+        with ctx.Pool(1) as pool:
+            results(pool.apply(_solver_case, (case,)))
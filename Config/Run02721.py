@@ -5,23 +5,36 @@ class grid_params:
     Ny= 512
     Lx= 2*math.pi
     Ly= 2*math.pi
+    device = 'cuda' #(cuda or cpu, falls back to cpu if no GPU; --device overrides)
+    num_threads = None #(Intra-op CPU threads; None uses all available cores)
+    precision = 'float32' #(float32: complex64 spectra; float64: complex128 spectra, ~2x slower FFTs and twice the memory)
+    fft = 'torch' #(FFT backend: torch, scipy or numpy on the CPU; auto times them once per grid/batch/threads and caches the fastest)
+    fft_workers = None #(scipy threads; None uses the intra-op thread count)
+    # Distributed CPU runs: torchrun --nproc_per_node P Driver/driver_qg.py --run_num N (Ny must be divisible by P)
     
 class time_params:
     dt= 5e-4
     T = 200001 *dt
     save_int=1024 #(Frequency of .np saves and plots)
+    checkpoint_int=8192 #(Frequency of solver checkpoints for --resume)
+    compile = False #(Compile the time step with torch.compile)
+    scheme = 'ab2cn' #(ab2cn, imex_rk3 or etdrk4; see Time_marching/integrators.py for stability limits)
+    adaptive = False #(Adapt dt to the CFL number; snapshots still land on multiples of save_int*dt)
+    cfl_bounds = None #(dt is reset to the middle of the bounds when the CFL number leaves them; None: the scheme's bounds)
+    dt_max = None #(Largest adaptive dt; None is save_int*dt)
     
 class pde_params:
     mu = 2e-2 #(Linear drag)
     nu = 1.025e-4  #(Viscosity coefficient)
     B = 2.5  #(Beta parameter)
     nv = 1 #(Hyperviscous order)
+    # mu, nu and B may also be lists with one value per ensemble member
     
 class ic_params:
     option = 1 #(Modify if other initializes are developed)
     energy= 0.01
     wavenumbers= [3.0, 5.0]
-    seed= 495
+    seed= 495 #(A list of seeds runs a batched ensemble, e.g. [495, 496, 497])
        
 class forcing_params:
     option = 1 # 1 is cos forcing
@@ -32,10 +45,66 @@ class forcing_params:
     E=2
     F=0
             
+class spinup_params:
+    T = 0 #(Time integrated on the coarse grid before the run, continued from its zero-padded state; 0 disables the spin-up)
+    Nx = 128 #(Coarse grid)
+    Ny = 128
+    dt = None #(Coarse time step; None scales dt with the grid spacing)
+    steady_tol = 0 #(End the spin-up early once energy and enstrophy are stationary to this tolerance, see watchdog_params)
+    steady_window = 32
+            
+class output_params:
+    format = 'npy' #(npy or hdf5 are appended to during the run; spectral stores only the dealiased q spectrum; compressed is lossy with the error bound below; memory keeps all snapshots in RAM)
+    abs_error = None #(compressed: absolute error bound of every field)
+    rel_error = 1e-3 #(compressed: error bound relative to the max |field| of each snapshot; the smaller bound applies)
+    codec = 'quantize' #(compressed: quantize (integer codes) or float16 where it meets the bound)
+    background = True #(Write snapshots from a background thread)
+    dtype = 'float32' #(Snapshot storage: float16, float32 or float64, independent of the solver precision)
+    plots = 'png' #(png, animation, both or none; rendered in parallel after the run)
+    plot_workers = None #(Rendering processes; None uses one per core)
+            
+class diagnostics_params:
+    interval = 64 #(Steps between energy/enstrophy/CFL diagnostics; 0 disables them)
+    spectra = False #(Also append energy and enstrophy spectra)
+            
+class observation_params:
+    interval = 0 #(Steps between samples of the fields at sensor points, streamed to observations_RunXXXXX.npy; 0 disables them)
+    points = 1024 #(Number of random points (drawn with seed), an [n, 2] list of (x, y) or a .npy file of them)
+    seed = 0
+    fields = ('q', 'u', 'v') #(Any of q, p, u, v)
+    method = 'auto' #(spectral: exact Fourier sum at the points; interp: FFT to the grid and interpolation; auto: the cheaper)
+    order = 'cubic' #(interp: cubic or linear)
+            
+class watchdog_params:
+    interval = 64 #(Steps between health checks of the solution; 0 disables them)
+    max_growth = 10.0 #(Abort when the energy grows more than this factor between checks, or becomes NaN/Inf)
+    max_cfl = 'auto' #(Abort when the CFL number exceeds this; 'auto': the scheme's limit, 1.0 for ab2cn, 1.25 for imex_rk3, 2.0 for etdrk4; None skips the check)
+    steady_tol = 0 #(Stop once energy and enstrophy are stationary to this relative tolerance; 0 runs to T)
+    steady_window = 32 #(Checks compared by the steady-state test: the means of its two halves)
+    steady_start = 0.0 #(Time from which the steady-state test samples)
+            
+class statistics_params:
+    interval = 0 #(Steps between samples of the streaming time averages: mean/variance fields, zonal-mean profiles, spectra; 0 disables them)
+    start = 0.0 #(Averaging window start time, e.g. after the spin-up transient)
+    end = None #(Averaging window end time; None is the end of the run)
+    spectra = True #(Also average the energy and enstrophy spectra)
+            
+class profiling_params:
+    progress_int = 1024 #(Print steps/s and ETA every progress_int steps; 0 disables)
+    timers = False #(Per-phase wall times, printed at the end of the run)
+    trace_steps = None #(e.g. (1000, 1010) exports a torch.profiler trace of these steps)
+
 class params:
     grid = grid_params
     time = time_params
     pde = pde_params
     ic = ic_params
     forcing = forcing_params
+    spinup = spinup_params
+    output = output_params
+    diagnostics = diagnostics_params
+    statistics = statistics_params
+    observations = observation_params
+    watchdog = watchdog_params
+    profiling = profiling_params
     run_number = 2721
\ No newline at end of file
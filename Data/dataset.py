@@ -0,0 +1,145 @@
+import os
+import glob
+import bisect
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+### Training data from saved snapshot files
+# Snapshot files ([T, 4, Ny, Nx] .npy or HDF5, spectral .npy or compressed .qgz, see Output.writers) are memory-mapped
+# and read one sample at a time, so runs much larger than RAM stream from disk. The files are opened
+# lazily in every process: a dataset handed to DataLoader workers pickles only its file list.
+
+FIELDS = ('q', 'p', 'u', 'v')
+
+
+def coarse_grain(fields, factor, method='spectral'):
+    """
+    Low-resolution version [..., Ny/factor, Nx/factor] of physical fields [..., Ny, Nx] (leading dimensions batched).
+    spectral: truncation to the wavenumbers of the coarse grid (Operators.spectral_conversion.resample),
+    box: average over factor x factor blocks.
+    """
+    Ny, Nx = fields.shape[-2:]
+    if Ny % factor or Nx % factor:
+        raise ValueError(f"Grid {Ny}x{Nx} is not divisible by the coarse-graining factor {factor}")
+    if method == 'spectral':
+        from Operators.spectral_conversion import to_physical, to_spectral, resample
+        return to_physical(resample(to_spectral(fields), Ny//factor, Nx//factor))
+    elif method == 'box':
+        return fields.reshape(fields.shape[:-2] + (Ny//factor, factor, Nx//factor, factor)).mean(dim=(-3, -1))
+    raise ValueError("Invalid coarse-graining method (spectral or box).")
+
+
+def run_files(run_numbers, fmt='npy', results_dir=None):
+    """
+    Snapshot files of the given runs (the files of every member of ensemble runs), in run and member order.
+    results_dir maps a run number to its results folder (default: Utils.utils.results_dir).
+    """
+    from Output.writers import snapshot_file
+    if results_dir is None:
+        from Utils.utils import results_dir
+    paths = []
+    for run_number in run_numbers:
+        run_dir = results_dir(run_number)
+        members = sorted(glob.glob(os.path.join(run_dir, 'Member[0-9][0-9][0-9]')))
+        paths += [snapshot_file(d, run_number, fmt) for d in (members or [run_dir])]
+    return paths
+
+
+class _SnapshotFile:
+    """ One memory-mapped snapshot file, opened on first access. read(times) returns [len(times), 4, Ny, Nx]. """
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+
+    def open(self):
+        if self.data is None:
+            from Output.spectral import is_spectral_file, SpectralSnapshots
+            from Output.compressed import is_compressed_file, CompressedSnapshots
+            if is_spectral_file(self.path):
+                self.data = SpectralSnapshots(self.path)
+            elif is_compressed_file(self.path):
+                self.data = CompressedSnapshots(self.path)
+            elif self.path.endswith('.h5') or self.path.endswith('.hdf5'):
+                import h5py
+                self.data = h5py.File(self.path, 'r')['fields']
+            else:
+                from Output.writers import load_npy_snapshots
+                self.data = load_npy_snapshots(self.path)
+        return self.data
+
+    def __len__(self):
+        return len(self.open())
+
+    def read(self, times, channels):
+        data = self.open()
+        from Output.spectral import SpectralSnapshots
+        from Output.compressed import CompressedSnapshots
+        if isinstance(data, (SpectralSnapshots, CompressedSnapshots)):
+            # Spectral and compressed files: only the requested fields are reconstructed (decoded)
+            return data.fields(times, [FIELDS[c] for c in channels]).numpy()
+        # (h5py needs increasing, unique indices: read those and restore the requested order)
+        unique, inverse = np.unique(times, return_inverse=True)
+        return data[unique.tolist()][inverse][:, channels]
+
+    def close(self):
+        self.data = None
+
+    def __getstate__(self):
+        return {'path': self.path, 'data': None}
+
+
+class SnapshotDataset(Dataset):
+    """
+    Snapshots of one or many runs as a map-style dataset. Sample i is (file, time) of the flattened index;
+    it holds the selected fields as a [len(fields), Ny, Nx] tensor.
+    With factor, samples are (high, low) resolution pairs, low coarse-grained by coarse_grain(method).
+    DataLoader fetches whole batches through __getitems__: each file is read once per batch and the
+    coarse-graining transforms the batch at once (in the worker processes).
+
+    paths: snapshot files (see run_files), fields: names out of q, p, u, v,
+    times: slice of the save times used from every file (default: all), dtype: of the returned tensors.
+    """
+    def __init__(self, paths, fields=('q',), times=None, factor=None, method='spectral', dtype=torch.float32):
+        self.files = [_SnapshotFile(path) for path in paths]
+        self.channels = [FIELDS.index(name) for name in fields]
+        self.factor = factor
+        self.method = method
+        self.dtype = dtype
+        self.times = []
+        for f in self.files:
+            self.times.append(np.arange(len(f))[times if times is not None else slice(None)])
+            f.close()
+        self.offsets = np.cumsum([0] + [len(t) for t in self.times]).tolist()
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def locate(self, index):
+        """ (file number, save time) of sample index. """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Sample {index} out of range ({len(self)} samples)")
+        f = bisect.bisect_right(self.offsets, index) - 1
+        return f, int(self.times[f][index - self.offsets[f]])
+
+    def __getitem__(self, index):
+        return self.__getitems__([index])[0]
+
+    def __getitems__(self, indices):
+        located = [self.locate(index) for index in indices]
+        samples = [None] * len(indices)
+        for f in sorted(set(f for f, _ in located)):
+            positions = [i for i, (g, _) in enumerate(located) if g == f]
+            values = torch.from_numpy(self.files[f].read([located[i][1] for i in positions], self.channels))
+            for i, value in zip(positions, values):
+                samples[i] = value
+        batch = torch.stack(samples).to(self.dtype)
+        if self.factor is None:
+            return list(batch)
+        return list(zip(batch, coarse_grain(batch, self.factor, self.method).to(self.dtype)))
+
+    def __repr__(self):
+        return (f"SnapshotDataset({len(self.files)} files, {len(self)} samples, channels={self.channels}, "
+                f"factor={self.factor}, method={self.method})")
@@ -0,0 +1,6 @@
+import os
+
+
+def distributed_launch():
+    """ True when started by torchrun (or another launcher) with more than one process. """
+    return int(os.environ.get('WORLD_SIZE', 1)) > 1
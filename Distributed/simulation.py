@@ -0,0 +1,100 @@
+import os
+import torch
+import torch.distributed as dist
+
+from Output.writers import NullWriter
+from Output.spectral import pack_spectral
+from Simulation.simulation import Simulation
+from Simulation.checkpoint import save_checkpoint, load_checkpoint
+
+REDUCE_OPS = {'sum': dist.ReduceOp.SUM, 'max': dist.ReduceOp.MAX}
+
+def rank_checkpoint(path, rank):
+    """ Checkpoint file of one process of a distributed run. """
+    root, ext = os.path.splitext(path)
+    return f"{root}_rank{rank:03d}{ext}"
+
+
+class DistributedSimulation(Simulation):
+    """
+    Simulation of the column slab held by this process, with the operators of Distributed.slab
+    (SlabSpectralDerivatives, SlabNonlinearOperator). Every process runs the same time loop on its slab.
+    The initial condition is passed as this process's kx columns (e.g. init_randn with the slab's spectral derivatives).
+    Snapshots are gathered to rank 0 and written by its writer (the writer of the other processes is ignored),
+    and every process checkpoints its own slab to checkpoint_path with a _rankXXX suffix.
+    """
+    def __init__(self, grid, pde_params, spectral_derivative, linear_operator, nonlinear_operator, initial_condition, time_params,
+                 forcing_params, forcing=None, writer=None, checkpoint_path=None, monitors=()):
+        self.decomposition = spectral_derivative.decomposition
+        if not self.decomposition.is_root:
+            writer = NullWriter()
+        super().__init__(grid, pde_params, spectral_derivative, linear_operator, nonlinear_operator, initial_condition, time_params,
+                         forcing_params, forcing, writer, checkpoint_path, monitors)
+        # Every process must take the same snapshot path (gathered physical fields or spectral)
+        spectral = self.decomposition.broadcast(torch.tensor([int(self.writer.spectral)]))
+        if not self.is_root:
+            self.writer.spectral = bool(spectral.item())
+
+    @property
+    def is_root(self):
+        return self.decomposition.is_root
+
+    def physical_initial_condition(self, initial_condition):
+        """Physical q, p, u, v [(N,) 4, ny, Nx] of the rows of this process, from the column slabs of the ICs."""
+        return self.decomposition.irfft2(torch.stack(initial_condition, dim=-3))
+
+    def gather_fields(self, fields):
+        """Full physical fields on rank 0 from the row slabs (None on the other processes)."""
+        return self.decomposition.gather_rows(fields)
+
+    def spectral_initial_condition(self):
+        """Spectral vorticity of this slab; the background flow is broadcast from the kx = 0 column."""
+        fields = self.fields_IC[...,[0,2,3],:,:].to(self.device)
+        fields_h = self.decomposition.rfft2(fields)
+        means = self.decomposition.broadcast(fields_h[...,1:,0,0].clone())
+        return fields_h[...,0,:,:].contiguous(), means[...,0].clone(), means[...,1].clone()
+
+    def snapshot(self, qh):
+        """Snapshot gathered on rank 0 (None on the other processes)."""
+        if self.writer.spectral:
+            qh = self.decomposition.gather_columns(qh)
+            if not self.is_root:
+                return None
+            return pack_spectral(qh, self.u_sol_h_IC, self.v_sol_h_IC, self.spectral_derivative.full_dealias_mask(1/3))
+        return self.gather_fields(self.physical_fields(qh))
+
+    def physical_fields(self, qh):
+        """Physical q, p, u, v of the rows held by this process, stacked as [(N,) 4, ny, Nx]."""
+        sd = self.spectral_derivative
+        ph = -qh*sd.irsq
+        uh = -1j*sd.ky*ph
+        vh = 1j*sd.kr*ph
+        ## Re-set ICs in u and v (background flow)
+        if sd.has_kx0:
+            uh[...,0,0] = self.u_sol_h_IC
+            vh[...,0,0] = self.v_sol_h_IC
+        return self.decomposition.irfft2(torch.stack([qh, ph, uh, vh], dim=-3))
+
+    def all_reduce(self, x, op='sum'):
+        return self.decomposition.all_reduce(x, REDUCE_OPS[op])
+
+    def state_dict(self):
+        return {**super().state_dict(), 'rank': self.decomposition.rank, 'size': self.decomposition.size}
+
+    def load_state_dict(self, state):
+        if (state['rank'], state['size']) != (self.decomposition.rank, self.decomposition.size):
+            raise ValueError("Checkpoint was written by a different number of processes.")
+        super().load_state_dict(state)
+        # All processes must restart from the same step
+        steps = self.all_reduce(torch.tensor([self.it_count, -self.it_count]), 'max')
+        if steps[0] != -steps[1]:
+            raise ValueError("Checkpoints of the processes are from different steps.")
+
+    def save_checkpoint(self, path):
+        """Every process writes its slab (rank 0 flushes the snapshots first)."""
+        self.writer.flush()
+        save_checkpoint(self.state_dict(), rank_checkpoint(path, self.decomposition.rank))
+        dist.barrier(group=self.decomposition.group)
+
+    def load_checkpoint(self, path):
+        self.load_state_dict(load_checkpoint(rank_checkpoint(path, self.decomposition.rank), self.device))
@@ -0,0 +1,178 @@
+import math
+import torch
+import torch.distributed as dist
+
+from Operators.operators import SpectralDerivatives, NonlinearOperator
+from Distributed import distributed_launch
+
+### Slab decomposition over processes (torch.distributed, gloo backend)
+# Physical fields are split into slabs of rows: process r holds y rows [r*ny, (r+1)*ny), all x.
+# Spectral fields are split into slabs of kx columns: process r holds kx columns [r*nk, (r+1)*nk), all ky.
+# The 2D rfft is a local rfft along x, an all-to-all transpose and a local fft along y (and the
+# reverse for the inverse). The Nx//2+1 columns are padded with always-zero (dealiased) columns
+# to a multiple of the number of processes.
+
+def init_distributed(backend='gloo'):
+    """ Joins the process group described by the launcher environment (RANK, WORLD_SIZE, MASTER_ADDR, ...). """
+    if not dist.is_initialized():
+        dist.init_process_group(backend)
+    return dist.get_rank(), dist.get_world_size()
+
+
+class SlabDecomposition:
+    """
+    Row/column slabs of an Nx x Ny grid over the processes of group, and the collective
+    operations between them: distributed rfft2/irfft2, gathers to rank 0, reductions.
+    """
+    def __init__(self, grid, group=None):
+        self.group = group
+        self.rank = dist.get_rank(group)
+        self.size = dist.get_world_size(group)
+        if grid.Ny % self.size != 0:
+            raise ValueError(f"Ny={grid.Ny} is not divisible by the number of processes ({self.size}).")
+        self.Nx, self.Ny = grid.Nx, grid.Ny
+        self.dk = grid.Nx//2 + 1
+        self.ny = grid.Ny // self.size # Rows per process
+        self.nk = math.ceil(self.dk / self.size) # kx columns per process (padded)
+        self.rows = slice(self.rank*self.ny, (self.rank+1)*self.ny)
+        self.columns = slice(self.rank*self.nk, (self.rank+1)*self.nk)
+
+    @property
+    def is_root(self):
+        return self.rank == 0
+
+    def local_rows(self, x):
+        """ Rows of a full physical array [..., Ny, Nx] held by this process. """
+        return x[..., self.rows, :]
+
+    def local_columns(self, x, fill=0):
+        """ kx columns of a full spectral array [..., Nx//2+1] held by this process (padding columns are fill). """
+        pad = self.nk*self.size - x.shape[-1]
+        if pad:
+            x = torch.cat([x, torch.full(x.shape[:-1] + (pad,), fill, dtype=x.dtype, device=x.device)], dim=-1)
+        return x[..., self.columns]
+
+    def _all_to_all(self, chunks, dim):
+        """ Sends chunks[j] to process j and concatenates the chunks received from all processes along dim. """
+        send = [torch.view_as_real(c.contiguous()) for c in chunks]
+        recv = [torch.empty_like(send[0]) for _ in range(self.size)]
+        dist.all_to_all(recv, send, group=self.group)
+        return torch.view_as_complex(torch.cat(recv, dim=dim - 1 if dim < 0 else dim))
+
+    def rfft2(self, x):
+        """ Distributed rfftn (norm='forward') of row slabs [..., ny, Nx] into column slabs [..., Ny, nk]. """
+        xh = torch.fft.rfft(x, dim=-1, norm='forward')
+        pad = self.nk*self.size - self.dk
+        if pad:
+            xh = torch.nn.functional.pad(xh, (0, pad))
+        xh = self._all_to_all(xh.split(self.nk, dim=-1), dim=-2)
+        return torch.fft.fft(xh, dim=-2, norm='forward')
+
+    def irfft2(self, xh):
+        """ Distributed irfftn (norm='forward') of column slabs [..., Ny, nk] into row slabs [..., ny, Nx]. """
+        x = torch.fft.ifft(xh, dim=-2, norm='forward')
+        x = self._all_to_all(x.split(self.ny, dim=-2), dim=-1)
+        return torch.fft.irfft(x[..., :self.dk], n=self.Nx, dim=-1, norm='forward')
+
+    def _gather(self, x, dim):
+        x = x.contiguous()
+        complex_input = x.is_complex()
+        if complex_input:
+            x = torch.view_as_real(x)
+            dim = dim - 1 if dim < 0 else dim
+        parts = [torch.empty_like(x) for _ in range(self.size)] if self.is_root else None
+        dist.gather(x, parts, dst=0, group=self.group)
+        if not self.is_root:
+            return None
+        full = torch.cat(parts, dim=dim)
+        return torch.view_as_complex(full) if complex_input else full
+
+    def gather_rows(self, x):
+        """ Full physical array [..., Ny, Nx] on rank 0 from the row slabs (None on other ranks). """
+        return self._gather(x, -2)
+
+    def gather_columns(self, xh):
+        """ Full spectral array [..., Ny, Nx//2+1] on rank 0 from the column slabs (None on other ranks). """
+        full = self._gather(xh, -1)
+        return full[..., :self.dk] if full is not None else None
+
+    def broadcast(self, x, src=0):
+        """ Broadcasts x (in place) from process src. """
+        dist.broadcast(torch.view_as_real(x) if x.is_complex() else x, src, group=self.group)
+        return x
+
+    def all_reduce(self, x, op=dist.ReduceOp.SUM):
+        dist.all_reduce(x, op, group=self.group)
+        return x
+
+    def __repr__(self):
+        return f"SlabDecomposition(rank={self.rank}, size={self.size}, rows={self.ny}, columns={self.nk})"
+
+
+class SlabSpectralDerivatives(SpectralDerivatives):
+    """
+    Spectral derivatives of the kx columns held by this process. Only the local columns of the
+    wavenumbers, dealias masks and spectrum shells are built (from the 1D wavenumbers of the full
+    grid), so they match the serial ones and the memory per process scales with the slab.
+    """
+    def __init__(self, grid, decomposition):
+        self.decomposition = decomposition
+        super().__init__(grid)
+        self._full_masks = {}
+
+    def local_wavenumbers(self, kr):
+        # Padding columns continue the kx sequence (nonzero k, so irsq stays finite, and always dealiased)
+        d = self.decomposition
+        self.kr_full = kr
+        pad = d.nk*d.size - self.dk
+        if pad:
+            kr = torch.cat([kr, kr[:, -1:] + (kr[:, 1:2] - kr[:, :1])*torch.arange(1, pad+1, dtype=kr.dtype, device=kr.device)], dim=-1)
+        return kr[:, d.columns]
+
+    def local_columns(self, x):
+        return self.decomposition.local_columns(x)
+
+    def full_dealias_mask(self, dealias_factor=1/3):
+        """ Dealias mask of the full grid (for the snapshots gathered on rank 0). """
+        if dealias_factor not in self._full_masks:
+            kcut = math.sqrt(2) * (1 - dealias_factor) * min(self.ky.max(), self.kr_max)
+            self._full_masks[dealias_factor] = torch.sqrt(self.kr_full**2 + self.ky**2) > kcut
+        return self._full_masks[dealias_factor]
+
+    def shell_index(self):
+        """ Shells of the local columns (padding columns are in no shell); counts are those of the full grid. """
+        if self._shells is None:
+            k, shell, _ = super().shell_index()
+            # Modes per shell over the full grid, a slab of rows at a time
+            counts = torch.zeros(len(k)+1, dtype=torch.long, device=self.device)
+            for rows in self.ky.split(self.decomposition.ny):
+                counts += torch.bincount(self.shells(torch.sqrt(self.kr_full**2 + rows**2), len(k)).flatten(), minlength=len(k)+1)
+            self._shells = (k, shell, counts[1:])
+        return self._shells
+
+    def __repr__(self):
+        return (f"SlabSpectralDerivatives(Nx={self.grid.Nx}, Ny={self.grid.Ny}, columns={self.decomposition.columns.start}:"
+                f"{self.decomposition.columns.stop}, device={self.device})")
+
+
+class SlabNonlinearOperator(NonlinearOperator):
+    """ NonlinearOperator on column slabs: the transforms of jacobian are distributed. """
+    def __init__(self, spectral_derivative, params):
+        super().__init__(spectral_derivative, params)
+        self.decomposition = spectral_derivative.decomposition
+
+    def physical_shape(self, qh):
+        return qh.shape[:-2] + (self.decomposition.ny, self.decomposition.Nx)
+
+    def _to_physical(self, xh, out):
+        return out.copy_(self.decomposition.irfft2(xh))
+
+    def _to_spectral(self, x, out):
+        return out.copy_(self.decomposition.rfft2(x))
+
+    def jacobian(self, qh, u_mean, v_mean, out):
+        out = super().jacobian(qh, u_mean, v_mean, out)
+        if self.track_velocity:
+            # Maxima over all processes, so every process sees the same CFL number
+            self.decomposition.all_reduce(self.max_velocity, dist.ReduceOp.MAX)
+        return out
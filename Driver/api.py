@@ -0,0 +1,255 @@
+import os
+import datetime
+
+### Programmatic entry point of the solver
+# run_simulation(config) runs one configuration in-process; Driver/driver_qg.py is a thin CLI around it.
+# Only torch and the solver packages are imported up front: plotting (matplotlib), HDF5 and the
+# distributed backend are imported when their stage is requested.
+
+
+def _log_stage(log, message):
+    log(message)
+    log(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def _health_monitors(watchdog_params, steady_tol=0, steady_window=32, steady_start=0.0):
+    """ Blow-up watchdog and steady-state stop of a run (see Simulation.watchdog). """
+    from Simulation.watchdog import Watchdog, SteadyState
+    interval = getattr(watchdog_params, 'interval', 64)
+    monitors = []
+    if interval:
+        monitors.append(Watchdog(interval, getattr(watchdog_params, 'max_growth', 10.0), getattr(watchdog_params, 'max_cfl', 'auto')))
+    if interval and steady_tol:
+        monitors.append(SteadyState(interval, steady_window, steady_tol, steady_start))
+    return monitors
+
+
+def run_simulation(config, run_number=None, device=None, num_threads=None, resume=None, fork_from=None, perturb=None,
+                   writer=None, monitors=(), operators=None, save=True, plots=True, log=print):
+    """
+    Runs the simulation of a config (a config module such as Config.Run02721, or its params class) and
+    returns (simulation, solution_field), solution_field being the snapshots (writer.result(); None on the
+    processes of a distributed run other than rank 0).
+
+    run_number: overrides params.run_number (results go to Utils.utils.results_dir(run_number)).
+    device, num_threads: override the grid config.
+    resume: checkpoint to continue from ('latest' is the run's own checkpoint).
+    fork_from, perturb: start from the state in another checkpoint, optionally perturbed with this energy.
+    writer: snapshot writer (default: output_params.format); results can be streamed to any SnapshotWriter.
+    monitors: extra Simulation monitors (called every monitor.interval steps, e.g. to stream diagnostics).
+    operators: prebuilt (grid, spectral_derivative) of the config's grid, shared between runs (see Sweep.sweep).
+    save: save in-memory snapshots and a copy of the code; plots: render the plots of output_params.plots.
+    """
+    import torch
+    from Utils.device import configure_device, default_num_threads
+    from Utils.utils import results_dir
+
+    params = getattr(config, 'params', config)
+    run_number = params.run_number if run_number is None else run_number
+    grid_params = params.grid
+
+    ## Distributed run (launched with torchrun --nproc_per_node P): the grid is split into slabs over P CPU processes
+    # (Distributed.slab and the process group are only imported by distributed runs)
+    from Distributed import distributed_launch
+    distributed = distributed_launch()
+    rank = 0
+    if distributed:
+        from Distributed.slab import init_distributed, SlabDecomposition, SlabSpectralDerivatives, SlabNonlinearOperator
+        from Distributed.simulation import DistributedSimulation
+        rank, world_size = init_distributed('gloo')
+        log(f"Process {rank} of {world_size}")
+        if fork_from:
+            raise ValueError("--fork_from is not supported in distributed runs.")
+
+    ## Set-up device (arguments take precedence over the config file)
+    if distributed:
+        # gloo runs on the CPU; the cores are shared by the processes on a node
+        device = configure_device('cpu', num_threads or getattr(grid_params, 'num_threads', None) or
+                                  max(1, default_num_threads() // int(os.environ.get('LOCAL_WORLD_SIZE', 1))))
+    elif operators is None:
+        device = configure_device(device or getattr(grid_params, 'device', None),
+                                  num_threads or getattr(grid_params, 'num_threads', None))
+
+    ## Set-up grid, spectral derivatives and operators
+    # (the precision policy, float32 or float64, is followed by the operators, ICs, forcing and solver state)
+    from Grid.grid import Grid
+    from Operators.operators import SpectralDerivatives, LinearOperator, NonlinearOperator
+    if operators is not None:
+        grid, spectral_derivative = operators
+    else:
+        grid = Grid(grid_params.Lx, grid_params.Ly, grid_params.Nx, grid_params.Ny, device,
+                    getattr(grid_params, 'precision', 'float32'))
+        spectral_derivative = SlabSpectralDerivatives(grid, SlabDecomposition(grid)) if distributed else SpectralDerivatives(grid)
+    log(f"Running on {grid.device} with {torch.get_num_threads()} intra-op threads")
+    nonlinear_operator = (SlabNonlinearOperator if distributed else NonlinearOperator)(spectral_derivative, params.pde)
+    linear_operator = LinearOperator(spectral_derivative, params.pde)
+    _log_stage(log, "Successfully loaded derivatives and operators")
+
+    ## Set-up initial conditions
+    t_start = 0.0
+    if fork_from:
+        log(f"Forking initial conditions from {fork_from}")
+        from Simulation.checkpoint import load_checkpoint, fork_initial_condition
+        perturbation = (perturb, params.ic.wavenumbers) if perturb else None
+        initial_condition, t_start = fork_initial_condition(load_checkpoint(fork_from, grid.device), grid,
+                                                            spectral_derivative, perturbation, params.ic.seed)
+    elif getattr(params.ic, 'option', 1) == 1:
+        log(f"Using wavenumber ICs")
+        from Initial_forcing.ics import init_randn
+        # A list of seeds runs an ensemble (one member per seed) in a single batched simulation
+        # (in distributed runs every process draws its kx columns of the same field)
+        initial_condition = init_randn(params.ic.energy, params.ic.wavenumbers, grid, spectral_derivative, params.ic.seed)
+    else:
+        raise ValueError("Invalid IC option. Check config.")
+    _log_stage(log, "Successfully created initial conditions")
+
+    ## FFT backend of the spectral transforms (torch, scipy, numpy, or auto: timed once per case and cached)
+    from Operators.fft import set_backend, autotune
+    fft = getattr(grid_params, 'fft', 'torch')
+    if fft == 'auto':
+        # (the slab transforms of distributed runs always use torch)
+        batch = initial_condition[0].shape[0] if initial_condition[0].dim() == 3 else 1
+        fft = 'torch' if distributed else autotune(grid, batch, torch.get_num_threads(), log=log)
+    log(f"FFT backend: {set_backend(fft, getattr(grid_params, 'fft_workers', None))}")
+
+    ## Multi-resolution spin-up: the ICs are integrated on a coarse grid first and continued on this grid
+    spinup_params = getattr(params, 'spinup', None)
+    spinup_state = None
+    if getattr(spinup_params, 'T', 0) and not (resume or fork_from):
+        if distributed:
+            raise ValueError("Spin-up is not supported in distributed runs.")
+        from Simulation.spinup import spin_up, continue_from
+        from Simulation.profiling import Progress
+        log(f"Spinning up on a {spinup_params.Nx}x{spinup_params.Ny} grid for T = {spinup_params.T}")
+        progress_int = getattr(getattr(params, 'profiling', None), 'progress_int', 1024)
+        # (the spin-up ends early once it is statistically stationary with spinup_params.steady_tol)
+        spinup_monitors = _health_monitors(getattr(params, 'watchdog', None), getattr(spinup_params, 'steady_tol', 0),
+                                           getattr(spinup_params, 'steady_window', 32))
+        state = spin_up(spinup_params, grid, params.pde, params.ic, params.time, params.forcing,
+                        os.path.join(results_dir(run_number), f'spinup_Run{run_number:05d}.pt'),
+                        spinup_monitors + ([Progress(progress_int, log=log)] if progress_int else []))
+        initial_condition, t_start, spinup_state = continue_from(state, grid, spectral_derivative)
+        _log_stage(log, f"Spin-up completed at t = {t_start}")
+
+    ## Set-up forcing (options are registered in Initial_forcing.forcing.FORCINGS)
+    from Initial_forcing.forcing import make_forcing
+    forcing = make_forcing(params.forcing)
+    forcing_params = params.forcing if forcing is not None else None
+    if forcing is not None:
+        log(f"Using {type(forcing).__name__}")
+
+    ## Set-up snapshot output (streamed to disk unless output format is 'memory')
+    from Output.writers import make_writer
+    output_params = getattr(params, 'output', None)
+    stream_output = getattr(output_params, 'format', 'memory') != 'memory'
+    n_members = initial_condition[0].shape[0] if initial_condition[0].dim() == 3 else None
+    if n_members:
+        log(f"Running an ensemble of {n_members} members")
+    steps = int(params.time.T / params.time.dt)
+    # (only rank 0 writes snapshots in distributed runs; a writer passed in keeps the snapshots itself)
+    own_writer = writer is None
+    if own_writer and rank == 0:
+        writer = make_writer(output_params, results_dir(run_number), run_number, grid,
+                             int(steps/params.time.save_int)+1, n_members)
+    log(f"Snapshot output: {writer}")
+
+    ## Set-up in-loop monitors
+    monitors = list(monitors)
+    # Abort a diverging run, optionally stop once it is statistically stationary
+    watchdog_params = getattr(params, 'watchdog', None)
+    health = _health_monitors(watchdog_params, getattr(watchdog_params, 'steady_tol', 0),
+                              getattr(watchdog_params, 'steady_window', 32), getattr(watchdog_params, 'steady_start', 0.0))
+    if health:
+        monitors += health
+        log(f"Health checks: {health}")
+    diagnostics_params = getattr(params, 'diagnostics', None)
+    if getattr(diagnostics_params, 'interval', 0):
+        from Simulation.diagnostics import Diagnostics
+        monitors.append(Diagnostics(os.path.join(results_dir(run_number), f'diagnostics_Run{run_number:05d}.csv'),
+                                    diagnostics_params.interval, getattr(diagnostics_params, 'spectra', False)))
+        log(f"Diagnostics: {monitors[-1]}")
+
+    observation_params = getattr(params, 'observations', None)
+    if getattr(observation_params, 'interval', 0):
+        from Simulation.observations import Observations
+        from Operators.observation import random_points
+        points = getattr(observation_params, 'points', 1024)
+        if isinstance(points, int):
+            points = random_points(points, grid, getattr(observation_params, 'seed', 0))
+        elif isinstance(points, str):
+            import numpy as np
+            points = np.load(points)
+        monitors.append(Observations(os.path.join(results_dir(run_number), f'observations_Run{run_number:05d}.npy'), points,
+                                     observation_params.interval, getattr(observation_params, 'fields', ('q', 'u', 'v')),
+                                     getattr(observation_params, 'method', 'auto'), getattr(observation_params, 'order', 'cubic'),
+                                     getattr(output_params, 'dtype', 'float32')))
+        log(f"Observations: {monitors[-1]}")
+
+    statistics_params = getattr(params, 'statistics', None)
+    if getattr(statistics_params, 'interval', 0):
+        from Simulation.statistics import Statistics
+        monitors.append(Statistics(os.path.join(results_dir(run_number), f'statistics_Run{run_number:05d}.npz'),
+                                   statistics_params.interval, getattr(statistics_params, 'start', 0.0),
+                                   getattr(statistics_params, 'end', None), getattr(statistics_params, 'spectra', True)))
+        log(f"Statistics: {monitors[-1]}")
+
+    profiling_params = getattr(params, 'profiling', None)
+    if getattr(profiling_params, 'progress_int', 1024):
+        from Simulation.profiling import Progress
+        monitors.append(Progress(getattr(profiling_params, 'progress_int', 1024), getattr(profiling_params, 'timers', False), log))
+    if getattr(profiling_params, 'trace_steps', None):
+        from Simulation.profiling import TraceWindow
+        monitors.append(TraceWindow(*profiling_params.trace_steps, os.path.join(results_dir(run_number), f'trace_Run{run_number:05d}.json')))
+        log(f"Profiling: {monitors[-1]}")
+
+    ## Run simulation
+    _log_stage(log, "Simulation started")
+    from Simulation.simulation import Simulation
+    checkpoint_file = os.path.join(results_dir(run_number), f'checkpoint_Run{run_number:05d}.pt')
+    simulation_class = DistributedSimulation if distributed else Simulation
+    simulation = simulation_class(grid, params.pde, spectral_derivative, linear_operator, nonlinear_operator, initial_condition,
+                                  params.time, forcing_params, forcing, writer, checkpoint_file, monitors)
+    simulation.t0 = t_start
+    if spinup_state is not None:
+        # Keep the integrator (AB2) history of the coarse run
+        from Simulation.spinup import load_history
+        load_history(simulation, spinup_state)
+
+    ## Resume from checkpoint
+    if resume:
+        resume_file = checkpoint_file if resume == 'latest' else resume
+        simulation.load_checkpoint(resume_file)
+        log(f"Resuming from {resume_file} at step {simulation.it_count}")
+
+    solution_field = simulation.run()
+    if simulation.stop_reason is not None:
+        log(f"Stopped at step {simulation.it_count} (t = {simulation.time:.6g}): {simulation.stop_reason}")
+    _log_stage(log, "Simulation completed successfully")
+    if rank != 0:
+        return simulation, None
+
+    ## Save numpy files
+    members = range(n_members) if n_members else [None]
+    if save:
+        from Utils.utils import save_file
+        for member in members:
+            save_file(grid, spectral_derivative, solution_field if member is None else solution_field[member], run_number,
+                      params.time, save_fields=own_writer and not stream_output, member=member, plots=False)
+        _log_stage(log, "Simulation np & pt files saved successfully")
+
+    ## Render vorticity and spectrum plots in parallel from the saved snapshots
+    plot_kind = getattr(output_params, 'plots', 'png')
+    if plots and plot_kind != 'none' and own_writer and (stream_output or save):
+        from Plotting.render import render_snapshots, write_animation
+        from Output.writers import snapshot_file
+        for member in members:
+            out_dir = results_dir(run_number, member)
+            snapshot_path = snapshot_file(out_dir, run_number, getattr(output_params, 'format', 'memory'))
+            if plot_kind in ('png', 'both'):
+                render_snapshots(snapshot_path, grid, params.time, out_dir, run_number,
+                                 workers=getattr(output_params, 'plot_workers', None))
+            if plot_kind in ('animation', 'both'):
+                write_animation(snapshot_path, grid, params.time, os.path.join(out_dir, f'vorticity_Run{run_number:05d}.mp4'))
+        _log_stage(log, "Simulation plots saved successfully")
+
+    return simulation, solution_field
@@ -1,21 +1,28 @@
 import torch
 import math
 import numpy as np
+from Utils.device import resolve_device
 
+### Precision policy: real and complex dtypes of every grid, operator and solver tensor
+PRECISIONS = {'float32': (torch.float32, torch.complex64), 'float64': (torch.float64, torch.complex128)}
 
 class Grid:
-    def __init__(self, Lx=2*math.pi, Ly=2*math.pi, Nx=512, Ny=512, device='cuda'):
+    def __init__(self, Lx=2*math.pi, Ly=2*math.pi, Nx=512, Ny=512, device=None, precision='float32'):
         self.Lx = Lx
         self.Ly = Ly
         self.Nx = Nx
         self.Ny = Ny
-        self.device = device
+        self.device = resolve_device(device) # cuda if available, unless set explicitly
+        if precision not in PRECISIONS:
+            raise ValueError("Invalid precision. Check config.")
+        self.precision = precision # float32 (complex64 spectra) or float64 (complex128 spectra)
+        self.dtype, self.complex_dtype = PRECISIONS[precision]
 
         self.size=self.Nx*self.Ny
         self.dx = self.Lx / self.Nx
         self.dy = self.Ly / self.Ny
-        self.x = torch.arange(-self.Lx/2, self.Lx/2, self.dx, device=self.device)
-        self.y = torch.arange(-self.Ly/2, self.Ly/2, self.dy, device=self.device)
+        self.x = torch.arange(-self.Lx/2, self.Lx/2, self.dx, dtype=self.dtype, device=self.device)
+        self.y = torch.arange(-self.Ly/2, self.Ly/2, self.dy, dtype=self.dtype, device=self.device)
         
     def to(self, device):
         """ Move grid tensors to another device. """
@@ -26,4 +33,4 @@ class Grid:
     def __repr__(self):
         # print(grid)
         return (f"Grid(Lx={self.Lx}, Ly={self.Ly}, Nx={self.Nx}, Ny={self.Ny}, "
-                f"dx={self.dx:.4f}, dy={self.dy:.4f}, device={self.device})")
\ No newline at end of file
+                f"dx={self.dx:.4f}, dy={self.dy:.4f}, precision={self.precision}, device={self.device})")
\ No newline at end of file
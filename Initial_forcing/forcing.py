@@ -1,5 +1,6 @@
 import torch
 import numpy as np
+import math
 from Operators.spectral_conversion import to_physical, to_spectral, dealias
 
 def cos_forcing(grid,spectral_derivative,forcing_params,t):
@@ -9,8 +10,8 @@ def cos_forcing(grid,spectral_derivative,forcing_params,t):
     """
 
     # Create a grid of coordinates (x, y)
-    x = torch.linspace(0, grid.Lx, grid.Nx,device=grid.device)
-    y = torch.linspace(0, grid.Ly, grid.Ny,device=grid.device)
+    x = torch.linspace(0, grid.Lx, grid.Nx,dtype=grid.dtype,device=grid.device)
+    y = torch.linspace(0, grid.Ly, grid.Ny,dtype=grid.dtype,device=grid.device)
 
     # Create meshgrid for x, y
     X, Y = x[None,:],y[:,None]
@@ -20,3 +21,105 @@ def cos_forcing(grid,spectral_derivative,forcing_params,t):
     wh = to_spectral(w)
     
     return dealias(wh,spectral_derivative,1/3)
+
+
+### Forcing registry
+# forcing_params.option selects the forcing class. Each run gets its own instance,
+# which precomputes what it can on the first call and caches steady forcing.
+FORCINGS = {}
+
+def register_forcing(option):
+    """Class decorator registering a Forcing subclass under a config option number."""
+    def register(cls):
+        FORCINGS[option] = cls
+        return cls
+    return register
+
+def make_forcing(forcing_params):
+    """Forcing selected by forcing_params.option (None for option 0, i.e. no forcing)."""
+    option = getattr(forcing_params, 'option', 0) if forcing_params is not None else 0
+    if option == 0:
+        return None
+    if option not in FORCINGS:
+        raise ValueError("Invalid forcing option. Check config.")
+    return FORCINGS[option]()
+
+
+class Forcing:
+    """
+    Base class for forcings. Called like cos_forcing, (grid, spectral_derivative, forcing_params, t),
+    and returns the dealiased forcing in spectral space.
+    Subclasses implement build (one-time precomputation), evaluate and is_steady.
+    Steady forcing is evaluated once and the same tensor is returned on every call.
+    Time-dependent results alternate between two buffers, so the previous result stays valid
+    (the AB2 history) until the next call overwrites the one before it.
+    """
+    def __init__(self):
+        self.spectral_derivative = None
+        self.steady_forcing = None
+
+    def build(self, grid, spectral_derivative, forcing_params):
+        pass
+
+    def is_steady(self, forcing_params):
+        return False
+
+    def evaluate(self, t):
+        raise NotImplementedError
+
+    def __call__(self, grid, spectral_derivative, forcing_params, t):
+        if spectral_derivative is not self.spectral_derivative:
+            self.build(grid, spectral_derivative, forcing_params)
+            self.spectral_derivative = spectral_derivative
+            self.forcing_params = forcing_params
+            self.steady_forcing = None
+        if self.is_steady(forcing_params):
+            if self.steady_forcing is None:
+                self.steady_forcing = self.evaluate(t).clone()
+            return self.steady_forcing
+        return self.evaluate(t)
+
+
+@register_forcing(1)
+class CosForcing(Forcing):
+    """
+    F = A cos (B x + C t) + D cos(E y + F t), on the same coordinates as cos_forcing.
+    The x-term only has modes in the ky = 0 row and the y-term only in the kx = 0 column, so with
+    cos(B x + C t) = cos(C t) cos(B x) - sin(C t) sin(B x) the forcing at any time is a
+    combination of four precomputed 1D spectra.
+    """
+    def build(self, grid, spectral_derivative, forcing_params):
+        p = forcing_params
+        # (in the grid precision, so the forcing spectra match the dtype of the solver state)
+        x = torch.linspace(0, grid.Lx, grid.Nx, dtype=grid.dtype, device=grid.device)
+        y = torch.linspace(0, grid.Ly, grid.Ny, dtype=grid.dtype, device=grid.device)
+        mask = spectral_derivative.dealias_mask(1/3)
+
+        # ky = 0 row of the 2D transform of a field that only depends on x (and kx = 0 column for y)
+        # (only the kx columns held by this process, see SpectralDerivatives.local_columns)
+        rfft_x = lambda f: spectral_derivative.local_columns(torch.fft.rfft(f, norm='forward')).masked_fill_(mask[0, :], 0)
+        self.cos_x = rfft_x(torch.cos(p.B*x))
+        self.sin_x = rfft_x(torch.sin(p.B*x))
+        self.cos_y = torch.fft.fft(torch.cos(p.E*y), norm='forward').masked_fill_(mask[:, 0], 0)
+        self.sin_y = torch.fft.fft(torch.sin(p.E*y), norm='forward').masked_fill_(mask[:, 0], 0)
+        self.has_kx0 = spectral_derivative.has_kx0
+
+        shape = mask.shape
+        self.buffers = [torch.zeros(shape, dtype=self.cos_x.dtype, device=grid.device) for _ in range(2)]
+        self.calls = 0
+
+    def is_steady(self, forcing_params):
+        return getattr(forcing_params, 'C', 0) == 0 and getattr(forcing_params, 'F', 0) == 0
+
+    def evaluate(self, t):
+        p = self.forcing_params
+        out = self.buffers[self.calls % 2]
+        self.calls += 1
+
+        row = p.A*math.cos(p.C*t)*self.cos_x - p.A*math.sin(p.C*t)*self.sin_x
+        col = p.D*math.cos(p.F*t)*self.cos_y - p.D*math.sin(p.F*t)*self.sin_y
+        out[0, :] = row
+        if self.has_kx0:
+            out[:, 0] = col
+            out[0, 0] = row[0] + col[0]
+        return out
@@ -6,10 +6,32 @@ def int_sq(y, grid):
     n = grid.Lx * grid.Ly  # Use grid object for Lx and Ly
     return Y * n
 
+def random_columns(spectral_derivative, block=8):
+    """
+    The kx columns held by this process of torch.randn([Ny, Nx//2+1], dtype=complex128), without drawing the
+    full array: rows are drawn a block at a time (CPU normals are generated in groups of 16 reals, so blocks
+    of 8 complex rows continue the random stream exactly like the single draw; a last block of fewer than
+    16 reals would not, and joins the previous one).
+    """
+    Ny, dk = spectral_derivative.grid.Ny, spectral_derivative.dk
+    starts = list(range(0, Ny, block))
+    if len(starts) > 1 and (Ny - starts[-1])*dk < 8:
+        starts.pop()
+    return torch.cat([spectral_derivative.local_columns(torch.randn(stop - start, dk, dtype=torch.complex128))
+                      for start, stop in zip(starts, starts[1:] + [Ny])])
+
+
 def init_randn(energy, wavenumbers, grid, spectral_derivative, seed=86):
     """
-    Generates initial conditions based on specified energy and wavenumber limits
+    Generates initial conditions based on specified energy and wavenumber limits.
+    A list of seeds gives an ensemble: each field gets a leading member dimension,
+    and member m is identical to the single run with seed[m].
+    The field is drawn and normalized in double precision (the same field for a seed in every
+    precision) and returned in the complex dtype of the grid precision.
     """
+    if isinstance(seed, (list, tuple)):
+        members = [init_randn(energy, wavenumbers, grid, spectral_derivative, s) for s in seed]
+        return tuple(torch.stack(fields) for fields in zip(*members))
     
     torch.manual_seed(seed)
     
@@ -18,7 +40,12 @@ def init_randn(energy, wavenumbers, grid, spectral_derivative, seed=86):
     k = spectral_derivative.kr.repeat(grid.Ny, 1)  # Ensure proper shape for k
 
     # Generate random complex field in spectral space
-    qih = torch.randn(spectral_derivative.krsq.size(), dtype=torch.complex128).to(grid.device)
+    # (a process of a distributed run only keeps its kx columns of the same field, see Distributed.slab)
+    distributed = hasattr(spectral_derivative, 'decomposition')
+    if distributed:
+        qih = random_columns(spectral_derivative).to(grid.device)
+    else:
+        qih = torch.randn(spectral_derivative.krsq.size(), dtype=torch.complex128).to(grid.device)
     
     # Apply wavenumber filters
     qih[K < wavenumbers[0]] = 0.0
@@ -27,8 +54,17 @@ def init_randn(energy, wavenumbers, grid, spectral_derivative, seed=86):
     
     # Normalize initial condition energy
     E0 = energy
-    Ei = 0.5 * (int_sq(spectral_derivative.kr * spectral_derivative.irsq * qih, grid) +
-                int_sq(spectral_derivative.ky * spectral_derivative.irsq * qih, grid)) / (grid.Lx * grid.Ly)
+    if distributed:
+        # Sums over the columns of all processes (padding columns have weight 0)
+        weights = torch.full((1, spectral_derivative.dk), 2.0, dtype=torch.float64, device=grid.device)
+        weights[0, 0] = 1.0
+        weights = spectral_derivative.local_columns(weights)
+        Ei = (weights * (torch.abs(spectral_derivative.kr * spectral_derivative.irsq * qih)**2 +
+                         torch.abs(spectral_derivative.ky * spectral_derivative.irsq * qih)**2)).sum()
+        Ei = 0.5 * spectral_derivative.decomposition.all_reduce(Ei)
+    else:
+        Ei = 0.5 * (int_sq(spectral_derivative.kr * spectral_derivative.irsq * qih, grid) +
+                    int_sq(spectral_derivative.ky * spectral_derivative.irsq * qih, grid)) / (grid.Lx * grid.Ly)
     
     # Scale to the desired energy
     qih *= torch.sqrt(E0 / Ei)
@@ -37,4 +73,4 @@ def init_randn(energy, wavenumbers, grid, spectral_derivative, seed=86):
     uih =  -1j*spectral_derivative.ky*pih # u velocity (- d psi/ dy)
     vih = 1j*spectral_derivative.kr*pih  # v velocity (d psi/ dx)
     
-    return qih,pih,uih,vih
\ No newline at end of file
+    return tuple(f.to(grid.complex_dtype) for f in (qih,pih,uih,vih))
\ No newline at end of file
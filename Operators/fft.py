@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import inspect
+import platform
+import numpy as np
+import torch
+
+### FFT backends of the spectral transforms
+# to_physical/to_spectral (Operators.spectral_conversion) and the fused Jacobian (NonlinearOperator)
+# transform the last two dimensions with the active backend (norm='forward', leading dimensions batched):
+#   torch: torch.fft (any device), scipy: scipy.fft with `workers` threads, numpy: numpy.fft.
+# CPU tensors are handed to scipy and numpy as zero-copy arrays (Tensor.numpy()) and their results are
+# wrapped back with torch.from_numpy; tensors on other devices always use torch.fft.
+# The backend is set from the config (grid_params.fft); 'auto' times every backend on the run's grid,
+# batch size and thread count once and caches the fastest on disk (see autotune).
+
+BACKENDS = ('torch', 'scipy', 'numpy')
+
+
+def _array(x):
+    """ Zero-copy NumPy view of a CPU tensor (conjugate/negative views are resolved first). """
+    return x.detach().resolve_conj().resolve_neg().numpy()
+
+def _result(array, dtype, out):
+    """ Tensor of a NumPy result in dtype, copied into out if given. """
+    result = torch.from_numpy(array).to(dtype)
+    if out is None:
+        return result
+    return out.copy_(result)
+
+
+class TorchFFT:
+    name = 'torch'
+
+    def irfft2(self, xh, out=None):
+        return torch.fft.irfftn(xh, dim=(-2,-1), norm='forward', out=out)
+
+    def rfft2(self, x, out=None):
+        return torch.fft.rfftn(x, dim=(-2,-1), norm='forward', out=out)
+
+    def __repr__(self):
+        return "TorchFFT()"
+
+_TORCH = TorchFFT()
+
+
+class ScipyFFT:
+    """ scipy.fft with workers threads (default: torch's intra-op thread count). """
+    name = 'scipy'
+
+    def __init__(self, workers=None):
+        import scipy.fft
+        self.fft = scipy.fft
+        self.workers = workers
+
+    def irfft2(self, xh, out=None):
+        if xh.device.type != 'cpu':
+            return _TORCH.irfft2(xh, out)
+        result = self.fft.irfftn(_array(xh), axes=(-2,-1), norm='forward', workers=self.workers or torch.get_num_threads())
+        return _result(result, xh.real.dtype, out)
+
+    def rfft2(self, x, out=None):
+        if x.device.type != 'cpu':
+            return _TORCH.rfft2(x, out)
+        result = self.fft.rfftn(_array(x), axes=(-2,-1), norm='forward', workers=self.workers or torch.get_num_threads())
+        return _result(result, torch.complex128 if x.dtype == torch.float64 else torch.complex64, out)
+
+    def __repr__(self):
+        return f"ScipyFFT(workers={self.workers or torch.get_num_threads()})"
+
+
+class NumpyFFT:
+    """ numpy.fft (single-threaded; NumPy >= 2 transforms single precision and writes into out directly). """
+    name = 'numpy'
+
+    def __init__(self):
+        self.direct = 'out' in inspect.signature(np.fft.rfftn).parameters and np.fft.rfftn(np.zeros((2, 2), np.float32)).dtype == np.complex64
+
+    def irfft2(self, xh, out=None):
+        if xh.device.type != 'cpu':
+            return _TORCH.irfft2(xh, out)
+        if self.direct and out is not None and out.is_contiguous():
+            np.fft.irfftn(_array(xh), axes=(-2,-1), norm='forward', out=out.numpy())
+            return out
+        return _result(np.fft.irfftn(_array(xh), axes=(-2,-1), norm='forward'), xh.real.dtype, out)
+
+    def rfft2(self, x, out=None):
+        if x.device.type != 'cpu':
+            return _TORCH.rfft2(x, out)
+        if self.direct and out is not None and out.is_contiguous():
+            np.fft.rfftn(_array(x), axes=(-2,-1), norm='forward', out=out.numpy())
+            return out
+        return _result(np.fft.rfftn(_array(x), axes=(-2,-1), norm='forward'),
+                       torch.complex128 if x.dtype == torch.float64 else torch.complex64, out)
+
+    def __repr__(self):
+        return "NumpyFFT()"
+
+
+def make_backend(name='torch', workers=None):
+    if name == 'torch':
+        return _TORCH
+    elif name == 'scipy':
+        return ScipyFFT(workers)
+    elif name == 'numpy':
+        return NumpyFFT()
+    raise ValueError("Invalid FFT backend (torch, scipy, numpy or auto). Check config.")
+
+
+_backend = _TORCH
+
+def get_backend():
+    """ The backend used by the spectral transforms. """
+    return _backend
+
+def set_backend(name='torch', workers=None):
+    """ Selects the backend of the spectral transforms (for the whole process). Returns it. """
+    global _backend
+    _backend = make_backend(name, workers)
+    return _backend
+
+
+### Autotuning
+def cache_file():
+    """ Autotuning results (JSON), shared by later runs: $QG_FFT_CACHE or ~/.cache/qg-2d/fft_backends.json. """
+    return os.environ.get('QG_FFT_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'qg-2d', 'fft_backends.json'))
+
+
+def _time_backend(backend, xh, x, min_time=0.1):
+    """ Best time of an inverse and a forward transform into preallocated buffers (like the Jacobian). """
+    spectral = torch.empty_like(xh)
+    best, total = float('inf'), 0.0
+    for i in range(100):
+        start = time.perf_counter()
+        backend.rfft2(backend.irfft2(xh, out=x), out=spectral)
+        elapsed = time.perf_counter() - start
+        if i: # (the first call is a warm-up, e.g. planning)
+            best = min(best, elapsed)
+            total += elapsed
+        if total > min_time and i >= 5:
+            break
+    return best
+
+
+def autotune(grid, batch=1, threads=None, path=None, candidates=BACKENDS, log=print):
+    """
+    Name of the fastest backend for fields [(batch,) Ny, Nx] of grid with threads intra-op threads
+    (default: torch's). Results are cached in path (default: cache_file()) per grid shape, batch,
+    precision, thread count, library versions and machine, so only the first run of a case is timed.
+    Tensors off the CPU always use torch.
+    """
+    if grid.device.type != 'cpu':
+        return 'torch'
+    threads = threads or torch.get_num_threads()
+    path = path or cache_file()
+    key = (f"{grid.Ny}x{grid.Nx}/batch{batch}/{grid.precision}/threads{threads}/torch{torch.__version__}/"
+           f"numpy{np.__version__}/{platform.node()}/{platform.machine()}")
+    cache = {}
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+    if key in cache:
+        return cache[key]['backend']
+
+    shape = ((batch,) if batch > 1 else ()) + (grid.Ny, grid.Nx)
+    generator = torch.Generator().manual_seed(0)
+    x = torch.randn(shape, generator=generator, dtype=grid.dtype)
+    xh = _TORCH.rfft2(x)
+    times = {}
+    for name in candidates:
+        try:
+            backend = make_backend(name, threads)
+        except ImportError:
+            continue
+        # Only backends reproducing torch.fft are candidates
+        error = max(((backend.irfft2(xh) - x).abs().max() / x.abs().max()).item(),
+                    ((backend.rfft2(x) - xh).abs().max() / xh.abs().max()).item())
+        if not error < 1e-4:
+            continue
+        times[name] = _time_backend(backend, xh, torch.empty_like(x))
+    best = min(times, key=times.get)
+    log("FFT autotuning: " + ', '.join(f"{name} {1e3*t:.3f} ms" for name, t in times.items()) + f" -> {best}")
+
+    # Atomic update (concurrent runs may tune at the same time)
+    cache[key] = {'backend': best, 'times': times}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp_path, path)
+    return best
@@ -0,0 +1,109 @@
+import math
+import torch
+from Operators.spectral_conversion import to_physical
+
+### Observation operator: the flow at arbitrary points (x, y) of the domain (e.g. sensors)
+# spectral: the Fourier series of the state is summed at the points, separably in y and x, i.e. one
+#           [points x Ny] @ [Ny x Nx//2+1] product per field. Exact; costs O(points x modes), so it suits
+#           small point counts. In a distributed run every process sums its columns (then all-reduced).
+# interp:   the fields are transformed to the grid (one batched FFT) and interpolated at the points
+#           (periodic cubic convolution or bilinear). Costs O(grid log grid + points).
+# Points use the coordinates of Grid.x, Grid.y (the grid spans [-L/2, L/2)) and wrap periodically.
+
+FIELDS = ('q', 'p', 'u', 'v')
+METHODS = ('auto', 'spectral', 'interp')
+
+
+def _stencil(s, n, order):
+    """ Periodic grid indices [P, m] and weights [P, m] interpolating at grid coordinates s [P]. """
+    i0 = torch.floor(s)
+    t = (s - i0)[:, None]
+    if order == 'linear':
+        offsets = torch.arange(0, 2, device=s.device)
+        weights = torch.cat([1 - t, t], dim=1)
+    elif order == 'cubic':
+        # Cubic convolution (Keys, a = -1/2) on the points i0-1 ... i0+2
+        offsets = torch.arange(-1, 3, device=s.device)
+        d = torch.abs(t - offsets)
+        weights = torch.where(d <= 1, 1.5*d**3 - 2.5*d**2 + 1, -0.5*d**3 + 2.5*d**2 - 4*d + 2)
+    else:
+        raise ValueError("Invalid interpolation order (linear or cubic). Check config.")
+    return (i0.long()[:, None] + offsets) % n, weights
+
+
+class ObservationOperator:
+    """
+    Values [(N,) len(fields), P] of fields (out of q, p, u, v) at points [P, 2] of (x, y) coordinates,
+    from spectral vorticity [(N,) Ny, Nx//2+1] and the background flow (see the methods above; auto
+    picks the cheaper one, always spectral in distributed runs whose spectra are split in columns).
+    """
+    def __init__(self, spectral_derivative, points, fields=('q', 'u', 'v'), method='auto', order='cubic'):
+        if method not in METHODS:
+            raise ValueError("Invalid observation method. Check config.")
+        if any(name not in FIELDS for name in fields):
+            raise ValueError("Invalid observed field (q, p, u or v). Check config.")
+        sd = spectral_derivative
+        grid = sd.grid
+        self.spectral_derivative = sd
+        self.fields = tuple(fields)
+        self.points = torch.as_tensor(points, dtype=torch.float64).reshape(-1, 2)
+        n = len(self.points)
+        distributed = hasattr(sd, 'decomposition') # (Distributed.slab.SlabSpectralDerivatives)
+        if method == 'auto':
+            # Multiply-adds of the Fourier sum against an FFT and interpolation, per field
+            spectral_cost = n * grid.Ny * (grid.Nx//2 + 1)
+            interp_cost = grid.Nx * grid.Ny * math.log2(grid.Nx * grid.Ny) + 16 * n
+            method = 'spectral' if distributed or spectral_cost <= interp_cost else 'interp'
+        if method == 'interp' and distributed:
+            raise ValueError("Interpolated observations are not supported in distributed runs (use spectral).")
+        self.method = method
+        self.order = order
+
+        # Spectral multipliers of the fields (u = -d psi/dy and v = d psi/dx with psi = -q/k^2)
+        multipliers = {'q': torch.ones_like(sd.krsq), 'p': -sd.irsq, 'u': 1j*sd.ky*sd.irsq, 'v': -1j*sd.kr*sd.irsq}
+        self.multipliers = torch.stack([torch.broadcast_to(multipliers[name], sd.krsq.shape).to(grid.complex_dtype)
+                                        for name in self.fields])
+        self.means = [self.fields.index(name) if name in self.fields else None for name in ('u', 'v')]
+
+        # Positions from the first grid point, wrapped into the domain
+        x = (self.points[:, 0] + grid.Lx/2) % grid.Lx
+        y = (self.points[:, 1] + grid.Ly/2) % grid.Ly
+        if method == 'spectral':
+            # e^{i kx x} (times the weight of the rfft column: 2 for kx > 0, except the Nyquist column) and e^{i ky y}
+            weights = torch.full((1, sd.dk), 2.0, dtype=torch.float64)
+            weights[0, 0] = 1.0
+            if grid.Nx % 2 == 0:
+                weights[0, -1] = 1.0
+            weights = sd.local_columns(weights.to(sd.device)).cpu()
+            kr = sd.kr.to(torch.float64).cpu()
+            ky = sd.ky.to(torch.float64).cpu()
+            self.ex = (torch.exp(1j * x[:, None] * kr) * weights).to(sd.device, grid.complex_dtype)
+            self.ey = torch.exp(1j * y[:, None] * ky[:, 0]).to(sd.device, grid.complex_dtype)
+        else:
+            self.ix, self.wx = _stencil((x / grid.dx).to(sd.device), grid.Nx, order)
+            self.iy, self.wy = _stencil((y / grid.dy).to(sd.device), grid.Ny, order)
+            self.wx, self.wy = self.wx.to(grid.dtype), self.wy.to(grid.dtype)
+
+    def __call__(self, qh, u_mean=0, v_mean=0):
+        fh = qh.unsqueeze(-3) * self.multipliers # [(N,) F, Ny, Nx//2+1]
+        if self.spectral_derivative.has_kx0:
+            for index, mean in zip(self.means, (u_mean, v_mean)):
+                if index is not None:
+                    fh[..., index, 0, 0] = mean
+        if self.method == 'spectral':
+            # sum_kx w e^{i kx x} sum_ky e^{i ky y} f(ky, kx), for this process's columns
+            # (contiguous, as the sums of the processes are all-reduced in place)
+            return ((self.ey @ fh) * self.ex).sum(dim=-1).real.contiguous()
+        f = to_physical(fh)
+        values = f[..., self.iy[:, :, None], self.ix[:, None, :]] # [(N,) F, P, m, m]
+        return (values * self.wy[:, :, None] * self.wx[:, None, :]).sum(dim=(-2, -1))
+
+    def __repr__(self):
+        order = f", order={self.order}" if self.method == 'interp' else ''
+        return f"ObservationOperator({len(self.points)} points, fields={self.fields}, method={self.method}{order})"
+
+
+def random_points(n, grid, seed=0):
+    """ n points [n, 2] drawn uniformly over the domain (reproducible with seed). """
+    generator = torch.Generator().manual_seed(seed)
+    return (torch.rand(n, 2, generator=generator, dtype=torch.float64) - 0.5) * torch.tensor([grid.Lx, grid.Ly], dtype=torch.float64)
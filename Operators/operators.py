@@ -3,6 +3,8 @@ import numpy as np
 import math
 
 from Operators.spectral_conversion import to_physical, to_spectral, dealias
+from Operators.fft import get_backend
+from Simulation.profiling import NO_TIMERS
 
 ### Set up spectral derivatives (first and second derivatives)
 # Conventions: first derivative: + 1j*k, second derivative: -k**2
@@ -17,34 +19,95 @@ class SpectralDerivatives:
 
         ## Compute wavenumbers for first derivatives
         # Derivative in y
-        self.ky = torch.reshape((torch.fft.fftfreq(grid.Ny, grid.Ly / (grid.Ny * 2 * math.pi))), 
+        # (in the real dtype of the grid precision, so every spectral multiplier follows it)
+        self.ky = torch.reshape((torch.fft.fftfreq(grid.Ny, grid.Ly / (grid.Ny * 2 * math.pi), dtype=grid.dtype)), 
             (grid.Ny, 1)
         ).to(self.device) 
         
         # Derivative in x
-        self.kr = torch.reshape((torch.fft.rfftfreq(grid.Nx, grid.Lx / (grid.Nx * 2 * math.pi))), 
+        # (of the kx columns held here: all of them, a process of a distributed run only holds some
+        # columns, see Distributed.slab; the kx = 0 column holds the [0,0] mean mode)
+        kr = torch.reshape((torch.fft.rfftfreq(grid.Nx, grid.Lx / (grid.Nx * 2 * math.pi), dtype=grid.dtype)), 
             (1, self.dk)
         ).to(self.device)
+        self.kr_max = kr.max() # (of the full grid, sets the dealiasing cut-off)
+        self.kr = self.local_wavenumbers(kr)
+        self.has_kx0 = bool(self.kr[0,0] == 0)
 
         # Squared wavenumbers (for second derivatives)
         self.krsq = self.kr**2 + self.ky**2  
 
         # Inverse squared wavenumbers (and handling zero division)
         self.irsq = 1.0/self.krsq
-        self.irsq[0,0] = 0.0 #
+        if self.has_kx0:
+            self.irsq[0,0] = 0.0 #
+
+        # Dealiasing masks, computed once per dealias factor (see dealias_mask)
+        self._dealias_masks = {}
+        self._shells = None
+
+    def local_wavenumbers(self, kr):
+        """ kx wavenumbers [1, columns] of the columns held by this process, from the full [1, Nx//2+1] (all of them). """
+        return kr
+
+    def local_columns(self, x):
+        """ The kx columns of a full [..., Nx//2+1] spectral array held by this process (all of them). """
+        return x
+
+    def dealias_mask(self, dealias_factor=1/3):
+        """ Boolean mask of the modes removed by dealias (cached). """
+        if dealias_factor not in self._dealias_masks:
+            kcut = math.sqrt(2) * (1 - dealias_factor) * min(self.ky.max(), self.kr_max)
+            self._dealias_masks[dealias_factor] = torch.sqrt(self.krsq) > kcut
+        return self._dealias_masks[dealias_factor]
+
+    def shell_index(self):
+        """
+        Isotropic shells for spectra (cached): integer wavenumbers k = 1, 2, ..., the shell number
+        of every mode (0 for modes outside all shells) and the number of modes in each shell.
+        Shell n holds the modes with n - 1/2 < |k| < n + 1/2.
+        """
+        if self._shells is None:
+            # (|k| of the last mode [-1, -1] of the full grid)
+            k = torch.arange(1, int(torch.sqrt(self.kr_max**2 + self.ky[-1,0]**2))-1, device=self.device)
+            shell = self.shells(torch.sqrt(self.krsq), len(k))
+            counts = torch.bincount(shell.flatten(), minlength=len(k)+1)[1:]
+            self._shells = (k, shell.flatten(), counts)
+        return self._shells
+
+    @staticmethod
+    def shells(K, n):
+        """ Shell number of modes of wavenumber magnitude K (0 outside the shells 1 ... n). """
+        d = 0.5
+        shell = torch.floor(K + d).long()
+        # Modes exactly on a shell boundary belong to no shell
+        shell[(K == shell - d) | (shell > n)] = 0
+        return shell
 
     def to(self, device):
         """ Move spectral operator tensors to another device. """
         self.device = device
         self.ky = self.ky.to(device)
         self.kr = self.kr.to(device)
+        self.kr_max = self.kr_max.to(device)
         self.krsq = self.krsq.to(device)
         self.irsq = self.irsq.to(device)
+        self._dealias_masks = {}
+        self._shells = None
 
     def __repr__(self):
         return (f"SpectralDerivatives(Nx={self.grid.Nx}, Ny={self.grid.Ny}, dk={self.dk}, "
                 f"Lx={self.grid.Lx:.4f}, Ly={self.grid.Ly:.4f}, device={self.device})")
 
+def member_param(value, device, dtype=None):
+    """
+    PDE parameter: a scalar is returned as is, one value per ensemble member
+    becomes a [N, 1, 1] tensor (of the given real dtype) that broadcasts against batched spectral fields.
+    """
+    if isinstance(value, (list, tuple, np.ndarray, torch.Tensor)):
+        return torch.as_tensor(value, dtype=dtype, device=device).reshape(-1, 1, 1)
+    return value
+
 ### Set up linear operator
 class LinearOperator:
     def __init__(self, spectral_derivative, params):
@@ -56,16 +119,17 @@ class LinearOperator:
         self.Lc = self.linear_term()
 
     def linear_term(self):
-        # Extracting parameters from the params object
-        nu = self.params.nu
-        mu = self.params.mu
-        B = self.params.B
+        # Extracting parameters from the params object (scalars or one value per ensemble member)
+        dtype = self.spectral_derivative.krsq.dtype
+        nu = member_param(self.params.nu, self.device, dtype)
+        mu = member_param(self.params.mu, self.device, dtype)
+        B = member_param(self.params.B, self.device, dtype)
         
         # Calculate the linear term 
         # first term is diffusion: nu del^2 omega
         # then bottom drag: - mu omega
         # then Coriolis with beta term: - beta d psi/ dx (where omega = del^2 psi)
-        Lc = -nu * self.spectral_derivative.krsq - mu + 1j * torch.tensor(B).to(self.device) * self.spectral_derivative.kr * self.spectral_derivative.irsq
+        Lc = -nu * self.spectral_derivative.krsq - mu + 1j * torch.as_tensor(B, dtype=dtype, device=self.device) * self.spectral_derivative.kr * self.spectral_derivative.irsq
         return Lc
 
     def apply(self, input_field):
@@ -92,20 +156,97 @@ class NonlinearOperator:
         self.params = params
         self.device = spectral_derivative.device
 
-    def jacobian_pq(self, input_field_q,input_field_p,input_field_u,input_field_v):
+        # Spectral multipliers used by jacobian (computed once)
+        # u = -d psi/dy and v = d psi/dx with psi = -q/k^2
+        self.u_from_q = 1j*spectral_derivative.ky*spectral_derivative.irsq
+        self.v_from_q = -1j*spectral_derivative.kr*spectral_derivative.irsq
+        # -d/dx and -d/dy
+        self.minus_ddx = -1j*spectral_derivative.kr
+        self.minus_ddy = -1j*spectral_derivative.ky
+        self.dealias_mask = spectral_derivative.dealias_mask(1/3)
+        self._work = None # Work buffers, allocated on the first call of jacobian
+        # If set, jacobian records max|u| and max|v| [(N,) 2] (e.g. for the CFL number) in max_velocity, a
+        # work buffer overwritten by every call (Simulation sets it on the steps whose velocities are read)
+        self.track_velocity = False
+        self.max_velocity = None
+        self.timers = NO_TIMERS # Wall time of the transforms and dealiasing (see Simulation.profiling)
+
+    def physical_shape(self, qh):
+        """ Shape of the physical fields of spectral fields qh. """
+        return qh.shape[:-1] + (2*(qh.shape[-1] - 1),)
+
+    def _to_physical(self, xh, out):
+        return get_backend().irfft2(xh, out)
+
+    def _to_spectral(self, x, out):
+        return get_backend().rfft2(x, out)
+
+    def _workspace(self, qh):
+        """ Work buffers for jacobian, reallocated only when the field shape changes. """
+        if self._work is None or self._work['uh'].shape != qh.shape:
+            phys_shape = self.physical_shape(qh)
+            real_dtype = qh.real.dtype
+            self._work = {'uh': torch.empty_like(qh), 'vh': torch.empty_like(qh),
+                          'uqh': torch.empty_like(qh), 'vqh': torch.empty_like(qh),
+                          'q': torch.empty(phys_shape, dtype=real_dtype, device=qh.device),
+                          'u': torch.empty(phys_shape, dtype=real_dtype, device=qh.device),
+                          'v': torch.empty(phys_shape, dtype=real_dtype, device=qh.device),
+                          'max': torch.empty(qh.shape[:-2] + (2,), dtype=real_dtype, device=qh.device),
+                          'min': torch.empty(qh.shape[:-2] + (2,), dtype=real_dtype, device=qh.device)}
+        return self._work
+
+    def jacobian(self, qh, u_mean, v_mean, out):
         """
-        Computes the Jacobian of q (vorticity) and p (streamfunction) in spectral space (h).
+        Fused right-hand side: Jacobian -d/dx (u*q) - d/dy (v*q) computed from the spectral vorticity alone.
+        Velocities are derived from q (with the background means u_mean, v_mean in their [0,0] modes)
+        and all transforms write into preallocated work buffers, so no memory is allocated per call.
+        The result is written into out (which must not alias qh) and dealiased.
         """
-        # In spectral space
-        qh= input_field_q.clone()
-        ph= input_field_p.clone()
-        uh= input_field_u.clone() 
-        vh= input_field_v.clone() 
+        w = self._workspace(qh)
+
+        # Spectral velocities from vorticity
+        torch.mul(qh, self.u_from_q, out=w['uh'])
+        torch.mul(qh, self.v_from_q, out=w['vh'])
+        if self.spectral_derivative.has_kx0:
+            w['uh'][...,0,0] = u_mean
+            w['vh'][...,0,0] = v_mean
 
         # In physical space
-        q=to_physical(qh)
-        u=to_physical(uh)
-        v=to_physical(vh)
+        with self.timers('fft'):
+            self._to_physical(qh, w['q'])
+            self._to_physical(w['uh'], w['u'])
+            self._to_physical(w['vh'], w['v'])
+
+        if self.track_velocity:
+            # max|u| = max(max u, -min u), reduced into the work buffers
+            for i, name in enumerate(('u', 'v')):
+                torch.amax(w[name], dim=(-2,-1), out=w['max'][...,i])
+                torch.amin(w[name], dim=(-2,-1), out=w['min'][...,i])
+            self.max_velocity = torch.maximum(w['max'], w['min'].neg_(), out=w['max'])
+
+        # Fluxes u*q and v*q (overwriting the velocities)
+        w['u'].mul_(w['q'])
+        w['v'].mul_(w['q'])
+        with self.timers('fft'):
+            self._to_spectral(w['u'], w['uqh'])
+            self._to_spectral(w['v'], w['vqh'])
+
+        #[-d/dx (u*q) - d/dy (v*q)]
+        torch.mul(w['uqh'], self.minus_ddx, out=out)
+        out.addcmul_(w['vqh'], self.minus_ddy)
+
+        with self.timers('dealias'):
+            return out.masked_fill_(self.dealias_mask, 0)
+
+    def jacobian_pq(self, input_field_q,input_field_p,input_field_u,input_field_v):
+        """
+        Computes the Jacobian of q (vorticity) and p (streamfunction) in spectral space (h).
+        Inputs may carry a leading ensemble dimension; all members are transformed in one batched FFT.
+        """
+        # In physical space (the streamfunction is not needed)
+        q=to_physical(input_field_q)
+        u=to_physical(input_field_u)
+        v=to_physical(input_field_v)
 
         # Calculate jacobian
         uq = u*q
@@ -1,18 +1,21 @@
 import torch
 import numpy as np
 import math
+from Operators.fft import get_backend
 
 def to_physical(spectral_field):
     """
-    Convert a spectral field to physical space (inverse FFT).
+    Convert a spectral field to physical space (inverse FFT, with the backend of Operators.fft).
+    Transforms the last two dimensions, so leading (ensemble) dimensions are batched.
     """
-    return torch.fft.irfftn(spectral_field,norm='forward')
+    return get_backend().irfft2(spectral_field)
 
 def to_spectral(physical_field):
     """
-    Convert a physical field to spectral space (FFT).
+    Convert a physical field to spectral space (FFT, with the backend of Operators.fft).
+    Transforms the last two dimensions, so leading (ensemble) dimensions are batched.
     """
-    return torch.fft.rfftn(physical_field,norm='forward')
+    return get_backend().rfft2(physical_field)
 
 
 def dealias(y, spectral_derivative, dealias_factor=1/3):
@@ -21,16 +24,29 @@ def dealias(y, spectral_derivative, dealias_factor=1/3):
     The field's high-frequency components are truncated.
     
     Args:
-    - y: tensor in spectral space to apply dealiasing.
+    - y: tensor in spectral space to apply dealiasing (any leading batch dimensions).
     - spectral_derivative: SpectralOperator instance to access ky, kr, and krsq.
     - dealias_factor: factor to apply the dealiasing (default is 1/3).
     
     Returns:
     - y: tensor with high frequencies removed.
     """
-    kcut = math.sqrt(2) * (1 - dealias_factor) * min(spectral_derivative.ky.max(), spectral_derivative.kr.max())
-    
-    # Apply dealiasing: set high-frequency components to zero
-    y[torch.sqrt(spectral_derivative.krsq) > kcut] = 0
-    
-    return y
+    # Apply dealiasing (in place): set high-frequency components to zero
+    return y.masked_fill_(spectral_derivative.dealias_mask(dealias_factor), 0)
+
+
+def resample(field, Ny, Nx):
+    """
+    Spectral interpolation (zero-padding) or truncation of rfft spectra [..., Ny0, Nx0//2+1] to an Ny x Nx grid
+    of the same domain. With norm='forward' the mode amplitudes carry over unchanged.
+    Only the modes with |ky| and kx below the Nyquist wavenumbers of the smaller grid are kept
+    (its Nyquist modes have no unique counterpart on the other grid).
+    """
+    Ny0, Nx0 = field.shape[-2], 2*(field.shape[-1] - 1)
+    out = field.new_zeros(field.shape[:-2] + (Ny, Nx//2 + 1))
+    ny, nk = min(Ny0, Ny)//2, min(Nx0, Nx)//2
+    # ky = 0, ..., ny - 1 and ky = -(ny - 1), ..., -1
+    out[..., :ny, :nk] = field[..., :ny, :nk]
+    if ny > 1:
+        out[..., -(ny-1):, :nk] = field[..., -(ny-1):, :nk]
+    return out
@@ -0,0 +1,230 @@
+import os
+import json
+import zlib
+import struct
+import numpy as np
+import torch
+from Output.writers import SnapshotWriter
+from Output.spectral import _SpectralFieldView
+
+### Lossy compressed snapshots with an error bound
+# Every field of a snapshot is encoded on its own, so single time slices (and single fields) decode
+# independently. A field is either
+#   quantized: integer codes of (x - min) / (2 e), e = min(abs_error, rel_error * max|x|) the error
+#              bound of this snapshot, delta-coded along x (smooth fields give small differences), or
+#   float16:   x / max|x| in half precision (relative error below 2^-11 of max|x|), used when it meets the
+#              error bound (otherwise the field is quantized),
+# then byte-shuffled and compressed with zlib. Decoded values (in the storage dtype) are within e of
+# the fields written, unless e is below the precision of the storage dtype.
+#
+# File layout: magic, json header length and the json header (shape, dtype, error bounds), then one
+# chunk per snapshot: its length (uint64), the number of fields (uint16) and per field a header
+# (codec, code itemsize, offset, step, compressed length) followed by the compressed fields.
+# Chunks are appended; a chunk cut short by a crash is ignored on reading and dropped on resume.
+
+MAGIC = b'QGZ\x01'
+CODECS = ('quantize', 'float16')
+_FIELD = struct.Struct('<BBddQ')
+_CHUNK = struct.Struct('<Q')
+_COUNT = struct.Struct('<H')
+
+
+def is_compressed_file(path):
+    return path.endswith('.qgz')
+
+
+def _shuffle(codes):
+    """ Byte planes of the codes (the high bytes of small codes are mostly zero and compress well). """
+    return codes.view(np.uint8).reshape(-1, codes.itemsize).T.tobytes()
+
+def _unshuffle(data, dtype, shape):
+    dtype = np.dtype(dtype)
+    return np.frombuffer(data, np.uint8).reshape(dtype.itemsize, -1).T.copy().view(dtype).reshape(shape)
+
+
+def encode_field(x, abs_error=None, rel_error=None, codec='quantize', level=1, dtype=np.float32):
+    """ (field header, compressed bytes) of one physical field x [Ny, Nx], decoded as dtype. """
+    x = np.asarray(x, dtype=np.float64)
+    peak = float(np.abs(x).max())
+    bounds = [b for b in (abs_error, rel_error * peak if rel_error is not None else None) if b is not None]
+    error = min(bounds) if bounds else 0.0
+
+    if codec == 'float16' and peak > 0:
+        scale = peak
+        values = (x / scale).astype(np.float16)
+        if np.abs((values.astype(np.float64) * scale).astype(dtype) - x).max() <= error:
+            return (1, 2, 0.0, scale), zlib.compress(_shuffle(values), level)
+
+    lo, hi = float(x.min()), float(x.max())
+    # (leaving room for the rounding of the decoded values to dtype)
+    margin = peak * np.finfo(dtype).eps
+    step = 2 * max(error - margin, error / 2) if error > 0 else 1.0
+    if hi > lo and error <= 0:
+        raise ValueError("Compressed snapshots need a positive abs_error or rel_error. Check config.")
+    codes = np.rint((x - lo) / step).astype(np.int64)
+    # Delta along x, zigzag-mapped to unsigned integers (0, -1, 1, -2, ... -> 0, 1, 2, 3, ...)
+    delta = np.diff(codes, axis=-1, prepend=0)
+    delta = (delta << 1) ^ (delta >> 63)
+    top = int(delta.max())
+    itemsize = 1 if top < 2**8 else 2 if top < 2**16 else 4 if top < 2**32 else 8
+    return (0, itemsize, lo, step), zlib.compress(_shuffle(delta.astype(f'<u{itemsize}')), level)
+
+
+def decode_field(header, data, shape, dtype=np.float32):
+    """ Field [Ny, Nx] of a field header and its compressed bytes (see encode_field). """
+    codec, itemsize, offset, step = header
+    data = zlib.decompress(data)
+    if codec == 1:
+        return (_unshuffle(data, '<f2', shape).astype(np.float64) * step).astype(dtype)
+    delta = _unshuffle(data, f'<u{itemsize}', shape).astype(np.int64)
+    codes = np.cumsum((delta >> 1) ^ -(delta & 1), axis=-1)
+    return (offset + codes * step).astype(dtype)
+
+
+def encode_snapshot(fields, abs_error=None, rel_error=None, codec='quantize', level=1):
+    """ Chunk of one snapshot [n_fields, Ny, Nx] (decoded in the dtype of fields). """
+    headers, payload = [], []
+    for x in fields:
+        header, data = encode_field(x, abs_error, rel_error, codec, level, fields.dtype)
+        headers.append(_FIELD.pack(*header, len(data)))
+        payload.append(data)
+    body = _COUNT.pack(len(fields)) + b''.join(headers) + b''.join(payload)
+    return _CHUNK.pack(len(body)) + body
+
+
+def _read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{f.name} is not a compressed snapshot file")
+    length, = struct.unpack('<I', f.read(4))
+    return json.loads(f.read(length)), len(MAGIC) + 4 + length
+
+
+def _chunk_offsets(f, start):
+    """ Offsets of the complete chunks of a file, and the end of the last one. """
+    size = os.fstat(f.fileno()).st_size
+    offsets, offset = [], start
+    while offset + _CHUNK.size <= size:
+        f.seek(offset)
+        length, = _CHUNK.unpack(f.read(_CHUNK.size))
+        if offset + _CHUNK.size + length > size:
+            break # Cut short by a crash
+        offsets.append(offset)
+        offset += _CHUNK.size + length
+    return offsets, offset
+
+
+class CompressedWriter(SnapshotWriter):
+    """
+    Append-only compressed snapshot file (.qgz) with error bound e = min(abs_error, rel_error * max|field|)
+    per field and snapshot. codec: quantize (integer codes) or float16 (when it meets the bound).
+    The encoding runs in the writer's thread: wrapped in a BackgroundWriter (output_params.background)
+    it overlaps with the time loop.
+    """
+    def __init__(self, path, abs_error=None, rel_error=1e-3, codec='quantize', level=1, dtype='float32'):
+        super().__init__(dtype)
+        if codec not in CODECS:
+            raise ValueError("Invalid compression codec. Check config.")
+        if not (abs_error or rel_error):
+            raise ValueError("Compressed snapshots need a positive abs_error or rel_error. Check config.")
+        self.path = path
+        self.abs_error = abs_error
+        self.rel_error = rel_error
+        self.codec = codec
+        self.level = level
+        self.file = None
+
+    def _write(self, fields):
+        if self.file is None:
+            header = json.dumps({'shape': list(fields.shape), 'dtype': self.dtype.str, 'abs_error': self.abs_error,
+                                 'rel_error': self.rel_error, 'codec': self.codec}).encode()
+            self.file = open(self.path, 'wb')
+            self.file.write(MAGIC + struct.pack('<I', len(header)) + header)
+        self.file.write(encode_snapshot(fields, self.abs_error, self.rel_error, self.codec, self.level))
+        self.file.flush()
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def resume(self, count):
+        if count == 0:
+            return
+        self.file = open(self.path, 'r+b')
+        meta, start = _read_header(self.file)
+        self.dtype = np.dtype(meta['dtype']) # Continue in the dtype of the file
+        offsets, end = _chunk_offsets(self.file, start)
+        if len(offsets) < count:
+            raise ValueError(f"{self.path} holds {len(offsets)} snapshots, checkpoint expects {count}")
+        # Drop snapshots written after the checkpoint
+        self.file.truncate(offsets[count] if count < len(offsets) else end)
+        self.file.seek(0, os.SEEK_END)
+        self.count = count
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def result(self):
+        return CompressedSnapshots(self.path).physical_view()
+
+    def __repr__(self):
+        return (f"CompressedWriter(path={self.path}, codec={self.codec}, abs_error={self.abs_error}, "
+                f"rel_error={self.rel_error}, count={self.count})")
+
+
+class CompressedSnapshots:
+    """
+    Reader for compressed snapshot files. Only the requested times and fields are read and decoded;
+    the file is opened lazily (a reader handed to data loader workers reopens it in every process).
+    """
+    names = ('q', 'p', 'u', 'v')
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        with open(path, 'rb') as f:
+            self.meta, start = _read_header(f)
+            self.offsets, _ = _chunk_offsets(f, start)
+        self.shape = tuple(self.meta['shape'])
+        self.dtype = np.dtype(self.meta['dtype'])
+        # (Ny, Nx of the fields, like the grid of SpectralSnapshots)
+        self.meta.update(Ny=self.shape[-2], Nx=self.shape[-1])
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _chunk(self, t):
+        if self.file is None:
+            self.file = open(self.path, 'rb')
+        self.file.seek(self.offsets[t] + _CHUNK.size)
+        n, = _COUNT.unpack(self.file.read(_COUNT.size))
+        headers = [_FIELD.unpack(self.file.read(_FIELD.size)) for _ in range(n)]
+        return headers, self.file.tell()
+
+    def read(self, times, channels=None):
+        """ Fields [len(times), len(channels), Ny, Nx] (default: all fields) of the given times. """
+        channels = range(self.shape[0]) if channels is None else channels
+        out = np.empty((len(times), len(channels)) + self.shape[1:], dtype=self.dtype)
+        for i, t in enumerate(times):
+            headers, start = self._chunk(t)
+            ends = np.cumsum([0] + [h[-1] for h in headers])
+            for j, c in enumerate(channels):
+                self.file.seek(start + ends[c])
+                out[i, j] = decode_field(headers[c][:-1], self.file.read(headers[c][-1]), self.shape[1:], self.dtype)
+        return out
+
+    def fields(self, times, names=names):
+        """ Physical fields [len(times), len(names), Ny, Nx] as a tensor (like SpectralSnapshots.fields). """
+        return torch.from_numpy(self.read(times, [self.names.index(name) for name in names]))
+
+    def physical_view(self):
+        """ [Ny, Nx, T, 4] view like open_snapshots, decoding the requested times on access. """
+        return _SpectralFieldView(self)
+
+    def __getstate__(self):
+        return dict(self.__dict__, file=None)
+
+    def __repr__(self):
+        return f"CompressedSnapshots(path={self.path}, {len(self)} snapshots of {self.shape})"
@@ -0,0 +1,118 @@
+import os
+import json
+import numpy as np
+import torch
+from Output.writers import NpyWriter
+
+### Spectral-only snapshots
+# A snapshot is the dealiased spectral vorticity: the rfft modes kept by the 2/3 rule plus the
+# background mean velocities (the [0,0] modes of u and v), stored as interleaved real/imaginary
+# values of the writer's storage dtype (float32 by default). p, u and v are reconstructed from q on demand.
+# The grid needed for the reconstruction is stored in a .json file next to the snapshots.
+
+def pack_spectral(qh, u_mean, v_mean, mask):
+    """ Packs spectral vorticity [..., Ny, Nx//2+1] and the mean velocities into [..., 2*(n_kept+2)] floats. """
+    modes = qh[..., ~mask]
+    means = torch.stack(torch.broadcast_tensors(torch.as_tensor(u_mean, device=qh.device),
+                                                torch.as_tensor(v_mean, device=qh.device)), dim=-1)
+    values = torch.cat([modes, means.to(modes.dtype).reshape(modes.shape[:-1] + (2,))], dim=-1)
+    return torch.view_as_real(values).reshape(values.shape[:-1] + (-1,))
+
+
+class SpectralWriter(NpyWriter):
+    """
+    Append-only .npy of packed spectral snapshots (see pack_spectral), with the grid in a .json sidecar.
+    The Simulation hands spectral snapshots to writers with spectral = True.
+    """
+    spectral = True
+
+    def __init__(self, path, grid, dealias_factor=1/3, dtype='float32'):
+        super().__init__(path, dtype)
+        self.meta = {'Nx': grid.Nx, 'Ny': grid.Ny, 'Lx': grid.Lx, 'Ly': grid.Ly, 'dealias_factor': dealias_factor}
+        with open(meta_file(path), 'w') as f:
+            json.dump(self.meta, f)
+
+    def result(self):
+        return SpectralSnapshots(self.path).physical_view()
+
+    def __repr__(self):
+        return f"SpectralWriter(path={self.path}, count={self.count})"
+
+
+def meta_file(path):
+    return os.path.splitext(path)[0] + '.json'
+
+def is_spectral_file(path):
+    return os.path.exists(meta_file(path))
+
+
+class SpectralSnapshots:
+    """
+    Reader for spectral snapshot files. The file is memory-mapped; fields are reconstructed
+    in batches on the given device, e.g. inside data loader workers.
+    """
+    names = ('q', 'p', 'u', 'v')
+
+    def __init__(self, path, device='cpu'):
+        from Grid.grid import Grid
+        from Operators.operators import SpectralDerivatives
+        with open(meta_file(path)) as f:
+            self.meta = json.load(f)
+        self.data = np.load(path, mmap_mode='r')
+        # Fields are reconstructed in double precision from float64 files (float16 files in single precision)
+        precision = 'float64' if self.data.dtype == np.float64 else 'float32'
+        self.grid = Grid(self.meta['Lx'], self.meta['Ly'], self.meta['Nx'], self.meta['Ny'], device, precision)
+        self.spectral_derivative = SpectralDerivatives(self.grid)
+        self.keep = ~self.spectral_derivative.dealias_mask(self.meta['dealias_factor'])
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def spectral(self, times):
+        """ Spectral vorticity [len(times), (N,) Ny, Nx//2+1] and mean velocities u, v of the given times. """
+        values = torch.as_tensor(np.array(self.data[times]), device=self.grid.device).to(self.grid.dtype)
+        values = torch.view_as_complex(values.reshape(values.shape[:-1] + (-1, 2)).contiguous())
+        qh = torch.zeros(values.shape[:-1] + self.keep.shape, dtype=values.dtype, device=values.device)
+        qh[..., self.keep] = values[..., :-2]
+        return qh, values[..., -2], values[..., -1]
+
+    def fields(self, times, names=names):
+        """ Physical fields [len(times), (N,) len(names), Ny, Nx] (any of q, p, u, v) of the given times. """
+        from Operators.spectral_conversion import to_physical
+        sd = self.spectral_derivative
+        qh, u_mean, v_mean = self.spectral(times)
+        out = []
+        for name in names:
+            if name == 'q':
+                fh = qh
+            elif name == 'p':
+                fh = -qh*sd.irsq
+            else:
+                fh = (1j*sd.ky*sd.irsq if name == 'u' else -1j*sd.kr*sd.irsq)*qh
+                fh[..., 0, 0] = u_mean if name == 'u' else v_mean
+            out.append(to_physical(fh))
+        return torch.stack(out, dim=-3)
+
+    def physical_view(self):
+        """ [Ny, Nx, T, 4] view like open_snapshots, reconstructing the requested times on access. """
+        return _SpectralFieldView(self)
+
+
+class _SpectralFieldView:
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        self.shape = (snapshots.meta['Ny'], snapshots.meta['Nx'], len(snapshots), 4)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        key = key + (slice(None),) * (4 - len(key))
+        t = key[2]
+        times = [t] if not isinstance(t, slice) else list(range(*t.indices(self.shape[2])))
+        fields = self.snapshots.fields(times).cpu().numpy() # [T, 4, Ny, Nx]
+        fields = fields.transpose(2, 3, 0, 1) # [Ny, Nx, T, 4]
+        if not isinstance(t, slice):
+            return fields[key[0], key[1], 0, key[3]]
+        return fields[key[0], key[1], :, key[3]]
+
+    def __len__(self):
+        return self.shape[0]
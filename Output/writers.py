@@ -0,0 +1,395 @@
+import os
+import queue
+import threading
+import numpy as np
+import torch
+
+### Snapshot writers
+# Snapshots are written as they are produced, one [4, Ny, Nx] block (q, p, u, v) per save time.
+# On disk the time axis comes first ([T, 4, Ny, Nx]) so that files can be appended to;
+# open_snapshots returns the legacy [Ny, Nx, T, 4] view used by the plotting routines.
+# Snapshots are stored in the writer's dtype (float32 by default, whatever the solver precision):
+# float16 halves the files of runs whose output is only plotted or used for training.
+STORAGE_DTYPES = ('float16', 'float32', 'float64')
+
+
+class SnapshotWriter:
+    """
+    Base class for output sinks. Snapshots must be written in order.
+    Writers with spectral = True receive packed spectral snapshots (Output.spectral) instead of physical fields.
+    Snapshots are converted to the storage dtype (one of STORAGE_DTYPES) before they are written.
+    """
+    spectral = False
+
+    def __init__(self, dtype='float32'):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError("Invalid snapshot dtype. Check config.")
+        self.count = 0
+        self.dtype = np.dtype(dtype)
+
+    def write(self, index, fields):
+        if index != self.count:
+            raise ValueError(f"Snapshot {index} written out of order (expected {self.count})")
+        self._write(np.ascontiguousarray(_to_numpy(fields), dtype=self.dtype))
+        self.count += 1
+
+    def _write(self, fields):
+        raise NotImplementedError
+
+    def flush(self):
+        """ Makes sure every snapshot written so far is on disk. """
+        pass
+
+    def resume(self, count):
+        """ Continues a restarted run: keeps the first count snapshots and appends after them. """
+        self.count = count
+
+    def close(self):
+        pass
+
+    def result(self):
+        """ Returns the written snapshots as a [Ny, Nx, T, 4] array. """
+        raise NotImplementedError
+
+
+class MemoryWriter(SnapshotWriter):
+    """ Keeps every snapshot in a preallocated host tensor (the original q_sol behaviour). """
+    def __init__(self, Nx, Ny, n_saves, dtype='float32'):
+        super().__init__(dtype)
+        self.q_sol = torch.from_numpy(np.zeros([Ny, Nx, n_saves, 4], dtype=self.dtype))
+
+    def _write(self, fields):
+        self.q_sol[:, :, self.count, :] = torch.from_numpy(fields).permute(1, 2, 0)
+
+    def result(self):
+        # After a restart only the snapshots written since resume are held in memory
+        return self.q_sol
+
+    def __repr__(self):
+        return f"MemoryWriter(shape={tuple(self.q_sol.shape)})"
+
+
+class NullWriter(SnapshotWriter):
+    """ Counts snapshots without keeping them (the processes of a distributed run other than rank 0). """
+    def __init__(self, spectral=False):
+        super().__init__()
+        self.spectral = spectral
+
+    def write(self, index, fields):
+        self.count += 1
+
+    def result(self):
+        return None
+
+    def __repr__(self):
+        return f"NullWriter(count={self.count})"
+
+
+class NpyWriter(SnapshotWriter):
+    """
+    Append-only .npy file. The header is rewritten after every snapshot, so the file
+    is a valid .npy holding all snapshots written so far, even if the run crashes.
+    """
+    header_len = 128
+
+    def __init__(self, path, dtype='float32'):
+        super().__init__(dtype)
+        self.path = path
+        self.file = None
+        self.shape = None
+
+    def _header(self, count):
+        header = {'descr': self.dtype.newbyteorder('<').str, 'fortran_order': False, 'shape': (count,) + self.shape}
+        header = repr(header).encode('latin1')
+        pad = self.header_len - 10 - len(header) - 1
+        return b'\x93NUMPY\x01\x00' + (self.header_len - 10).to_bytes(2, 'little') + header + b' ' * pad + b'\n'
+
+    def _write(self, fields):
+        if self.file is None:
+            self.shape = fields.shape
+            self.file = open(self.path, 'wb')
+            self.file.write(self._header(0))
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(fields.astype(self.dtype.newbyteorder('<'), copy=False).tobytes())
+        # Update the snapshot count in the header
+        self.file.seek(0)
+        self.file.write(self._header(self.count + 1))
+        self.file.flush()
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def resume(self, count):
+        if count == 0:
+            return
+        arr = np.load(self.path, mmap_mode='r')
+        if arr.shape[0] < count:
+            raise ValueError(f"{self.path} holds {arr.shape[0]} snapshots, checkpoint expects {count}")
+        self.shape = arr.shape[1:]
+        self.dtype = arr.dtype # Continue in the dtype of the file
+        del arr
+        # Drop snapshots written after the checkpoint
+        self.file = open(self.path, 'r+b')
+        self.file.truncate(self.header_len + count*int(np.prod(self.shape))*self.dtype.itemsize)
+        self.file.seek(0)
+        self.file.write(self._header(count))
+        self.file.flush()
+        self.count = count
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def result(self):
+        return open_snapshots(self.path)
+
+    def __repr__(self):
+        return f"NpyWriter(path={self.path}, count={self.count})"
+
+
+class HDF5Writer(SnapshotWriter):
+    """ Chunked HDF5 dataset of shape [T, 4, Ny, Nx], grown by one chunk per snapshot. """
+    def __init__(self, path, dataset='fields', compression=None, dtype='float32'):
+        super().__init__(dtype)
+        import h5py
+        self.h5py = h5py
+        self.path = path
+        self.dataset = dataset
+        self.compression = compression
+        self.file = None
+        self.dset = None
+
+    def _write(self, fields):
+        if self.file is None:
+            self.file = self.h5py.File(self.path, 'w')
+        if self.dset is None:
+            self.dset = self.file.create_dataset(self.dataset, shape=(0,) + fields.shape, maxshape=(None,) + fields.shape,
+                                                 chunks=(1,) + fields.shape, dtype=self.dtype, compression=self.compression)
+        self.dset.resize(self.count + 1, axis=0)
+        self.dset[self.count] = fields
+        self.file.flush()
+
+    def resume(self, count):
+        if count == 0:
+            return
+        self.file = self.h5py.File(self.path, 'a')
+        self.dset = self.file[self.dataset]
+        if self.dset.shape[0] < count:
+            raise ValueError(f"{self.path} holds {self.dset.shape[0]} snapshots, checkpoint expects {count}")
+        # Drop snapshots written after the checkpoint
+        self.dset.resize(count, axis=0)
+        self.file.flush()
+        self.count = count
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def result(self):
+        return open_snapshots(self.path, self.dataset)
+
+    def __repr__(self):
+        return f"HDF5Writer(path={self.path}, count={self.count})"
+
+
+class BackgroundWriter(SnapshotWriter):
+    """
+    Wraps another writer and performs the device-to-host copy and the file I/O in a
+    background thread, so that writing overlaps with time stepping.
+    At most max_pending snapshots are held in memory at once.
+    """
+    def __init__(self, writer, max_pending=2):
+        super().__init__()
+        self.writer = writer
+        self.spectral = writer.spectral
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is not None and self.error is None:
+                try:
+                    self.writer.write(*item)
+                except Exception as e:
+                    self.error = e
+            self.queue.task_done()
+            if item is None:
+                break
+
+    def write(self, index, fields):
+        if self.error is not None:
+            raise RuntimeError("Background snapshot writer failed") from self.error
+        self.queue.put((index, fields.detach() if torch.is_tensor(fields) else fields))
+        self.count += 1
+
+    def flush(self):
+        # Wait until the queue is drained
+        self.queue.join()
+        if self.error is not None:
+            raise RuntimeError("Background snapshot writer failed") from self.error
+        self.writer.flush()
+
+    def resume(self, count):
+        self.writer.resume(count)
+        self.count = count
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.writer.close()
+        if self.error is not None:
+            raise RuntimeError("Background snapshot writer failed") from self.error
+
+    def result(self):
+        return self.writer.result()
+
+    def __repr__(self):
+        return f"BackgroundWriter({self.writer})"
+
+
+class EnsembleWriter(SnapshotWriter):
+    """ Splits batched [N, 4, Ny, Nx] snapshots of an ensemble run into one writer per member. """
+    def __init__(self, writers):
+        super().__init__()
+        self.writers = writers
+        self.spectral = writers[0].spectral
+
+    def write(self, index, fields):
+        for member, writer in enumerate(self.writers):
+            writer.write(index, fields[member])
+        self.count += 1
+
+    def flush(self):
+        for writer in self.writers:
+            writer.flush()
+
+    def resume(self, count):
+        for writer in self.writers:
+            writer.resume(count)
+        self.count = count
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+    def result(self):
+        """ List with the result of every member. """
+        return [writer.result() for writer in self.writers]
+
+    def __repr__(self):
+        return f"EnsembleWriter({len(self.writers)} x {self.writers[0]})"
+
+
+def snapshot_file(save_dir, run_number, fmt='npy'):
+    """ Path of the snapshot file of a run (runs kept in memory are saved as .npy at the end). """
+    if fmt == 'spectral':
+        return os.path.join(save_dir, f'spectral_Run{run_number:05d}.npy')
+    if fmt == 'compressed':
+        return os.path.join(save_dir, f'fields_Run{run_number:05d}.qgz')
+    return os.path.join(save_dir, f'fields_Run{run_number:05d}' + ('.h5' if fmt == 'hdf5' else '.npy'))
+
+
+def _file_writer(fmt, output_params, save_dir, run_number, grid, n_saves):
+    dtype = getattr(output_params, 'dtype', 'float32')
+    if fmt == 'memory':
+        return MemoryWriter(grid.Nx, grid.Ny, n_saves, dtype)
+    os.makedirs(save_dir, exist_ok=True)
+    if fmt == 'npy':
+        return NpyWriter(snapshot_file(save_dir, run_number, fmt), dtype)
+    elif fmt == 'hdf5':
+        return HDF5Writer(snapshot_file(save_dir, run_number, fmt),
+                          compression=getattr(output_params, 'compression', None), dtype=dtype)
+    elif fmt == 'spectral':
+        from Output.spectral import SpectralWriter
+        return SpectralWriter(snapshot_file(save_dir, run_number, fmt), grid, dtype=dtype)
+    elif fmt == 'compressed':
+        from Output.compressed import CompressedWriter
+        return CompressedWriter(snapshot_file(save_dir, run_number, fmt), getattr(output_params, 'abs_error', None),
+                                getattr(output_params, 'rel_error', 1e-3), getattr(output_params, 'codec', 'quantize'),
+                                getattr(output_params, 'compression_level', 1), dtype)
+    raise ValueError("Invalid output format. Check config.")
+
+
+def member_dir(save_dir, member):
+    """ Output folder of one ensemble member. """
+    return os.path.join(save_dir, f'Member{member:03d}')
+
+
+def make_writer(output_params, save_dir, run_number, grid, n_saves, n_members=None):
+    """
+    Creates the snapshot writer selected in the config (output_params.format: npy, hdf5, spectral, compressed or memory),
+    storing snapshots as output_params.dtype (float16, float32 or float64; default float32).
+    Ensemble runs (n_members given) write one file per member into save_dir/MemberXXX.
+    """
+    fmt = getattr(output_params, 'format', 'memory')
+    if n_members is None:
+        writer = _file_writer(fmt, output_params, save_dir, run_number, grid, n_saves)
+    else:
+        writer = EnsembleWriter([_file_writer(fmt, output_params, member_dir(save_dir, m), run_number, grid, n_saves)
+                                 for m in range(n_members)])
+    if fmt != 'memory' and getattr(output_params, 'background', True):
+        writer = BackgroundWriter(writer)
+    return writer
+
+
+### Readers
+class _HDF5FieldView:
+    """ Lazy [Ny, Nx, T, 4] view of an HDF5 snapshot dataset. """
+    def __init__(self, dset):
+        self.dset = dset
+        T, nf, Ny, Nx = dset.shape
+        self.shape = (Ny, Nx, T, nf)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        key = key + (slice(None),) * (4 - len(key))
+        arr = self.dset[key[2], key[3], key[0], key[1]]
+        # Axes left after integer indexing, in file order (t, f, i, j)
+        kept = [ax for ax, k in zip((2, 3, 0, 1), (key[2], key[3], key[0], key[1])) if isinstance(k, slice)]
+        return arr.transpose([kept.index(ax) for ax in sorted(kept)])
+
+    def __len__(self):
+        return self.shape[0]
+
+
+def load_npy_snapshots(path):
+    """
+    Memory-mapped [T, 4, Ny, Nx] snapshots of an .npy snapshot file. Files of the legacy layout [Ny, Nx, T, 4]
+    (the q_sol array saved before snapshots were written time first, square grids only) are transposed.
+    """
+    data = np.load(path, mmap_mode='r')
+    if data.ndim == 4 and data.shape[1] == 4:
+        return data
+    if data.ndim == 4 and data.shape[3] == 4 and data.shape[0] == data.shape[1]:
+        return data.transpose(2, 3, 0, 1)
+    raise ValueError(f"{path} is not a snapshot file (shape {data.shape}, expected [T, 4, Ny, Nx])")
+
+
+def open_snapshots(path, dataset='fields'):
+    """
+    Opens a snapshot file without loading it into memory. Returns a [Ny, Nx, T, 4] view.
+    """
+    from Output.spectral import is_spectral_file, SpectralSnapshots
+    if is_spectral_file(path):
+        return SpectralSnapshots(path).physical_view()
+    from Output.compressed import is_compressed_file, CompressedSnapshots
+    if is_compressed_file(path):
+        return CompressedSnapshots(path).physical_view()
+    if path.endswith('.h5') or path.endswith('.hdf5'):
+        import h5py
+        return _HDF5FieldView(h5py.File(path, 'r')[dataset])
+    return load_npy_snapshots(path).transpose(2, 3, 0, 1)
+
+
+def _to_numpy(fields):
+    if torch.is_tensor(fields):
+        return fields.detach().cpu().numpy()
+    return np.asarray(fields)
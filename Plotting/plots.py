@@ -1,10 +1,10 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import torch
 import math
 
 
 def vorticity_plots(grid,field,timestep, time_params):
+    import matplotlib.pyplot as plt # (imported on first use: the solver only needs the spectra below)
     fig, ax = plt.subplots()  # Create a figure and axis
 
     cax = ax.imshow(field[:, :, timestep,0], cmap='seismic', origin='lower', vmax=10, vmin=-10, 
@@ -24,7 +24,13 @@ def vorticity_plots(grid,field,timestep, time_params):
 
     return fig, ax  # Return the figure and axis objects
 
+def update_vorticity_plot(ax, field, timestep, time_params):
+    # Reuse a figure made by vorticity_plots for another snapshot (only the image data and title change)
+    ax.images[0].set_data(field[:, :, timestep,0])
+    ax.set_title(f"$\omega$ at T= {timestep} x{time_params.save_int} dt")
+
 def spectrum_plot(k, ek, zk, timestep, time_params):
+    import matplotlib.pyplot as plt
     fig, axes = plt.subplots(1, 2, figsize=(12, 5))
     
     # Energy spectrum (left plot)
@@ -47,24 +53,38 @@ def spectrum_plot(k, ek, zk, timestep, time_params):
     
     # Adjust layout
     plt.tight_layout()
-    plt.show()
     
     return fig, axes  # Return the figure and axis objects
 
+def update_spectrum_plot(axes, ek, zk, timestep, time_params):
+    # Reuse a figure made by spectrum_plot for another snapshot (only the curves and titles change)
+    axes[0].lines[0].set_ydata(ek)
+    axes[0].set_title(f"Energy Spectrum at T= {timestep} x{time_params.save_int} dt")
+    axes[1].lines[0].set_ydata(zk)
+    axes[1].set_title(f"Enstrophy Spectrum at T= {timestep} x{time_params.save_int} dt")
+
 
 ## Calculate the spectrum
 def spectrum(y, spectral_derivative): 
-    # y is in spectral space
-    K = torch.sqrt(spectral_derivative.krsq)
+    # y is a list of spectral-space fields, each [..., Ny, Nx//2+1] (leading dimensions, e.g.
+    # snapshots or ensemble members, are handled at once). Returns k and the shell sums of each field.
+    k, shell, m = spectral_derivative.shell_index()
     d = 0.5
-    k = torch.arange(1, int(K[-1,-1])-1)
-    m = torch.zeros(k.size())
-    
-    e = [torch.zeros(k.size()) for _ in range(len(y))]
-    for ik in range(len(k)):
-        n = k[ik]
-        i = torch.nonzero((K < (n + d)) & (K > (n - d)), as_tuple=True)
-        m[ik] = i[0].numel()
-        for j, yj in enumerate(y):
-            e[j][ik] = torch.sum(yj[i]) * k[ik] * math.pi / (m[ik] - d)
-    return k, e
\ No newline at end of file
+    weight = k * math.pi / (m - d)
+    n = len(k) + 1 # Shell 0 collects the modes outside all shells
+
+    # All fields are summed by a single scatter over the flattened (field, shell) index
+    fields = torch.stack(torch.broadcast_tensors(*y), dim=-3) # [..., F, Ny, Nx//2+1]
+    flat = fields.reshape(-1, len(y) * shell.numel())
+    index = (torch.arange(len(y), device=shell.device)[:, None] * n + shell).flatten()
+    sums = torch.zeros(flat.shape[0], len(y) * n, dtype=flat.dtype, device=flat.device)
+    sums.index_add_(1, index, flat)
+    sums = sums.reshape(fields.shape[:-2] + (n,))[..., 1:] * weight
+    return k, list(sums.unbind(-2))
+
+def energy_enstrophy_spectra(qh, spectral_derivative):
+    """ Kinetic energy and enstrophy spectra E(k), Z(k) of spectral vorticity fields [..., Ny, Nx//2+1]. """
+    z = torch.abs(qh)**2 # Enstrophy
+    e = z * spectral_derivative.irsq # Kinetic energy |u|^2 + |v|^2 = |q|^2 / k^2
+    k, [ek, zk] = spectrum([e, z], spectral_derivative)
+    return k, ek, zk
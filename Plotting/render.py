@@ -0,0 +1,135 @@
+import os
+import argparse
+import importlib
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+import numpy as np
+
+### Post-processing stage: renders saved snapshots in parallel
+# Snapshots are read lazily from the saved file by every worker. Each worker keeps one figure
+# per plot type and only updates its data between snapshots.
+
+_worker = {}
+
+def _init_worker(snapshot_path, Lx, Ly, save_int, out_dir, run_number, dpi):
+    import matplotlib
+    matplotlib.use('Agg')
+    import torch
+    torch.set_num_threads(1) # One process per core
+    from Output.writers import open_snapshots
+    _worker.clear()
+    _worker.update(field=open_snapshots(snapshot_path), grid=SimpleNamespace(Lx=Lx, Ly=Ly),
+                   time_params=SimpleNamespace(save_int=save_int), out_dir=out_dir, run_number=run_number, dpi=dpi)
+
+def _render_vorticity(timesteps):
+    from Plotting.plots import vorticity_plots, update_vorticity_plot
+    w = _worker
+    save_dir = os.path.join(w['out_dir'], 'Plots')
+    if 'vorticity' not in w:
+        w['vorticity'] = vorticity_plots(w['grid'], w['field'], timesteps[0], w['time_params'])
+    fig, ax = w['vorticity']
+    for timestep in timesteps:
+        update_vorticity_plot(ax, w['field'], timestep, w['time_params'])
+        plot_file_name = f"vorticity_Run{w['run_number']:05d}_t_{timestep*w['time_params'].save_int:06d}.png"
+        fig.savefig(os.path.join(save_dir, plot_file_name), bbox_inches='tight', dpi=w['dpi'])
+    return len(timesteps)
+
+def _render_spectrum(timesteps):
+    import torch
+    from Grid.grid import Grid
+    from Operators.operators import SpectralDerivatives
+    from Operators.spectral_conversion import to_spectral
+    from Plotting.plots import spectrum_plot, update_spectrum_plot, energy_enstrophy_spectra
+    w = _worker
+    save_dir = os.path.join(w['out_dir'], 'Spectrum')
+    if 'spectral_derivative' not in w:
+        Ny, Nx = w['field'].shape[:2] # (views are [Ny, Nx, T, 4])
+        w['spectral_derivative'] = SpectralDerivatives(Grid(w['grid'].Lx, w['grid'].Ly, Nx, Ny, 'cpu'))
+
+    # Spectra of the whole chunk in one batched operation
+    # (in the precision of the spectral derivatives, e.g. for float16 snapshot files)
+    q_phys = torch.as_tensor(np.array(w['field'][:, :, timesteps[0]:timesteps[-1]+1, 0])).permute(2, 0, 1)
+    q_phys = q_phys.to(w['spectral_derivative'].grid.dtype)
+    k, ek, zk = energy_enstrophy_spectra(to_spectral(q_phys), w['spectral_derivative'])
+    if 'spectrum' not in w:
+        w['spectrum'] = spectrum_plot(k, ek[0], zk[0], timesteps[0], w['time_params'])
+    fig, axes = w['spectrum']
+    for i, timestep in enumerate(timesteps):
+        update_spectrum_plot(axes, ek[i], zk[i], timestep, w['time_params'])
+        plot_file_name = f"spectrum_Run{w['run_number']:05d}_t_{timestep*w['time_params'].save_int:06d}.png"
+        fig.savefig(os.path.join(save_dir, plot_file_name), bbox_inches='tight', dpi=w['dpi'])
+    return len(timesteps)
+
+
+def render_snapshots(snapshot_path, grid, time_params, out_dir, run_number, kinds=('vorticity', 'spectrum'),
+                     workers=None, dpi=300, chunk_size=8):
+    """
+    Renders vorticity and/or spectrum PNGs of every saved snapshot into out_dir/Plots and
+    out_dir/Spectrum, fanning chunks of consecutive snapshots out over a process pool.
+    Returns the number of images written.
+    """
+    from Output.writers import open_snapshots
+    n_times = open_snapshots(snapshot_path).shape[2]
+    workers = workers or min(os.cpu_count() or 1, max(1, n_times // chunk_size))
+    chunks = [list(range(start, min(start + chunk_size, n_times))) for start in range(0, n_times, chunk_size)]
+    render = {'vorticity': _render_vorticity, 'spectrum': _render_spectrum}
+    for kind in kinds:
+        os.makedirs(os.path.join(out_dir, 'Plots' if kind == 'vorticity' else 'Spectrum'), exist_ok=True)
+
+    # Fork (where available) so that workers do not re-import the calling script
+    context = mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else None)
+    init_args = (snapshot_path, grid.Lx, grid.Ly, time_params.save_int, out_dir, run_number, dpi)
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=init_args) as pool:
+        futures = [pool.submit(render[kind], chunk) for kind in kinds for chunk in chunks]
+        return sum(f.result() for f in futures)
+
+
+def write_animation(snapshot_path, grid, time_params, file_path, fps=10, dpi=100):
+    """
+    Writes the vorticity of all saved snapshots as one compressed animation (mp4 with ffmpeg,
+    otherwise an animated gif), updating a single figure frame by frame.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib import animation
+    from Output.writers import open_snapshots
+    from Plotting.plots import vorticity_plots, update_vorticity_plot
+
+    field = open_snapshots(snapshot_path)
+    if animation.writers.is_available('ffmpeg'):
+        writer = animation.FFMpegWriter(fps=fps, codec='h264')
+    else:
+        writer = animation.PillowWriter(fps=fps)
+        file_path = os.path.splitext(file_path)[0] + '.gif'
+
+    fig, ax = vorticity_plots(grid, field, 0, time_params)
+    with writer.saving(fig, file_path, dpi):
+        for timestep in range(field.shape[2]):
+            update_vorticity_plot(ax, field, timestep, time_params)
+            writer.grab_frame()
+    plt.close(fig)
+    return file_path
+
+
+if __name__ == '__main__':
+    # Standalone post-processing of a finished run: python -m Plotting.render --run_num 2721
+    parser = argparse.ArgumentParser(description='Render saved QG snapshots')
+    parser.add_argument('--run_num', type=int, help='Run number for configuration file', required=True)
+    parser.add_argument('--member', type=int, default=None, help='Ensemble member to render')
+    parser.add_argument('--workers', type=int, default=None, help='Number of rendering processes')
+    parser.add_argument('--kinds', nargs='+', default=['vorticity', 'spectrum'], help='Plots to render (vorticity, spectrum)')
+    parser.add_argument('--animation', action='store_true', help='Also write a vorticity animation')
+    parser.add_argument('--dpi', type=int, default=300)
+    args = parser.parse_args()
+
+    from Utils.utils import results_dir
+    from Output.writers import snapshot_file
+    config = importlib.import_module(f'Config.Run{args.run_num:05d}')
+    out_dir = results_dir(args.run_num, args.member)
+    path = snapshot_file(out_dir, args.run_num, getattr(getattr(config.params, 'output', None), 'format', 'npy'))
+    n = render_snapshots(path, config.params.grid, config.params.time, out_dir, args.run_num, args.kinds, args.workers, args.dpi)
+    print(f"Rendered {n} images into {out_dir}")
+    if args.animation:
+        print(f"Animation written to {write_animation(path, config.params.grid, config.params.time, os.path.join(out_dir, f'vorticity_Run{args.run_num:05d}.mp4'))}")
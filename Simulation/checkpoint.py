@@ -0,0 +1,67 @@
+import os
+import torch
+from Initial_forcing.ics import init_randn
+from Operators.spectral_conversion import resample
+
+
+def save_checkpoint(state, path):
+    """
+    Writes the solver state atomically: the file is written next to its destination
+    and renamed over it, so an interrupted write never corrupts the last checkpoint.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        torch.save(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, device='cpu'):
+    """Reads a checkpoint written by save_checkpoint."""
+    return torch.load(path, map_location=device)
+
+
+def fork_initial_condition(state, grid, spectral_derivative, perturbation=None, seed=86):
+    """
+    Spectral initial condition (q, p, u, v) and start time of a new run forked from a
+    checkpointed state. An optional random perturbation with the given energy and
+    wavenumber band (energy, [k_min, k_max]) is added to the vorticity.
+    The forked run restarts the AB2 history with a backward Euler step.
+    A state of another resolution (e.g. a coarse spin-up, see Simulation.spinup) is resampled onto grid first.
+    """
+    if (state['Nx'], state['Ny']) != (grid.Nx, grid.Ny):
+        state = resample_state(state, spectral_derivative)
+    qih = state['qh'].to(grid.device, grid.complex_dtype).clone()
+    if perturbation is not None:
+        energy, wavenumbers = perturbation
+        qih = qih + init_randn(energy, wavenumbers, grid, spectral_derivative, seed)[0]
+
+    pih = - qih*spectral_derivative.irsq # Streamfunction (omega = del^2 psi)
+    uih =  -1j*spectral_derivative.ky*pih # u velocity (- d psi/ dy)
+    vih = 1j*spectral_derivative.kr*pih  # v velocity (d psi/ dx)
+    ## Keep the background flow of the parent run
+    uih[...,0,0] = state['u_sol_h_IC']
+    vih[...,0,0] = state['v_sol_h_IC']
+
+    t_start = state['t0'] + state.get('t_elapsed', state['it_count']*state['dt'])
+    return (qih, pih, uih, vih), t_start
+
+
+def resample_state(state, spectral_derivative):
+    """
+    Solver state (Simulation.state_dict) on the grid of spectral_derivative: the spectral vorticity and the
+    integrator history (every [..., Ny, Nx//2+1] spectral field of the state) are zero-padded onto a finer grid
+    or truncated onto a coarser one, and dealiased. The background mean velocities carry over unchanged.
+    The domain size cannot change.
+    """
+    grid = spectral_derivative.grid
+    shape = (state['Ny'], state['Nx']//2 + 1)
+    mask = spectral_derivative.dealias_mask(1/3)
+    resampled = dict(state, Nx=grid.Nx, Ny=grid.Ny)
+    for name, value in state.items():
+        if torch.is_tensor(value) and value.is_complex() and value.dim() >= 2 and tuple(value.shape[-2:]) == shape:
+            value = value.to(grid.device, grid.complex_dtype)
+            resampled[name] = resample(value, grid.Ny, grid.Nx).masked_fill_(mask, 0)
+    return resampled
@@ -0,0 +1,104 @@
+import os
+import torch
+from Output.writers import NpyWriter
+from Plotting.plots import energy_enstrophy_spectra
+
+### In-loop diagnostics computed from the spectral state (no extra FFTs)
+# Domain integrals use Parseval's identity on the rfft half-plane: the kx > 0 columns stand for
+# two modes each, except the Nyquist column of an even grid.
+
+def parseval_weights(spectral_derivative):
+    """ Weight of every rfft mode in a sum over the full spectrum. """
+    grid = spectral_derivative.grid
+    w = torch.full((1, spectral_derivative.dk), 2.0, device=spectral_derivative.device)
+    w[0, 0] = 1.0
+    if grid.Nx % 2 == 0:
+        w[0, -1] = 1.0
+    return spectral_derivative.local_columns(w)
+
+def energy_enstrophy(qh, spectral_derivative, u_mean=0, v_mean=0, weights=None):
+    """
+    Domain-integrated kinetic energy 1/2 int (u^2 + v^2) and enstrophy 1/2 int q^2 of
+    spectral vorticity fields [..., Ny, Nx//2+1], including the background flow u_mean, v_mean.
+    """
+    grid = spectral_derivative.grid
+    weights = parseval_weights(spectral_derivative) if weights is None else weights
+    area = grid.Lx * grid.Ly
+    q2 = torch.abs(qh)**2 * weights
+    enstrophy = 0.5 * area * q2.sum(dim=(-2, -1))
+    energy = 0.5 * area * ((q2 * spectral_derivative.irsq).sum(dim=(-2, -1))
+                           + torch.abs(torch.as_tensor(u_mean))**2 + torch.abs(torch.as_tensor(v_mean))**2)
+    return energy, enstrophy
+
+def cfl_number(max_velocity, grid, dt):
+    """ Advective CFL number dt (max|u|/dx + max|v|/dy) from the maxima of |u| and |v|. """
+    return dt * (max_velocity[..., 0] / grid.dx + max_velocity[..., 1] / grid.dy)
+
+
+class Diagnostics:
+    """
+    Simulation monitor appending energy, enstrophy and the CFL number of the last step to a csv
+    time series every `interval` steps, and optionally the energy and enstrophy spectra to an
+    append-only .npy of shape [n, (N,) 2, n_k].
+    """
+    tracks_velocity = True # (the Jacobian records max|u| and max|v| on the steps of the CFL number)
+
+    def __init__(self, path, interval=64, spectra=False):
+        self.path = path
+        self.interval = interval
+        self.spectra_writer = NpyWriter(os.path.splitext(path)[0] + '_spectra.npy') if spectra else None
+        self.file = None
+        self.weights = None
+
+    def start(self, simulation):
+        """ Called before the time loop: opens the file (appending after a restart). """
+        self.weights = parseval_weights(simulation.spectral_derivative)
+        # In a distributed run every process computes its part, rank 0 writes
+        self.root = simulation.is_root
+        if not self.root:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        resume = simulation.it_count > 0 and os.path.exists(self.path)
+        if resume:
+            # Drop rows written after the checkpoint we restarted from
+            with open(self.path) as f:
+                lines = f.readlines()
+            lines = lines[:1] + [l for l in lines[1:] if int(l.split(',')[0]) <= simulation.it_count]
+            with open(self.path, 'w') as f:
+                f.writelines(lines)
+            # (a run that had not written spectra yet, or ran without them, starts a new spectra file)
+            if self.spectra_writer is not None and os.path.exists(self.spectra_writer.path):
+                self.spectra_writer.resume(simulation.it_count // self.interval)
+        self.file = open(self.path, 'a' if resume else 'w')
+        if not resume:
+            self.file.write('step,time,member,energy,enstrophy,cfl\n')
+
+    def __call__(self, simulation):
+        sd = simulation.spectral_derivative
+        u_mean, v_mean = (simulation.u_sol_h_IC, simulation.v_sol_h_IC) if sd.has_kx0 else (0, 0)
+        energy, enstrophy = simulation.all_reduce(torch.stack(torch.broadcast_tensors(
+            *energy_enstrophy(simulation.qh, sd, u_mean, v_mean, self.weights))))
+        cfl = cfl_number(simulation.nonlinear_operator.max_velocity, simulation.grid, simulation.integrator.dt)
+        step = simulation.it_count
+        time = simulation.time
+        if self.root:
+            rows = torch.stack(torch.broadcast_tensors(energy, enstrophy, cfl), dim=-1).reshape(-1, 3).tolist()
+            for member, (e, z, c) in enumerate(rows):
+                self.file.write(f'{step},{time:.8g},{member},{e:.10e},{z:.10e},{c:.6e}\n')
+            self.file.flush()
+
+        if self.spectra_writer is not None:
+            k, ek, zk = energy_enstrophy_spectra(simulation.qh, sd)
+            spectra = simulation.all_reduce(torch.stack([ek, zk], dim=-2))
+            if self.root:
+                self.spectra_writer.write(self.spectra_writer.count, spectra)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.spectra_writer is not None:
+            self.spectra_writer.close()
+
+    def __repr__(self):
+        return f"Diagnostics(path={self.path}, interval={self.interval}, spectra={self.spectra_writer is not None})"
@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import torch
+from Output.writers import NpyWriter, BackgroundWriter
+from Operators.observation import ObservationOperator
+
+### Sparse observations (sensor time series) streamed during the run
+# The fields at a set of points are sampled every `interval` steps, independently of the snapshots,
+# and appended to small .npy files next to the run's results:
+#   <path>.npy         [n_samples, (N,) len(fields), n_points] values,
+#   <path>_times.npy   [n_samples, 2] step and time of every sample,
+#   <path>_points.npy  [n_points, 2] (x, y) of the points.
+
+
+class Observations:
+    """
+    Simulation monitor evaluating fields (out of q, p, u, v) at points [P, 2] every `interval` steps with
+    an Operators.observation.ObservationOperator (method: auto, spectral or interp; order: cubic or linear)
+    and streaming them to path (.npy, written by rank 0 from a background thread, in the storage dtype).
+    """
+    def __init__(self, path, points, interval=1, fields=('q', 'u', 'v'), method='auto', order='cubic', dtype='float32'):
+        self.path = path
+        self.points = torch.as_tensor(points, dtype=torch.float64).reshape(-1, 2)
+        self.interval = interval
+        self.fields = tuple(fields)
+        self.method = method
+        self.order = order
+        self.dtype = dtype
+        root = os.path.splitext(path)[0]
+        self.times_path = root + '_times.npy'
+        self.points_path = root + '_points.npy'
+        self.operator = None
+        self.writer = None
+        self.times = None
+
+    def start(self, simulation):
+        """ Called before the time loop: builds the operator and opens the files (appending after a restart). """
+        self.operator = ObservationOperator(simulation.spectral_derivative, self.points, self.fields, self.method, self.order)
+        self.root = simulation.is_root
+        if not self.root:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        np.save(self.points_path, self.points.numpy())
+        self.writer = BackgroundWriter(NpyWriter(self.path, self.dtype))
+        self.times = NpyWriter(self.times_path, 'float64')
+        if simulation.it_count > 0 and os.path.exists(self.path):
+            # Drop samples taken after the checkpoint we restarted from
+            count = simulation.it_count // self.interval
+            self.writer.resume(count)
+            self.times.resume(count)
+
+    def __call__(self, simulation):
+        sd = simulation.spectral_derivative
+        u_mean, v_mean = (simulation.u_sol_h_IC, simulation.v_sol_h_IC) if sd.has_kx0 else (0, 0)
+        values = self.operator(simulation.qh, u_mean, v_mean)
+        if self.operator.method == 'spectral':
+            # (every process holds some of the columns)
+            values = simulation.all_reduce(values)
+        if self.root:
+            self.writer.write(self.writer.count, values)
+            self.times.write(self.times.count, np.array([simulation.it_count, simulation.time]))
+
+    def close(self):
+        for writer in (self.writer, self.times):
+            if writer is not None:
+                writer.close()
+        self.writer = self.times = None
+
+    def __repr__(self):
+        return (f"Observations(path={self.path}, points={len(self.points)}, interval={self.interval}, "
+                f"fields={self.fields}, method={self.operator.method if self.operator else self.method})")
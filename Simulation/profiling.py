@@ -0,0 +1,157 @@
+import time
+import datetime
+import contextlib
+import torch
+
+### Instrumentation of the time loop
+# Simulation and NonlinearOperator wrap their phases in `with self.timers('name'):`. By default
+# timers are disabled and hand out one shared no-op context, so the instrumentation costs about
+# a microsecond per step. Phases nest: step > jacobian > fft, dealias; step > forcing.
+
+_NO_TIMING = contextlib.nullcontext()
+
+
+class _Phase:
+    __slots__ = ('timers', 'name', 'start')
+
+    def __init__(self, timers, name):
+        self.timers = timers
+        self.name = name
+
+    def __enter__(self):
+        self.timers.synchronize()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timers.synchronize()
+        self.timers.add(self.name, time.perf_counter() - self.start)
+
+
+class PhaseTimers:
+    """
+    Accumulated wall time and call count per phase. On CUDA devices the device is synchronized at
+    phase boundaries when enabled (so the times are those of the kernels, at the cost of the overlap).
+    """
+    def __init__(self, enabled=True, device=None):
+        self.enabled = enabled
+        self.cuda = device is not None and torch.device(device).type == 'cuda'
+        self.totals = {}
+        self.counts = {}
+
+    def __call__(self, name):
+        return _Phase(self, name) if self.enabled else _NO_TIMING
+
+    def synchronize(self):
+        if self.cuda:
+            torch.cuda.synchronize()
+
+    def add(self, name, seconds):
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def summary(self, wall_time=None):
+        """ Table of the phases (slowest first), with the share of wall_time if given. """
+        lines = [f"{'phase':<12}{'calls':>10}{'total [s]':>12}{'per call [ms]':>15}" + ('{:>9}'.format('share') if wall_time else '')]
+        for name, total in sorted(self.totals.items(), key=lambda item: -item[1]):
+            line = f"{name:<12}{self.counts[name]:>10}{total:>12.3f}{1e3*total/self.counts[name]:>15.3f}"
+            if wall_time:
+                line += f"{100*total/wall_time:>8.1f}%"
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return f"PhaseTimers(enabled={self.enabled}, phases={list(self.totals)})"
+
+NO_TIMERS = PhaseTimers(enabled=False)
+
+
+def _format_seconds(seconds):
+    return str(datetime.timedelta(seconds=int(seconds))) if seconds == seconds and seconds != float('inf') else '?'
+
+
+class Progress:
+    """
+    Simulation monitor printing steps/s, simulated time and the ETA every `interval` steps.
+    With timers=True it also enables the phase timers of the simulation and prints their summary at the end.
+    """
+    def __init__(self, interval=1024, timers=False, log=print):
+        self.interval = interval
+        self.timers = timers
+        self.log = log
+        self.simulation = None
+
+    def start(self, simulation):
+        self.simulation = simulation
+        if self.timers:
+            simulation.timers = PhaseTimers(True, simulation.device)
+            simulation.nonlinear_operator.timers = simulation.timers
+        self.t_end = simulation.t0 + (simulation.steps - 1)*simulation.dt
+        self.wall_start = self.wall_last = time.perf_counter()
+        self.step_start = self.step_last = simulation.it_count
+        self.time_last = simulation.time
+
+    def __call__(self, simulation):
+        if not simulation.is_root:
+            return
+        now = time.perf_counter()
+        wall = now - self.wall_last
+        steps_per_s = (simulation.it_count - self.step_last) / wall
+        # ETA from the simulated time per wall second (also valid with an adaptive dt)
+        rate = (simulation.time - self.time_last) / wall
+        eta = (self.t_end - simulation.time) / rate if rate > 0 else float('inf')
+        self.log(f"step {simulation.it_count} t={simulation.time:.6g}/{self.t_end:.6g}: "
+                 f"{steps_per_s:.2f} steps/s, ETA {_format_seconds(eta)}")
+        self.wall_last, self.step_last, self.time_last = now, simulation.it_count, simulation.time
+
+    def close(self):
+        if self.simulation is None or not self.simulation.is_root:
+            return
+        wall = time.perf_counter() - self.wall_start
+        steps = self.simulation.it_count - self.step_start
+        self.log(f"{steps} steps in {_format_seconds(wall)} ({steps/wall if wall > 0 else 0:.2f} steps/s)")
+        if self.timers:
+            self.log(self.simulation.timers.summary(wall))
+
+    def __repr__(self):
+        return f"Progress(interval={self.interval}, timers={self.timers})"
+
+
+class TraceWindow:
+    """
+    Simulation monitor recording a torch.profiler trace of steps [start, stop) and exporting it
+    (Chrome trace format, viewable in chrome://tracing or Perfetto) to path.
+    """
+    interval = 1
+
+    def __init__(self, start, stop, path):
+        self.start_step, self.stop_step = start, stop
+        self.path = path
+        self.profiler = None
+
+    def start(self, simulation):
+        if simulation.it_count >= self.start_step:
+            self._begin(simulation)
+
+    def _begin(self, simulation):
+        if self.profiler is not None or simulation.it_count >= self.stop_step:
+            return
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if simulation.device.type == 'cuda':
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self.profiler = torch.profiler.profile(activities=activities)
+        self.profiler.__enter__()
+
+    def __call__(self, simulation):
+        if simulation.it_count == self.start_step:
+            self._begin(simulation)
+        elif simulation.it_count >= self.stop_step:
+            self.close()
+
+    def close(self):
+        if self.profiler is not None:
+            self.profiler.__exit__(None, None, None)
+            self.profiler.export_chrome_trace(self.path)
+            self.profiler = None
+
+    def __repr__(self):
+        return f"TraceWindow(steps={self.start_step}:{self.stop_step}, path={self.path})"
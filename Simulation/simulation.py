@@ -1,16 +1,33 @@
 import torch
 import numpy as np
 import math
-from tqdm import tqdm
 from Operators.spectral_conversion import to_physical, to_spectral, dealias
-from Time_marching.imex_schemes import backward_euler, CN2, AB2
+from Time_marching.integrators import make_integrator
+from Time_marching.adaptive import CFLController
+from Output.writers import MemoryWriter, EnsembleWriter
+from Output.spectral import pack_spectral
+from Simulation.checkpoint import save_checkpoint, load_checkpoint
+from Simulation.diagnostics import cfl_number
+from Simulation.profiling import NO_TIMERS
 
 
 class Simulation:
+    is_root = True # Process that writes output (always, except for the other processes of a distributed run)
+
     def __init__(self, grid, pde_params, spectral_derivative, linear_operator, nonlinear_operator, initial_condition, time_params,
-                 forcing_params, forcing=None):
+                 forcing_params, forcing=None, writer=None, checkpoint_path=None, monitors=()):
         """
         Initialize the simulation parameters.
+        The solver state, operators and forcing use the precision of the grid (Grid.precision).
+        Spectral ICs with a leading dimension [N, Ny, Nx//2+1] run an ensemble of N members together.
+        Snapshots are passed to writer as they are produced (default: kept in memory, see Output.writers).
+        The solver state is saved to checkpoint_path every time_params.checkpoint_int steps.
+        monitors (e.g. Simulation.diagnostics.Diagnostics) are called every monitor.interval steps;
+        a monitor may end the run early with stop (e.g. Simulation.watchdog.SteadyState), and monitors with
+        tracks_velocity read the velocity maxima of their steps (NonlinearOperator.max_velocity).
+        The time-stepping scheme is time_params.scheme (see Time_marching.integrators, default ab2cn).
+        With time_params.adaptive, dt follows the CFL number (Time_marching.adaptive.CFLController)
+        and steps are shortened to land exactly on the save times save_int*dt.
         """
         self.grid = grid
         self.device = grid.device
@@ -26,96 +43,256 @@ class Simulation:
         self.forcing_params = forcing_params
         self.Nx, self.Ny = grid.Nx, grid.Ny  # Grid resolution
         self.steps = int(self.T / self.dt)  # Number of time steps
-        self.q_sol = torch.zeros([self.Nx, self.Ny, int(self.steps/self.save_interval)+1,4]) # Initialize solution array for all save times
+        self.n_members = initial_condition[0].shape[0] if initial_condition[0].dim() == 3 else None # Ensemble size
+        self.n_saves = int(self.steps/self.save_interval)+1 # Number of save times (including the IC)
+        if writer is None:
+            writer = MemoryWriter(self.Nx, self.Ny, self.n_saves) if self.n_members is None else \
+                EnsembleWriter([MemoryWriter(self.Nx, self.Ny, self.n_saves) for _ in range(self.n_members)])
+        self.writer = writer
         # Assignment of ICs for spectral fields
         qh_temp,ph_temp, uh_temp,vh_temp  = self.initial_condition # Vorticity, Streamfunction, u velocity, v velocity
 
-        # Convert spectral IC fields for physical space and store in solution array
-        self.q_sol[:, :, 0,0] = to_physical(qh_temp)
-        self.q_sol[:, :, 0,1] = to_physical(ph_temp) 
-        self.q_sol[:, :, 0,2] = to_physical(uh_temp) 
-        self.q_sol[:, :, 0,3] = to_physical(vh_temp) 
+        # Convert spectral IC fields for physical space (in the grid precision: the solver state is
+        # built from them, the writers convert the IC snapshot to their storage dtype)
+        self.fields_IC = self.physical_initial_condition(self.initial_condition).to(grid.dtype) # [(N,) 4, Ny, Nx]
         self.t0=0.0
+
+        # Solver state (kept on the object so it can be checkpointed)
+        self.it_count = 0 # Number of completed time steps
+        self.t_elapsed = 0.0 # Time since t0 after it_count steps
+        self.qh = None # Spectral vorticity after it_count steps
+        self.u_sol_h_IC = None # Background flow (mean u and v)
+        self.v_sol_h_IC = None
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = getattr(time_params, 'checkpoint_int', None)
+        self.monitors = list(monitors)
+        self.stop_reason = None # Set by stop to end the time loop after the current step
+        self.timers = NO_TIMERS # Per-phase wall times (see Simulation.profiling, enabled by the Progress monitor)
+
+        # Time integrator (optionally compiled with torch.compile); keeps its own history for checkpoints
+        self.integrator = make_integrator(time_params, self)
+
+        # Adaptive time step (dt_step is the step size of the next step)
+        self.cfl_control = CFLController(time_params, self.integrator.cfl_bounds) if getattr(time_params, 'adaptive', False) else None
+        self.dt_step = self.dt
+
+    @property
+    def time(self):
+        """Current simulation time."""
+        return self.t0 + self.t_elapsed
         
     def time_step(self):
-        """Perform the time-stepping loop."""
-        dt = self.dt
-
-        for it_count in range(self.steps - 1):
-            
-            # Handle initial conditions
-            if it_count == 0:
-                q_sol_h_1 = to_spectral(self.q_sol[:, :, it_count,0].squeeze()).cuda() #Vorticity
-                p_sol_h_1 = to_spectral(self.q_sol[:, :, it_count,1].squeeze()).cuda() #Streamfunction
-                u_sol_h_1 = to_spectral(self.q_sol[:, :, it_count,2].squeeze()).cuda() # u velocity
-                v_sol_h_1 = to_spectral(self.q_sol[:, :, it_count,3].squeeze()).cuda() # v velocity
-                
-                u_sol_h_IC = u_sol_h_1[0,0]
-                v_sol_h_IC = v_sol_h_1[0,0]
-                
+        """Perform the time-stepping loop (continues from self.it_count after a restart)."""
+
+        if self.it_count == 0:
+            self.qh, self.u_sol_h_IC, self.v_sol_h_IC = self.spectral_initial_condition()
+
+            if self.writer.spectral:
+                self.writer.write(0, self.snapshot(self.qh))
             else:
-                q_sol_h_1 = ans
-                p_sol_h_1 = -q_sol_h_1*self.spectral_derivative.irsq
-                u_sol_h_1 = -1j*self.spectral_derivative.ky*p_sol_h_1
-                v_sol_h_1 = 1j*self.spectral_derivative.kr*p_sol_h_1
-                ## Re-set ICs in u and v (background flow)
-                u_sol_h_1[0,0] = u_sol_h_IC
-                v_sol_h_1[0,0] = v_sol_h_IC
-                
-            # Initialize source term
-            source = q_sol_h_1
-              
-            # Compute nonlinear operators (only Jacobian)
-            nlo_jacobian_1=self.nonlinear_operator.jacobian_pq(q_sol_h_1, p_sol_h_1, u_sol_h_1, v_sol_h_1)
-
-            # Time-stepping schemes for nonlinear terms
-            if it_count == 0:
-                source_jacobian = backward_euler(nlo_jacobian_1, dt)
-                if self.forcing:
-                    term_forcing1 = self.forcing(self.grid,self.spectral_derivative,self.forcing_params,self.t0+it_count*dt)
-                    source_forcing = backward_euler(term_forcing1, dt)
-                    
+                self.writer.write(0, self.gather_fields(self.fields_IC))
+
+        self.integrator.start()
+        for monitor in self.monitors:
+            monitor.start(self)
+        # Steps whose velocity maxima are read (monitors with tracks_velocity, e.g. for the CFL number)
+        self.velocity_intervals = [m.interval for m in self.monitors if getattr(m, 'tracks_velocity', False)]
+
+        if self.cfl_control is not None:
+            self._adaptive_loop()
+        else:
+            self._fixed_loop()
+
+        # A run stopped early is checkpointed where it stopped (e.g. to continue or fork from it)
+        if self.stop_reason is not None and self.checkpoint_path:
+            with self.timers('checkpoint'):
+                self.save_checkpoint(self.checkpoint_path)
+
+    def _fixed_loop(self):
+        """Time loop with the fixed step size dt."""
+        for it_count in range(self.it_count, self.steps - 1):
+
+            # Advance self.qh by one time step (recording max|u|, max|v| only if a monitor reads them after it)
+            self.nonlinear_operator.track_velocity = any((it_count + 1) % interval == 0 for interval in self.velocity_intervals)
+            with self.timers('step'):
+                self.integrator.step(self.t0 + it_count*self.dt)
+            self.it_count = it_count + 1
+            self.t_elapsed = self.it_count*self.dt
+
+            # Store the result for every save interval
+            save_index = self.it_count // self.save_interval if self.it_count % self.save_interval == 0 else None
+            self._after_step(save_index)
+            if self.stop_reason is not None:
+                break
+
+    def _adaptive_loop(self):
+        """
+        Time loop with the step size set by the CFL controller. Steps are shortened to end exactly on
+        the save times (multiples of save_int*dt) up to the end time of the fixed-step run.
+        """
+        self.nonlinear_operator.track_velocity = True
+        save_dt = self.save_interval*self.dt
+        t_end = (self.steps - 1)*self.dt
+        tol = 1e-9*self.dt
+        # Save indices are those of the fixed-step run (the same n_saves snapshots); an end time on the
+        # last save time is snapped to it (in floats, e.g. 6*0.05 != 0.3)
+        last_save = (self.steps - 1)//self.save_interval
+        if abs(t_end - last_save*save_dt) <= tol:
+            t_end = last_save*save_dt
+
+        while self.t_elapsed < t_end - tol:
+            # Next save time (or the end time) and the step towards it
+            save_index = math.floor((self.t_elapsed + tol)/save_dt) + 1
+            saving = save_index <= last_save
+            t_target = save_index*save_dt if saving else t_end
+            remaining = t_target - self.t_elapsed
+            if remaining <= self.dt_step*(1 + 1e-9):
+                dt = remaining
+            elif remaining < 2*self.dt_step:
+                dt = remaining/2 # Avoid a very short step before the save time
             else:
-                source_jacobian = AB2(nlo_jacobian_1, nlo_jacobian_2, dt)
-                if self.forcing:
-                    term_forcing1 = self.forcing(self.grid,self.spectral_derivative,self.forcing_params,self.t0+it_count*dt)
-                    source_forcing = AB2(term_forcing1,term_forcing2, dt)
-                    
-            # Compute linear terms
-            source_lin, op_lin = CN2(self.linear_operator,q_sol_h_1,dt)         
-
-            # Update the source term
-            source = source + source_lin + source_jacobian
-            
-            if self.forcing:
-                source = source + source_forcing
-
-            # Apply the linear operator inversion
-            operator = (1 - op_lin).cuda()
-            ans = source / operator
-            
-            # Store term 2 for AB and CN for next timestep
-            nlo_jacobian_2=nlo_jacobian_1
-            if self.forcing:
-                term_forcing2 = term_forcing1
-
-            # Convert back to physical space and store the result for every save interval
-            if (it_count+1) % self.save_interval == 0:
-                save_index = (it_count + 1) // self.save_interval
-                qh_temp = ans
-                ph_temp = -qh_temp*self.spectral_derivative.irsq
-                uh_temp = -1j*self.spectral_derivative.ky*ph_temp
-                vh_temp = 1j*self.spectral_derivative.kr*ph_temp
-                ## Re-set ICs in u and v (background flow)
-                uh_temp[0,0] = u_sol_h_IC
-                vh_temp[0,0] = v_sol_h_IC
-                self.q_sol[:, :, save_index,0] = to_physical(qh_temp)
-                self.q_sol[:, :, save_index,1] = to_physical(ph_temp)
-                self.q_sol[:, :, save_index,2] = to_physical(uh_temp)
-                self.q_sol[:, :, save_index,3] = to_physical(vh_temp)
-                
+                dt = self.dt_step
+
+            with self.timers('step'):
+                self.integrator.set_dt(dt)
+                self.integrator.step(self.time)
+            self.it_count += 1
+            landed = dt == remaining
+            self.t_elapsed = t_target if landed else self.t_elapsed + dt
+
+            # Next step size from the CFL number of the controller's dt at the velocities of this step
+            cfl = float(cfl_number(self.nonlinear_operator.max_velocity, self.grid, self.dt_step).max())
+            self.dt_step = self.cfl_control(self.dt_step, cfl)
+
+            self._after_step(save_index if landed and saving else None)
+            if self.stop_reason is not None:
+                break
+
+    def stop(self, reason):
+        """Ends the time loop after the current step (called by monitors, on every process of a distributed run)."""
+        self.stop_reason = reason
+
+    def _after_step(self, save_index):
+        """Snapshot (when save_index is given), monitors and checkpoint after a completed step."""
+        if save_index is not None:
+            with self.timers('snapshot'):
+                fields = self.snapshot(self.qh)
+            with self.timers('write'):
+                self.writer.write(save_index, fields)
+
+        # In-loop monitors (diagnostics, ...)
+        for monitor in self.monitors:
+            if self.it_count % monitor.interval == 0:
+                with self.timers('monitors'):
+                    monitor(self)
+
+        # Periodic checkpoint of the full solver state
+        if self.checkpoint_path and self.checkpoint_interval and self.it_count % self.checkpoint_interval == 0:
+            with self.timers('checkpoint'):
+                self.save_checkpoint(self.checkpoint_path)
+
+    def physical_initial_condition(self, initial_condition):
+        """Physical q, p, u, v [(N,) 4, Ny, Nx] of the spectral ICs."""
+        return torch.stack([to_physical(field) for field in initial_condition], dim=-3)
+
+    def gather_fields(self, fields):
+        """Physical fields of the whole grid for the writer (those of this process in a serial run)."""
+        return fields
+
+    def spectral_initial_condition(self):
+        """Spectral vorticity and background flow (mean u and v) of the ICs, on the simulation device."""
+        q_sol_h_1 = to_spectral(self.fields_IC[...,0,:,:].to(self.device)) #Vorticity
+        u_sol_h_1 = to_spectral(self.fields_IC[...,2,:,:].to(self.device)) # u velocity
+        v_sol_h_1 = to_spectral(self.fields_IC[...,3,:,:].to(self.device)) # v velocity
+        return q_sol_h_1, u_sol_h_1[...,0,0].clone(), v_sol_h_1[...,0,0].clone()
+
+    def all_reduce(self, x, op='sum'):
+        """Sum (or max) of x over the processes of a distributed run (see Distributed.simulation)."""
+        return x
+
+    def rhs(self, qh, t, out):
+        """Nonlinear terms N(q, t) of dq/dt = L q + N: Jacobian plus forcing, written into out."""
+        with self.timers('jacobian'):
+            self.nonlinear_operator.jacobian(qh, self.u_sol_h_IC, self.v_sol_h_IC, out)
+        if self.forcing:
+            with self.timers('forcing'):
+                out.add_(self.forcing(self.grid,self.spectral_derivative,self.forcing_params,t))
+        return out
+
+    def snapshot(self, qh):
+        """Snapshot handed to the writer: physical fields, or packed spectral vorticity for spectral writers."""
+        if self.writer.spectral:
+            return pack_spectral(qh, self.u_sol_h_IC, self.v_sol_h_IC, self.spectral_derivative.dealias_mask(1/3))
+        return self.physical_fields(qh)
+
+    def physical_fields(self, qh):
+        """Physical q, p, u, v of a spectral vorticity, stacked as [(N,) 4, Ny, Nx]."""
+        ph = -qh*self.spectral_derivative.irsq
+        uh = -1j*self.spectral_derivative.ky*ph
+        vh = 1j*self.spectral_derivative.kr*ph
+        ## Re-set ICs in u and v (background flow)
+        uh[...,0,0] = self.u_sol_h_IC
+        vh[...,0,0] = self.v_sol_h_IC
+        return torch.stack([to_physical(qh), to_physical(ph), to_physical(uh), to_physical(vh)], dim=-3)
+
+    def state_dict(self):
+        """Full solver state needed to continue the integration exactly (including the integrator history)."""
+        return {'it_count': self.it_count, 't0': self.t0, 't_elapsed': self.t_elapsed, 'dt': self.dt, 'dt_step': self.dt_step,
+                'precision': self.grid.precision, 'Nx': self.Nx, 'Ny': self.Ny, 'n_written': self.writer.count,
+                'qh': self.qh, 'u_sol_h_IC': self.u_sol_h_IC, 'v_sol_h_IC': self.v_sol_h_IC,
+                'monitors': {key: m.state_dict() for key, m in self._stateful_monitors()},
+                **self.integrator.state_dict()}
+
+    def load_state_dict(self, state):
+        """Restores the solver state saved by state_dict."""
+        if (state['Nx'], state['Ny'], state['dt']) != (self.Nx, self.Ny, self.dt):
+            raise ValueError("Checkpoint grid or time step does not match the simulation. Check config.")
+        self.it_count = state['it_count']
+        self.t0 = state['t0']
+        self.t_elapsed = state.get('t_elapsed', self.it_count*self.dt)
+        self.dt_step = state.get('dt_step', self.dt)
+        # (a checkpoint written in another precision continues in the precision of this run)
+        for name in ('qh', 'u_sol_h_IC', 'v_sol_h_IC'):
+            setattr(self, name, state[name].to(self.device, self.grid.complex_dtype))
+        self.integrator.load_state_dict(state)
+        # Monitors with an accumulated state (e.g. Simulation.statistics.Statistics) continue it
+        for key, monitor in self._stateful_monitors():
+            if key in state.get('monitors', {}):
+                monitor.load_state_dict(state['monitors'][key])
+        # Snapshots written after the checkpoint are discarded and recomputed
+        self.writer.resume(state['n_written'])
+
+    def _stateful_monitors(self):
+        """
+        (key, monitor) of the monitors with a checkpointed state. The key is the monitor's name attribute,
+        or its class name numbered by occurrence (Statistics, Statistics.1, ...) when a class is attached twice.
+        """
+        counts = {}
+        for monitor in self.monitors:
+            if not hasattr(monitor, 'state_dict'):
+                continue
+            key = getattr(monitor, 'name', None)
+            if key is None:
+                key = type(monitor).__name__
+                counts[key] = counts.get(key, 0) + 1
+                key = key if counts[key] == 1 else f"{key}.{counts[key] - 1}"
+            yield key, monitor
+
+    def save_checkpoint(self, path):
+        """Atomically writes the solver state (snapshots written so far are flushed first)."""
+        self.writer.flush()
+        save_checkpoint(self.state_dict(), path)
+
+    def load_checkpoint(self, path):
+        """Resumes from a checkpoint written by save_checkpoint."""
+        self.load_state_dict(load_checkpoint(path, self.device))
 
     def run(self):
         """Run the full simulation."""
-        self.time_step()
-        return self.q_sol  # Return the solution array
+        try:
+            self.time_step()
+        finally:
+            self.writer.close()
+            for monitor in self.monitors:
+                monitor.close()
+        return self.writer.result()  # Return the solution array (or a view of the saved file)
@@ -0,0 +1,63 @@
+from Grid.grid import Grid
+from Operators.operators import SpectralDerivatives, LinearOperator, NonlinearOperator
+from Initial_forcing.ics import init_randn
+from Initial_forcing.forcing import make_forcing
+from Output.writers import NullWriter
+from Simulation.simulation import Simulation
+from Simulation.checkpoint import save_checkpoint, resample_state, fork_initial_condition
+
+### Multi-resolution spin-up
+# The transient towards statistically steady turbulence is integrated on a coarse grid. Its final
+# state (vorticity, integrator history and background flow) is zero-padded onto the target grid,
+# where the run continues; the fine integration only has to fill in the small scales.
+# spinup_params: Nx, Ny (coarse grid), T (spin-up time, 0 disables it) and dt (default: the run's dt
+# scaled with the grid spacing, i.e. the same CFL number).
+
+
+def spinup_time_params(spinup_params, time_params, grid):
+    """ Time parameters of the coarse run (a subclass of the run's time_params: same scheme and options). """
+    dt = getattr(spinup_params, 'dt', None) or time_params.dt * grid.Nx / spinup_params.Nx
+    steps = round(spinup_params.T / dt)
+    return type('spinup_time_params', (time_params,), {
+        'dt': dt,
+        'T': (steps + 1.5) * dt, # Simulation runs int(T/dt) - 1 steps
+        'save_int': steps + 1, # Only the IC snapshot
+        'checkpoint_int': None})
+
+
+def spin_up(spinup_params, grid, pde_params, ic_params, time_params, forcing_params, checkpoint_path=None, monitors=()):
+    """
+    Integrates the wavenumber ICs of ic_params on the coarse grid of spinup_params for spinup_params.T.
+    Returns the final solver state (Simulation.state_dict), also saved to checkpoint_path if given.
+    The state can be continued on grid with continue_from (or forked onto any grid with --fork_from).
+    """
+    coarse = Grid(grid.Lx, grid.Ly, spinup_params.Nx, spinup_params.Ny, grid.device, grid.precision)
+    sd = SpectralDerivatives(coarse)
+    ic = init_randn(ic_params.energy, ic_params.wavenumbers, coarse, sd, ic_params.seed)
+    sim = Simulation(coarse, pde_params, sd, LinearOperator(sd, pde_params), NonlinearOperator(sd, pde_params), ic,
+                     spinup_time_params(spinup_params, time_params, grid), forcing_params, make_forcing(forcing_params),
+                     NullWriter(), monitors=monitors)
+    sim.run()
+    state = sim.state_dict()
+    if checkpoint_path:
+        save_checkpoint(state, checkpoint_path)
+    return state
+
+
+def continue_from(state, grid, spectral_derivative):
+    """
+    Initial condition and start time of a run on grid continuing from a state of another resolution
+    (the state is resampled, see Simulation.checkpoint.resample_state). Returns (ICs, t_start, state);
+    pass the resampled state to load_history after creating the Simulation to keep the integrator history.
+    """
+    state = resample_state(state, spectral_derivative)
+    ic, t_start = fork_initial_condition(state, grid, spectral_derivative)
+    return ic, t_start, state
+
+
+def load_history(simulation, state):
+    """
+    Continues the integrator history of a resampled state (e.g. the AB2 history) instead of restarting it.
+    The step size may differ from the coarse run's: AB2 then uses its variable-step weights.
+    """
+    simulation.integrator.load_state_dict(state)
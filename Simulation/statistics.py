@@ -0,0 +1,138 @@
+import os
+import numpy as np
+import torch
+from Plotting.plots import energy_enstrophy_spectra
+
+### Streaming turbulence statistics
+# Time averages are accumulated in the loop instead of from stored snapshots: the running mean and
+# variance of q, p, u, v (Welford updates), of their zonal-mean profiles (mean over x, e.g. the jets of
+# beta-plane runs) and the time-averaged energy and enstrophy spectra. The memory cost is a few fields,
+# whatever the number of samples, and the samples are not tied to the snapshot interval save_int.
+# The accumulators are in float64 and part of the solver checkpoint (Simulation.state_dict).
+
+
+class Welford:
+    """ Running mean and sum of squared deviations of equally shaped samples (Welford's update). """
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, x):
+        x = x.to(torch.float64)
+        if self.mean is None:
+            self.mean = torch.zeros_like(x)
+            self.m2 = torch.zeros_like(x)
+        self.count += 1
+        delta = x - self.mean
+        self.mean.add_(delta / self.count)
+        self.m2.add_(delta * (x - self.mean))
+
+    def variance(self):
+        """ Unbiased sample variance (zero for a single sample). """
+        return self.m2 / max(self.count - 1, 1)
+
+    def state_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    def load_state_dict(self, state):
+        self.count, self.mean, self.m2 = state['count'], state['mean'], state['m2']
+
+
+class Statistics:
+    """
+    Simulation monitor sampling the flow every `interval` steps within the averaging window
+    start <= t <= end (simulation times; end None is the end of the run). At the end of the run the
+    statistics are saved to path (.npz, rank 0) with:
+    mean, var: [(N,) 4, Ny, Nx] of q, p, u, v; zonal_mean, zonal_var: [(N,) 4, Ny] of their mean over x;
+    k, ek, zk: time-averaged energy and enstrophy spectra; count, t_first, t_last: the samples averaged.
+    The running values are also available during the run from statistics().
+    """
+    def __init__(self, path=None, interval=64, start=0.0, end=None, spectra=True):
+        self.path = path
+        self.interval = interval
+        self.window = (start, end)
+        self.spectra = spectra
+        self.fields = Welford()
+        self.zonal = Welford()
+        self.ek = None # Running means of the spectra
+        self.zk = None
+        self.k = None
+        self.t_first = None
+        self.t_last = None
+        self.simulation = None
+
+    def start(self, simulation):
+        """ Called before the time loop (the accumulators of a checkpoint are loaded before). """
+        self.simulation = simulation
+
+    def __call__(self, simulation):
+        start, end = self.window
+        time = simulation.time
+        if time < start or (end is not None and time > end):
+            return
+        # Physical fields of the rows held by this process (all of them in a serial run)
+        fields = simulation.physical_fields(simulation.qh)
+        self.fields.update(fields)
+        # Rows are not split in a zonal mean, so every process averages its own rows
+        self.zonal.update(fields.mean(dim=-1))
+
+        if self.spectra:
+            k, ek, zk = energy_enstrophy_spectra(simulation.qh, simulation.spectral_derivative)
+            ek, zk = simulation.all_reduce(torch.stack([ek, zk])).to(torch.float64)
+            if self.ek is None:
+                self.k, self.ek, self.zk = k, torch.zeros_like(ek), torch.zeros_like(zk)
+            self.ek.add_((ek - self.ek) / self.fields.count)
+            self.zk.add_((zk - self.zk) / self.fields.count)
+
+        if self.t_first is None:
+            self.t_first = time
+        self.t_last = time
+
+    def statistics(self):
+        """ Statistics of the samples so far (on this process) as a dict of tensors (empty without samples). """
+        if not self.fields.count:
+            return {}
+        stats = {'count': self.fields.count, 't_first': self.t_first, 't_last': self.t_last,
+                 'mean': self.fields.mean, 'var': self.fields.variance(),
+                 'zonal_mean': self.zonal.mean, 'zonal_var': self.zonal.variance()}
+        if self.ek is not None:
+            stats.update(k=self.k, ek=self.ek, zk=self.zk)
+        return stats
+
+    def state_dict(self):
+        return {'fields': self.fields.state_dict(), 'zonal': self.zonal.state_dict(), 'k': self.k, 'ek': self.ek,
+                'zk': self.zk, 't_first': self.t_first, 't_last': self.t_last}
+
+    def load_state_dict(self, state):
+        self.fields.load_state_dict(state['fields'])
+        self.zonal.load_state_dict(state['zonal'])
+        self.k, self.ek, self.zk = state['k'], state['ek'], state['zk']
+        self.t_first, self.t_last = state['t_first'], state['t_last']
+
+    def save(self, path):
+        """ Writes the statistics to an .npz file (in a distributed run the rows are gathered on rank 0). """
+        stats = self.statistics()
+        if not stats:
+            return
+        decomposition = getattr(self.simulation, 'decomposition', None)
+        if decomposition is not None:
+            # (the zonal profiles are gathered as [..., ny, 1] row slabs)
+            for name in ('mean', 'var'):
+                stats[name] = decomposition.gather_rows(stats[name])
+            for name in ('zonal_mean', 'zonal_var'):
+                stats[name] = decomposition.gather_rows(stats[name][..., None])
+            if not decomposition.is_root:
+                return
+            stats['zonal_mean'], stats['zonal_var'] = stats['zonal_mean'][..., 0], stats['zonal_var'][..., 0]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez(path, **{name: value.cpu().numpy() if torch.is_tensor(value) else np.asarray(value)
+                          for name, value in stats.items()})
+
+    def close(self):
+        if self.path is not None:
+            self.save(self.path)
+
+    def __repr__(self):
+        return (f"Statistics(path={self.path}, interval={self.interval}, window={self.window}, "
+                f"spectra={self.spectra}, samples={self.fields.count})")
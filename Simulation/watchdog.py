@@ -0,0 +1,118 @@
+import torch
+from Simulation.diagnostics import parseval_weights, energy_enstrophy, cfl_number
+
+### Run health checks and early termination
+# Both monitors work on domain integrals of the spectral state (Parseval sums, no extra FFTs), reduced
+# over the processes of a distributed run so that every process takes the same decision.
+# Watchdog aborts a diverging run (e.g. a bad dt/nu combination of a sweep) before it integrates NaNs
+# to the end and renders them; SteadyState ends a run (or a spin-up) once it is statistically stationary.
+
+
+class BlowUpError(RuntimeError):
+    """ Raised by Watchdog when the solution diverges. """
+
+
+def _integrals(simulation, weights):
+    """ Energy and enstrophy [2, (N,)] of the current state, including the background flow. """
+    sd = simulation.spectral_derivative
+    u_mean, v_mean = (simulation.u_sol_h_IC, simulation.v_sol_h_IC) if sd.has_kx0 else (0, 0)
+    return simulation.all_reduce(torch.stack(torch.broadcast_tensors(
+        *energy_enstrophy(simulation.qh, sd, u_mean, v_mean, weights))))
+
+
+class Watchdog:
+    """
+    Simulation monitor raising BlowUpError every `interval` steps if the energy or enstrophy is not
+    finite (NaN or Inf in the state), if the energy grew by more than max_growth times since the
+    previous check, or if the CFL number of the last step exceeds max_cfl ('auto': the limit of the
+    time-stepping scheme, Integrator.max_cfl; None skips the CFL check).
+    In an ensemble any diverging member aborts the run.
+    """
+    def __init__(self, interval=64, max_growth=10.0, max_cfl='auto'):
+        self.interval = interval
+        self.max_growth = max_growth
+        self.max_cfl = max_cfl
+        self.cfl_limit = None # max_cfl of the simulation (set by start)
+        self.tracks_velocity = bool(max_cfl) # (the Jacobian records max|u| and max|v| for the CFL number)
+        self.energy = None # Energy at the previous check
+        self.weights = None
+
+    def start(self, simulation):
+        self.cfl_limit = simulation.integrator.max_cfl if self.max_cfl == 'auto' else self.max_cfl
+        self.weights = parseval_weights(simulation.spectral_derivative)
+        self.energy = None
+
+    def __call__(self, simulation):
+        energy, enstrophy = _integrals(simulation, self.weights)
+        problem = None
+        if not (torch.isfinite(energy).all() and torch.isfinite(enstrophy).all()):
+            problem = "non-finite energy or enstrophy (NaN/Inf in the solution)"
+        elif self.energy is not None and (energy > self.max_growth * self.energy).any():
+            growth = (energy / self.energy).max().item()
+            problem = f"energy grew {growth:.3g}x in {self.interval} steps (limit {self.max_growth:g}x)"
+        cfl = None
+        if self.cfl_limit:
+            cfl = simulation.all_reduce(cfl_number(simulation.nonlinear_operator.max_velocity, simulation.grid,
+                                                   simulation.integrator.dt), 'max')
+            if problem is None and (cfl > self.cfl_limit).any():
+                problem = f"CFL number {cfl.max().item():.3g} above {self.cfl_limit:g}"
+        if problem is not None:
+            diagnostic = f"energy {energy.tolist()}, enstrophy {enstrophy.tolist()}"
+            if cfl is not None:
+                diagnostic += f", CFL {cfl.tolist()}"
+            raise BlowUpError(f"Run diverged at step {simulation.it_count} (t = {simulation.time:.6g}): {problem}; "
+                              f"{diagnostic}. Reduce dt or increase the dissipation.")
+        self.energy = energy
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return f"Watchdog(interval={self.interval}, max_growth={self.max_growth}, max_cfl={self.max_cfl})"
+
+
+class SteadyState:
+    """
+    Simulation monitor stopping the run (Simulation.stop) once energy and enstrophy are statistically
+    stationary: they are sampled every `interval` steps from time start on, and the run stops when the
+    means over the two halves of the last `window` samples differ by less than tol (relative) for both,
+    in every ensemble member. The samples are checkpointed with the solver state.
+    """
+    def __init__(self, interval=64, window=32, tol=1e-2, start=0.0):
+        if window < 2:
+            raise ValueError("Invalid steady-state window (at least 2 samples). Check config.")
+        self.interval = interval
+        self.window = window
+        self.tol = tol
+        self.start_time = start
+        self.samples = [] # Energy and enstrophy [2, (N,)] of the last window samples
+        self.weights = None
+
+    def start(self, simulation):
+        self.weights = parseval_weights(simulation.spectral_derivative)
+
+    def __call__(self, simulation):
+        if simulation.time < self.start_time:
+            return
+        self.samples = (self.samples + [_integrals(simulation, self.weights).to(torch.float64)])[-self.window:]
+        if len(self.samples) < self.window:
+            return
+        samples = torch.stack(self.samples)
+        half = self.window // 2
+        first, second = samples[:half].mean(dim=0), samples[-half:].mean(dim=0)
+        change = (torch.abs(second - first) / torch.abs(second)).max().item()
+        if change < self.tol:
+            simulation.stop(f"steady state: energy and enstrophy changed by {change:.2e} (tol {self.tol:g}) "
+                            f"over the last {self.window} samples")
+
+    def state_dict(self):
+        return {'samples': self.samples}
+
+    def load_state_dict(self, state):
+        self.samples = list(state['samples'])
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return f"SteadyState(interval={self.interval}, window={self.window}, tol={self.tol}, start={self.start_time})"
@@ -0,0 +1,48 @@
+import ast
+import argparse
+
+from Sweep.sweep import Job, sweep_jobs, run_sweep
+
+### Parameter sweep entry point
+# python -m Sweep.run --runs 2721 2722 2723 --threads 2
+# python -m Sweep.run --base 2721 --first 3000 --set pde.mu=0.01,0.02 --set ic.seed=495,496 --out sweep.jsonl
+
+def parse_values(text):
+    """ 'pde.mu=0.01,0.02' -> ('pde.mu', [0.01, 0.02]); values are Python literals (lists too) or plain strings. """
+    key, values = text.split('=', 1)
+    try:
+        return key, list(ast.literal_eval(f'({values},)'))
+    except (ValueError, SyntaxError):
+        return key, values.split(',') # e.g. time.scheme=ab2cn,imex_rk3
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='QG parameter sweep')
+    parser.add_argument('--runs', type=int, nargs='+', default=[], help='Run numbers of existing config files')
+    parser.add_argument('--base', type=int, default=None, help='Config run number the --set values are applied to')
+    parser.add_argument('--first', type=int, default=None, help='Run number of the first generated run')
+    parser.add_argument('--set', dest='values', action='append', default=[], type=parse_values,
+                        help='Parameter values group.name=v1,v2,... (the sweep is their cartesian product)')
+    parser.add_argument('--threads', type=int, default=1, help='Intra-op threads per run')
+    parser.add_argument('--workers', type=int, default=None, help='Concurrent runs (default: cores // threads)')
+    parser.add_argument('--resume', action='store_true', help='Resume runs from their checkpoints')
+    parser.add_argument('--out', default=None, help='JSON-lines file the run records are appended to')
+    args = parser.parse_args(argv)
+
+    jobs = [Job(run, f'Config.Run{run:05d}') for run in args.runs]
+    if args.values:
+        if args.base is None or args.first is None:
+            parser.error('--set needs --base and --first')
+        jobs += sweep_jobs(args.base, args.first, dict(args.values))
+    if not jobs:
+        parser.error('no runs given (--runs or --set)')
+
+    records = run_sweep(jobs, args.threads, args.workers, args.resume, out=args.out)
+    failed = [record['run_number'] for record in records if record['status'] != 'done']
+    print(f"{len(records) - len(failed)} of {len(records)} runs completed" +
+          (f", failed: {' '.join(f'Run{n:05d}' for n in failed)}" if failed else ''))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import itertools
+import importlib
+import traceback
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+### Parameter sweeps
+# A sweep is a list of jobs: a run number and the config it runs, i.e. a config module (Config.RunXXXXX)
+# with optional overrides of its parameters, e.g. {'pde.mu': 0.01, 'ic.seed': 496}.
+# Jobs run on a pool of spawned worker processes with a fixed intra-op thread budget per job. A worker
+# imports the solver once and keeps one Grid and SpectralDerivatives (wavenumbers, dealias masks and
+# spectrum shells) per grid shape, shared by all the jobs on that grid it runs; jobs are ordered by grid
+# so consecutive jobs of a worker share them. A failing job is reported and the sweep continues.
+
+
+class Job:
+    """ Run run_number with the parameters of config (a config module name) and the given overrides. """
+    def __init__(self, run_number, config, overrides=None):
+        self.run_number = run_number
+        self.config = config
+        self.overrides = dict(overrides or {})
+
+    def params(self):
+        """ The config's params with the overrides applied (subclasses of the config classes). """
+        params = importlib.import_module(self.config).params
+        groups = {}
+        for key, value in self.overrides.items():
+            group, name = key.split('.')
+            groups.setdefault(group, {})[name] = value
+        attrs = {group: type(getattr(params, group).__name__, (getattr(params, group),), values)
+                 for group, values in groups.items()}
+        return type('params', (params,), {**attrs, 'run_number': self.run_number})
+
+    def __repr__(self):
+        overrides = ', '.join(f"{k}={v}" for k, v in self.overrides.items())
+        return f"Job(Run{self.run_number:05d}: {self.config}{' with ' + overrides if overrides else ''})"
+
+
+def sweep_jobs(base_run, first_run, values):
+    """
+    Jobs of the cartesian product of parameter values, e.g. {'pde.mu': [0.01, 0.02], 'ic.seed': [495, 496]},
+    on top of the config of base_run, numbered from first_run.
+    """
+    names = list(values)
+    return [Job(first_run + i, f'Config.Run{base_run:05d}', dict(zip(names, combination)))
+            for i, combination in enumerate(itertools.product(*(values[name] for name in names)))]
+
+
+def grid_key(grid_params):
+    """ Jobs with the same key share one Grid and SpectralDerivatives. """
+    return (grid_params.Nx, grid_params.Ny, grid_params.Lx, grid_params.Ly,
+            getattr(grid_params, 'precision', 'float32'), str(getattr(grid_params, 'device', None)))
+
+
+### Worker side
+_OPERATORS = {} # grid_key -> (Grid, SpectralDerivatives) of this worker
+
+def _init_worker(threads):
+    import torch
+    torch.set_num_threads(threads)
+
+
+def shared_operators(grid_params):
+    """ Grid and SpectralDerivatives of a grid (built once per worker, with the dealias mask and shells cached). """
+    key = grid_key(grid_params)
+    if key not in _OPERATORS:
+        from Grid.grid import Grid
+        from Operators.operators import SpectralDerivatives
+        from Utils.device import resolve_device
+        grid = Grid(grid_params.Lx, grid_params.Ly, grid_params.Nx, grid_params.Ny,
+                    resolve_device(getattr(grid_params, 'device', None)), getattr(grid_params, 'precision', 'float32'))
+        spectral_derivative = SpectralDerivatives(grid)
+        spectral_derivative.dealias_mask(1/3)
+        spectral_derivative.shell_index()
+        _OPERATORS[key] = (grid, spectral_derivative)
+    return _OPERATORS[key]
+
+
+def run_job(job, resume=False):
+    """ Runs one job (in a worker). Returns its record; exceptions are reported in the record. """
+    start = time.perf_counter()
+    record = {'run_number': job.run_number, 'config': job.config, 'overrides': job.overrides, 'pid': os.getpid()}
+    log = lambda message: print(f"[Run{job.run_number:05d}] {message}", flush=True)
+    try:
+        from Driver.api import run_simulation
+        from Utils.utils import results_dir
+
+        params = job.params()
+        out_dir = results_dir(job.run_number)
+        os.makedirs(out_dir, exist_ok=True)
+        with open(os.path.join(out_dir, f'sweep_Run{job.run_number:05d}.json'), 'w') as f:
+            json.dump({'config': job.config, 'overrides': job.overrides}, f)
+
+        resume_file = os.path.join(out_dir, f'checkpoint_Run{job.run_number:05d}.pt')
+        sim, _ = run_simulation(params, job.run_number, resume='latest' if resume and os.path.exists(resume_file) else None,
+                                operators=shared_operators(params.grid), plots=False, log=log)
+        record.update(status='done', steps=sim.it_count, time=sim.time, stopped=sim.stop_reason)
+    except Exception as e:
+        log(f"failed: {type(e).__name__}: {e}")
+        record.update(status='failed', error=traceback.format_exc())
+    record['wall_time'] = time.perf_counter() - start
+    return record
+
+
+def _run_tracked(runner, job, resume, running):
+    """ Runs a job (in a worker) with its run number in the shared dict running while it runs. """
+    running[job.run_number] = os.getpid()
+    record = runner(job, resume)
+    running.pop(job.run_number, None)
+    return record
+
+
+### Scheduler
+def run_sweep(jobs, threads=1, workers=None, resume=False, retries=1, out=None, log=print, runner=run_job):
+    """
+    Runs the jobs on workers processes (default: as many as the cores allow with threads per job) and
+    returns their records in job order. When a worker crashes (e.g. killed for memory) the pool breaks:
+    the jobs that were running are resubmitted up to retries times, the jobs still queued behind them
+    are resubmitted without counting an attempt, each on a fresh pool. Records are appended to the
+    JSON-lines file out. runner(job, resume) runs a job in a worker (default: run_job).
+    """
+    from Utils.device import default_num_threads
+    workers = workers or max(1, default_num_threads() // threads)
+    keys = {job.run_number: grid_key(job.params().grid) for job in jobs}
+    pending = sorted(jobs, key=lambda job: keys[job.run_number])
+    log(f"Sweep of {len(jobs)} runs on {len(set(keys.values()))} grids: {workers} workers x {threads} threads")
+    records, attempts = {}, {}
+
+    def finish(record):
+        records[record['run_number']] = record
+        if out:
+            with open(out, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        log(summary(record, len(records), len(jobs)))
+
+    context = mp.get_context('spawn')
+    with context.Manager() as manager:
+        running = manager.dict() # run_number -> pid of the jobs running in the workers
+        while pending:
+            lost = []
+            with ProcessPoolExecutor(min(workers, len(pending)), mp_context=context, initializer=_init_worker,
+                                     initargs=(threads,)) as pool:
+                futures = {pool.submit(_run_tracked, runner, job, resume, running): job for job in pending}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        record = future.result()
+                    except BrokenProcessPool:
+                        lost.append(job)
+                        continue
+                    finish(record)
+
+            # Only the jobs running when the pool broke count an attempt (all of them if none was recorded,
+            # e.g. a worker that died on start-up)
+            crashed = [job for job in lost if job.run_number in running] or lost
+            running.clear()
+            pending = []
+            for job in lost:
+                if job in crashed:
+                    attempts[job.run_number] = attempts.get(job.run_number, 0) + 1
+                    if attempts[job.run_number] > retries:
+                        finish({'run_number': job.run_number, 'config': job.config, 'overrides': job.overrides,
+                                'status': 'failed', 'error': 'Worker process died'})
+                        continue
+                pending.append(job)
+            # Resume the resubmitted jobs from their checkpoints
+            resume = True
+    return [records[job.run_number] for job in jobs]
+
+
+def summary(record, done=None, total=None):
+    count = f"[{done}/{total}] " if done is not None else ''
+    name = f"Run{record['run_number']:05d}"
+    if record['status'] != 'done':
+        error = record['error'].strip().splitlines()[-1]
+        return f"{count}{name} failed: {error}"
+    stopped = f" (stopped early: {record['stopped']})" if record.get('stopped') else ''
+    return f"{count}{name} done: {record['steps']} steps in {record['wall_time']:.1f} s{stopped}"
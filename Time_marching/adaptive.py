@@ -0,0 +1,30 @@
+import math
+
+### Adaptive time step from the advective CFL number
+# dt is only changed when the CFL number leaves [cfl_min, cfl_max], and then reset to cfl_target,
+# so the dt-dependent integrator coefficients are rebuilt rarely.
+
+class CFLController:
+    """
+    Step size control from the CFL number (Simulation.diagnostics.cfl_number) of the last step.
+    Configured from time_params: cfl_bounds (cfl_min, cfl_max; default or None: bounds, the scheme's
+    Integrator.cfl_bounds), cfl_target (default: middle of the bounds), dt_min, dt_max (default: the
+    save interval) and dt_growth, the largest factor dt may grow by at once.
+    """
+    def __init__(self, time_params, bounds=(0.1, 0.2)):
+        self.cfl_min, self.cfl_max = getattr(time_params, 'cfl_bounds', None) or bounds
+        self.cfl_target = getattr(time_params, 'cfl_target', 0.5*(self.cfl_min + self.cfl_max))
+        self.dt_min = getattr(time_params, 'dt_min', 0.0)
+        self.dt_max = getattr(time_params, 'dt_max', None) or time_params.save_int*time_params.dt
+        self.dt_growth = getattr(time_params, 'dt_growth', 1.5)
+
+    def __call__(self, dt, cfl):
+        """ Step size for the next step, given the CFL number cfl of a step of size dt. """
+        if self.cfl_min <= cfl <= self.cfl_max or not math.isfinite(cfl):
+            return dt
+        dt_new = dt*self.dt_growth if cfl == 0 else dt*self.cfl_target/cfl
+        return min(max(dt_new, self.dt_min), dt*self.dt_growth, self.dt_max)
+
+    def __repr__(self):
+        return (f"CFLController(cfl_bounds=({self.cfl_min}, {self.cfl_max}), cfl_target={self.cfl_target}, "
+                f"dt_min={self.dt_min}, dt_max={self.dt_max})")
@@ -9,4 +9,20 @@ def CN2(linear_operator,input_field,dt):
     return 0.5*dt*linear_operator.apply(input_field),0.5*dt*linear_operator.Lc
 
 def AB2(non_linear_term1,non_linear_term2,dt):
-    return (3/2)*(dt)*non_linear_term1  - (1/2)*(dt)*non_linear_term2
\ No newline at end of file
+    return (3/2)*(dt)*non_linear_term1  - (1/2)*(dt)*non_linear_term2
+
+### In-place variants used by the time loop: the explicit terms are added to source
+def backward_euler_(source,non_linear_term,dt):
+    return source.add_(non_linear_term, alpha=dt)
+
+def AB2_(source,non_linear_term1,non_linear_term2,dt):
+    return source.add_(non_linear_term1, alpha=(3/2)*dt).sub_(non_linear_term2, alpha=(1/2)*dt)
+
+def CN2_factors(linear_operator,dt):
+    # Explicit (1 + dt/2 L) and implicit (1 - dt/2 L) CN factors, computed once per dt
+    return 1 + 0.5*dt*linear_operator.Lc, 1 - 0.5*dt*linear_operator.Lc
+
+def AB2_variable_(source,non_linear_term1,non_linear_term2,dt,dt_prev):
+    # Variable-step AB2 with step ratio w = dt/dt_prev: dt ((1 + w/2) N1 - (w/2) N2)
+    w = dt/dt_prev
+    return source.add_(non_linear_term1, alpha=(1 + w/2)*dt).sub_(non_linear_term2, alpha=(w/2)*dt)
@@ -0,0 +1,248 @@
+import math
+import torch
+from Time_marching.imex_schemes import backward_euler_, AB2_, AB2_variable_, CN2_factors
+
+### Time integrators for dq/dt = L q + N(q, t)
+# L is the diagonal linear operator (LinearOperator.Lc: viscosity, drag and beta) and
+# N = Jacobian + forcing, evaluated by Simulation.rhs. Selected with time_params.scheme.
+#
+# Stability limits, in the CFL number dt * (max|u|/dx + max|v|/dy) of Simulation.diagnostics.cfl_number
+# (the number reported by Diagnostics and checked by Watchdog and the adaptive CFLController). On the
+# 2/3-dealiased grid the largest advective frequency is at most dt * (max|u| kx_max + max|v| ky_max)
+# = (2 pi/3) CFL, so the imaginary-axis limits of the schemes are divided by 2 pi/3 ~ 2.1. The linear
+# term is treated implicitly or exactly and adds no restriction:
+# - ab2cn:    AB2 + Crank-Nicolson, 1 RHS evaluation per step. AB2 is weakly unstable for purely
+#             advective modes; in practice keep the CFL below ~0.2.
+# - imex_rk3: low-storage RK3 + Crank-Nicolson per substep, 3 evaluations per step. Stable for CFL
+#             up to sqrt(3)/(2 pi/3) ~ 0.83 (use ~0.55 in practice). Third order in N, second order in L.
+# - etdrk4:   exponential time differencing RK4 (Cox & Matthews), 4 evaluations per step. L is
+#             integrated exactly; stable for CFL up to ~2.8/(2 pi/3) ~ 1.3 (use ~0.9 in practice). Fourth order.
+# Each Integrator class holds the default bounds of the adaptive step (cfl_bounds, within the practical
+# limit) and the CFL number at which the Watchdog aborts a run (max_cfl, about 1.5x the stability limit;
+# 1.0 for ab2cn, which has no stable advective range but is damped by the dissipation in practice).
+
+
+class Integrator:
+    """
+    Base class. step(t) advances simulation.qh by one dt from time t.
+    The dt-dependent coefficients are built by coefficients(dt); set_dt switches between them
+    (the last few sets are cached, so alternating step sizes are cheap).
+    Integrators with history expose it through state_dict/load_state_dict for checkpoints.
+    """
+    evaluations = 1 # RHS evaluations per step
+    cfl_bounds = (0.1, 0.2) # Default CFL bounds of the adaptive step (see the stability limits above)
+    max_cfl = 1.0 # Default CFL number at which Simulation.watchdog.Watchdog aborts the run
+    cache_size = 4 # Coefficient sets kept for set_dt
+
+    def __init__(self, simulation, compile=False):
+        self.sim = simulation
+        self.dt = simulation.dt
+        self._coefficients = {}
+        self.advance = torch.compile(self._advance) if compile else self._advance
+
+    def start(self):
+        """ Called before the time loop (after a restart, too): allocates buffers and coefficients. """
+        self._coefficients = {}
+        self._use(self.dt)
+
+    def coefficients(self, dt):
+        """ Dict of dt-dependent coefficients, set as attributes by set_dt. """
+        return {}
+
+    def set_dt(self, dt):
+        """ Step size of the following steps. """
+        if dt != self.dt:
+            self._use(dt)
+
+    def _use(self, dt):
+        coefficients = self._coefficients.pop(dt, None)
+        if coefficients is None:
+            coefficients = self.coefficients(dt)
+            if len(self._coefficients) >= self.cache_size:
+                self._coefficients.pop(next(iter(self._coefficients)))
+        self._coefficients[dt] = coefficients
+        self.__dict__.update(coefficients)
+        self.dt = dt
+
+    def step(self, t):
+        raise NotImplementedError
+
+    def _advance(self, *args):
+        raise NotImplementedError
+
+    def state_dict(self):
+        return {}
+
+    def load_state_dict(self, state):
+        pass
+
+    def __repr__(self):
+        return f"{type(self).__name__}(dt={self.dt})"
+
+
+class AB2CN(Integrator):
+    """
+    Semi-implicit AB2 (nonlinear terms and forcing) and CN2 (linear term), with a backward Euler
+    start-up step. Works in place on two state and two RHS buffers; the previous RHS is the AB2 history.
+    After a change of dt the variable-step AB2 weights of the step ratio are used.
+    """
+    def __init__(self, simulation, compile=False):
+        super().__init__(simulation, compile)
+        self.nlo_2 = None # RHS of the previous step
+        self.dt_prev = self.dt # Step size of the previous step
+
+    def coefficients(self, dt):
+        cn_explicit, cn_implicit = CN2_factors(self.sim.linear_operator, dt)
+        return {'cn_explicit': cn_explicit, 'cn_implicit': cn_implicit}
+
+    def start(self):
+        super().start()
+        sim = self.sim
+        self.q_bufs = [sim.qh.clone(), torch.empty_like(sim.qh)]
+        sim.qh = self.q_bufs[0]
+        self.nlo_bufs = [torch.empty_like(sim.qh), torch.empty_like(sim.qh)]
+        if self.nlo_2 is not None:
+            self.nlo_bufs[1].copy_(self.nlo_2)
+            self.nlo_2 = self.nlo_bufs[1]
+
+    def step(self, t):
+        sim = self.sim
+        # Ping-pong between the two state and RHS buffers
+        q_new = self.q_bufs[1] if sim.qh is self.q_bufs[0] else self.q_bufs[0]
+        nlo_1 = self.nlo_bufs[1] if self.nlo_2 is self.nlo_bufs[0] else self.nlo_bufs[0]
+        # Start-up step without history (first step, or a restart from a scheme without AB2 history)
+        self.advance(sim.qh, q_new, nlo_1, self.nlo_2, t, self.nlo_2 is None)
+        sim.qh = q_new
+        self.nlo_2 = nlo_1
+        self.dt_prev = self.dt
+
+    def _advance(self, qh, q_new, nlo_1, nlo_2, t, first_step):
+        dt = self.dt
+        # Compute nonlinear operators (Jacobian and forcing)
+        self.sim.rhs(qh, t, nlo_1)
+
+        # Explicit half of CN for the linear term: q + dt/2 L q
+        torch.mul(qh, self.cn_explicit, out=q_new)
+
+        # Time-stepping schemes for nonlinear terms (backward Euler start-up, then AB2)
+        if first_step:
+            backward_euler_(q_new, nlo_1, dt)
+        elif dt == self.dt_prev:
+            AB2_(q_new, nlo_1, nlo_2, dt)
+        else:
+            AB2_variable_(q_new, nlo_1, nlo_2, dt, self.dt_prev)
+
+        # Apply the linear operator inversion
+        return q_new.div_(self.cn_implicit)
+
+    def state_dict(self):
+        return {'nlo_jacobian_2': self.nlo_2, 'dt_prev': self.dt_prev}
+
+    def load_state_dict(self, state):
+        value = state.get('nlo_jacobian_2')
+        self.nlo_2 = value.to(self.sim.device, self.sim.grid.complex_dtype) if value is not None else None
+        self.dt_prev = state.get('dt_prev', state['dt'])
+        # Older checkpoints kept the forcing history separately
+        if self.nlo_2 is not None and state.get('term_forcing2') is not None:
+            self.nlo_2 = self.nlo_2 + state['term_forcing2'].to(self.sim.device, self.sim.grid.complex_dtype)
+
+
+class IMEXRK3(Integrator):
+    """
+    Low-storage three-stage RK3/CN of Spalart, Moser & Rogers (1991): third order for N, Crank-Nicolson
+    (second order) for L in every substep:
+    (1 - beta_k dt L) q_k+1 = (1 + alpha_k dt L) q_k + gamma_k dt N(q_k) + zeta_k dt N(q_k-1).
+    """
+    evaluations = 3
+    cfl_bounds = (0.3, 0.55)
+    max_cfl = 1.25
+    alpha = (29/96, -3/40, 1/6)
+    beta = (37/160, 5/24, 1/6)
+    gamma = (8/15, 5/12, 3/4)
+    zeta = (0.0, -17/60, -5/12)
+    c = (0.0, 8/15, 2/3) # Substep times (fractions of dt)
+
+    def coefficients(self, dt):
+        Lc = self.sim.linear_operator.Lc
+        return {'explicit': [1 + a*dt*Lc for a in self.alpha], 'implicit': [1 - b*dt*Lc for b in self.beta]}
+
+    def start(self):
+        super().start()
+        sim = self.sim
+        self.q_bufs = [sim.qh.clone(), torch.empty_like(sim.qh)]
+        sim.qh = self.q_bufs[0]
+        self.nlo_bufs = [torch.empty_like(sim.qh), torch.empty_like(sim.qh)]
+
+    def step(self, t):
+        sim = self.sim
+        q_new = self.q_bufs[1] if sim.qh is self.q_bufs[0] else self.q_bufs[0]
+        sim.qh = self.advance(sim.qh, q_new, t)
+
+    def _advance(self, qh, q_new, t):
+        dt = self.dt
+        nlo_k, nlo_prev = self.nlo_bufs
+        for k in range(3):
+            # Substeps alternate between the two state buffers and end in q_new
+            q_in, q_out = (qh, q_new) if k != 1 else (q_new, qh)
+            self.sim.rhs(q_in, t + self.c[k]*dt, nlo_k)
+            torch.mul(q_in, self.explicit[k], out=q_out).add_(nlo_k, alpha=self.gamma[k]*dt)
+            if self.zeta[k]:
+                q_out.add_(nlo_prev, alpha=self.zeta[k]*dt)
+            q_out.div_(self.implicit[k])
+            nlo_k, nlo_prev = nlo_prev, nlo_k
+        return q_new
+
+
+class ETDRK4(Integrator):
+    """
+    Exponential time differencing RK4 of Cox & Matthews. The exponentials and the phi-function
+    coefficients of the diagonal L are computed once per dt with the contour integral of Kassam & Trefethen,
+    which avoids cancellation for small |dt L| (L is complex because of the beta term).
+    """
+    evaluations = 4
+    cfl_bounds = (0.5, 0.9)
+    max_cfl = 2.0
+
+    def coefficients(self, h):
+        M = 32 # Points on the contour
+        hL = (h*self.sim.linear_operator.Lc).to(torch.complex128)
+        roots = torch.exp(2j*math.pi*(torch.arange(1, M+1, device=hL.device, dtype=torch.float64) - 0.5)/M)
+        r = hL[..., None] + roots.to(torch.complex128)
+        er = torch.exp(r)
+        dtype = self.sim.qh.dtype
+        return {'E': torch.exp(hL).to(dtype), 'E2': torch.exp(hL/2).to(dtype),
+                'Q': (h*torch.mean((torch.exp(r/2) - 1)/r, dim=-1)).to(dtype),
+                'f1': (h*torch.mean((-4 - r + er*(4 - 3*r + r**2))/r**3, dim=-1)).to(dtype),
+                'f2': (h*torch.mean((2 + r + er*(r - 2))/r**3, dim=-1)).to(dtype),
+                'f3': (h*torch.mean((-4 - 3*r - r**2 + er*(4 - r))/r**3, dim=-1)).to(dtype)}
+
+    def start(self):
+        super().start()
+        self.buffers = [torch.empty_like(self.sim.qh) for _ in range(6)]
+
+    def step(self, t):
+        sim = self.sim
+        sim.qh = self.advance(sim.qh, t)
+
+    def _advance(self, v, t):
+        h = self.dt
+        rhs = self.sim.rhs
+        Nv, Na, Nb, Nc, a, b = self.buffers
+        rhs(v, t, Nv)
+        torch.mul(v, self.E2, out=a).addcmul_(self.Q, Nv)
+        rhs(a, t + h/2, Na)
+        torch.mul(v, self.E2, out=b).addcmul_(self.Q, Na)
+        rhs(b, t + h/2, Nb)
+        c = torch.mul(a, self.E2).addcmul_(self.Q, 2*Nb - Nv)
+        rhs(c, t + h, Nc)
+        return (self.E*v).addcmul_(Nv, self.f1).addcmul_(Na + Nb, 2*self.f2).addcmul_(Nc, self.f3)
+
+
+INTEGRATORS = {'ab2cn': AB2CN, 'imex_rk3': IMEXRK3, 'etdrk4': ETDRK4}
+
+def make_integrator(time_params, simulation):
+    """ Integrator selected by time_params.scheme (default ab2cn). """
+    scheme = getattr(time_params, 'scheme', 'ab2cn')
+    if scheme not in INTEGRATORS:
+        raise ValueError("Invalid time-stepping scheme. Check config.")
+    return INTEGRATORS[scheme](simulation, getattr(time_params, 'compile', False))
@@ -0,0 +1,40 @@
+import os
+import torch
+
+
+def resolve_device(device=None):
+    """
+    Returns the torch.device to run on. Falls back to the CPU when no device is
+    given or when CUDA is requested but not available.
+    """
+    if device is None or device == 'auto':
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    device = torch.device(device)
+    if device.type == 'cuda' and not torch.cuda.is_available():
+        print(f"CUDA not available, running on cpu instead of {device}")
+        device = torch.device('cpu')
+    return device
+
+
+def default_num_threads():
+    """
+    Number of cores available to this process: an explicit OMP_NUM_THREADS,
+    then the slots granted by the batch scheduler (NSLOTS), then the CPU affinity mask.
+    """
+    for var in ('OMP_NUM_THREADS', 'NSLOTS'):
+        value = os.environ.get(var, '')
+        if value.isdigit() and int(value) > 0:
+            return int(value)
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def configure_device(device=None, num_threads=None):
+    """
+    Resolves the device and sets the intra-op thread count used by the CPU FFTs.
+    """
+    device = resolve_device(device)
+    if device.type == 'cpu':
+        torch.set_num_threads(num_threads or default_num_threads())
+    return device
@@ -1,12 +1,8 @@
-import importlib
 import numpy as np
-import math
-import matplotlib.pyplot as plt
-from Plotting.plots import vorticity_plots, spectrum_plot, spectrum
-from Operators.spectral_conversion import to_physical, to_spectral, dealias
+from Operators.spectral_conversion import to_spectral
+from Output.writers import member_dir, snapshot_file
 import os
 import torch
-import pickle
 import shutil
 
 def print_config(obj, indent=0):
@@ -27,15 +23,23 @@ def print_config(obj, indent=0):
         elif not callable(attr_value):  # Print regular attributes
             print(" " * indent + f"{attr_name} = {attr_value}")
 
-def save_file(grid,spectral_derivative,solution_field, run_number, time_params):
+def results_dir(run_number, member=None):
+    """Results folder of a run (or of one member of an ensemble run)."""
     base_dir = '/gdata/projects/ml_scope/Turbulence/QG_V0001/Results'
-    
-    ## Save fields (q,p,u,v)
     save_dir = os.path.join(base_dir, f'Run{run_number:05d}')
+    return save_dir if member is None else member_dir(save_dir, member)
+
+def save_file(grid,spectral_derivative,solution_field, run_number, time_params, save_fields=True, member=None, plots=True):
+    # save_fields=False when the snapshots were already streamed to disk by an Output.writers writer
+    # member: index of the ensemble member the solution_field belongs to
+    # plots=False leaves the vorticity plots to the parallel render stage (Plotting.render)
+    
+    ## Save fields (q,p,u,v), time first ([T, 4, Ny, Nx]) like the streamed snapshot files
+    save_dir = results_dir(run_number, member)
     os.makedirs(save_dir, exist_ok=True)
-    file_name = f'fields_Run{run_number:05d}.npy'
-    file_path = os.path.join(save_dir, file_name)
-    np.save(file_path, solution_field.cpu().numpy())   
+    if save_fields:
+        file_path = snapshot_file(save_dir, run_number)
+        np.save(file_path, solution_field.permute(2, 3, 0, 1).cpu().numpy())   
     
     ### Move all code files
     # Move config file to results folder
@@ -70,8 +74,11 @@ def save_file(grid,spectral_derivative,solution_field, run_number, time_params):
             shutil.copy(source_file, destination_file)
     
     
-    base_dir = '/gdata/projects/ml_scope/Turbulence/QG_V0001/Results/'
-    save_dir = os.path.join(base_dir, f'Run{run_number:05d}', 'Plots')
+    if not plots:
+        return
+    import matplotlib.pyplot as plt
+    from Plotting.plots import vorticity_plots
+    save_dir = os.path.join(results_dir(run_number, member), 'Plots')
     os.makedirs(save_dir, exist_ok=True)
     
     for timestep in range(solution_field.shape[2]):
@@ -84,28 +91,26 @@ def save_file(grid,spectral_derivative,solution_field, run_number, time_params):
         plt.close(fig)  # Close the figure to free memory
     
     
-def save_spectrum_plots(solution_field, spectral_derivative, run_number, time_params):
-    base_dir = '/gdata/projects/ml_scope/Turbulence/QG_V0001/Results/'
-    save_dir = os.path.join(base_dir, f'Run{run_number:05d}', 'Spectrum')
+def save_spectrum_plots(solution_field, spectral_derivative, run_number, time_params, member=None, batch_size=32):
+    import matplotlib.pyplot as plt
+    from Plotting.plots import spectrum_plot, energy_enstrophy_spectra
+    save_dir = os.path.join(results_dir(run_number, member), 'Spectrum')
     os.makedirs(save_dir, exist_ok=True)
     
-    for timestep in range(solution_field.shape[2]):
-        
-        qh_sol=to_spectral(solution_field[:,:,timestep,0].squeeze()).cuda() # Extract just vorticity field
-        ph_sol=-qh_sol*spectral_derivative.irsq
-        uh_sol= -1j * spectral_derivative.ky * ph_sol # Get u velocity
-        vh_sol = 1j * spectral_derivative.kr * ph_sol # Get v velocity
-        
-        z = torch.abs(qh_sol)**2 # Get enstrophy
-        e = torch.abs(uh_sol)**2 + torch.abs(vh_sol)**2 # Get kinetic energy
-        
-        k,[ek,zk]=spectrum([e,z],spectral_derivative)
+    n_times = solution_field.shape[2]
+    for start in range(0, n_times, batch_size):
+        # Spectra of a batch of snapshots at once (read lazily from saved snapshot files)
+        stop = min(start + batch_size, n_times)
+        q_phys = torch.as_tensor(np.array(solution_field[:,:,start:stop,0])).permute(2, 0, 1)
+        qh_sol = to_spectral(q_phys.to(spectral_derivative.device, spectral_derivative.grid.dtype)) # Vorticity
+        k, ek, zk = energy_enstrophy_spectra(qh_sol, spectral_derivative)
+        k, ek, zk = k.cpu(), ek.cpu(), zk.cpu()
 
-        fig, ax =  spectrum_plot(k, ek, zk, timestep, time_params)
+        for i, timestep in enumerate(range(start, stop)):
+            fig, ax =  spectrum_plot(k, ek[i], zk[i], timestep, time_params)
 
-        # Save the plot as an image 
-        plot_file_name = f'spectrum_Run{run_number:05d}_t_{timestep*time_params.save_int:06d}.png'
-        plot_file_path = os.path.join(save_dir, plot_file_name)
-        fig.savefig(plot_file_path,bbox_inches='tight',dpi=300)  # Save the plot as an image
-        plt.close(fig)  # Close the figure to free memory
-    
\ No newline at end of file
+            # Save the plot as an image 
+            plot_file_name = f'spectrum_Run{run_number:05d}_t_{timestep*time_params.save_int:06d}.png'
+            plot_file_path = os.path.join(save_dir, plot_file_name)
+            fig.savefig(plot_file_path,bbox_inches='tight',dpi=300)  # Save the plot as an image
+            plt.close(fig)  # Close the figure to free memory
@@ -0,0 +1,84 @@
+import math
+import numpy as np
+import pytest
+import torch
+from Grid.grid import Grid
+from Operators.operators import SpectralDerivatives, LinearOperator, NonlinearOperator
+from Initial_forcing.ics import init_randn
+from Initial_forcing.forcing import make_forcing
+from Output.writers import SnapshotWriter, MemoryWriter, NpyWriter, open_snapshots, load_npy_snapshots
+from Simulation.simulation import Simulation
+
+
+class pde_params:
+    mu = 2e-2; nu = 1.025e-4; B = 2.5; nv = 1
+
+class forcing_params:
+    option = 1; A = -1/10; B = 2; C = 0; D = 1/10; E = 2; F = 0
+
+
+class TimeWriter(SnapshotWriter):
+    """ Records the simulation time of every snapshot. """
+    def __init__(self):
+        super().__init__()
+        self.simulation = None
+        self.times = []
+
+    def _write(self, fields):
+        self.times.append(self.simulation.time if self.simulation is not None else 0.0)
+
+    def result(self):
+        return self.times
+
+
+def make_simulation(T, dt, save_int, adaptive, Nx=32, Ny=32, writer=None):
+    class time_params:
+        pass
+    time_params.dt, time_params.T, time_params.save_int, time_params.adaptive = dt, T, save_int, adaptive
+    grid = Grid(Lx=2*math.pi*Nx/32, Ly=2*math.pi*Ny/32, Nx=Nx, Ny=Ny, device='cpu', precision='float64')
+    sd = SpectralDerivatives(grid)
+    writer = TimeWriter() if writer is None else writer
+    sim = Simulation(grid, pde_params, sd, LinearOperator(sd, pde_params), NonlinearOperator(sd, pde_params),
+                     init_randn(0.01, [3.0, 5.0], grid, sd, 495), time_params, forcing_params,
+                     make_forcing(forcing_params), writer)
+    if isinstance(writer, TimeWriter):
+        writer.simulation = sim
+    return sim, writer
+
+
+@pytest.mark.parametrize('T, dt, save_int', [(301e-3, 1e-3, 50), (300e-3, 1e-3, 50), (0.1, 1e-2, 3), (0.5, 1e-2, 7)])
+def test_adaptive_saves_match_fixed_step(T, dt, save_int):
+    fixed, fixed_writer = make_simulation(T, dt, save_int, adaptive=False)
+    fixed.run()
+    adaptive, adaptive_writer = make_simulation(T, dt, save_int, adaptive=True)
+    adaptive.run()
+    # Snapshots of steps 0, save_int, ... up to the last step steps - 1 (n_saves unless steps is a multiple of save_int)
+    assert adaptive_writer.count == fixed_writer.count == (fixed.steps - 1)//save_int + 1
+    for t_fixed, t_adaptive in zip(fixed_writer.times, adaptive_writer.times):
+        assert math.isclose(t_fixed, t_adaptive, rel_tol=1e-9, abs_tol=1e-12)
+
+
+@pytest.mark.parametrize('writer', ['memory', 'npy'])
+def test_non_square_snapshots(writer, tmp_path):
+    path = str(tmp_path / 'fields.npy')
+    # (MemoryWriter(Nx, Ny, n_saves) is the default writer)
+    sim, _ = make_simulation(0.021, 1e-3, 5, False, Nx=64, Ny=32,
+                             writer=NpyWriter(path) if writer == 'npy' else MemoryWriter(64, 32, 5))
+    sim.run()
+    view = sim.writer.result() if writer == 'memory' else open_snapshots(path)
+    assert tuple(view.shape) == (32, 64, sim.n_saves, 4) # [Ny, Nx, T, 4]
+    q = view[:, :, -1, 0]
+    q = (q if torch.is_tensor(q) else torch.from_numpy(np.array(q))).to(torch.float64)
+    assert torch.allclose(q, sim.physical_fields(sim.qh)[0], atol=1e-5)
+
+
+def test_legacy_snapshot_layout(tmp_path):
+    fields = np.random.default_rng(0).standard_normal((3, 4, 16, 16)).astype(np.float32) # [T, 4, Ny, Nx]
+    np.save(tmp_path / 'new.npy', fields)
+    np.save(tmp_path / 'legacy.npy', fields.transpose(2, 3, 0, 1))
+    for name in ('new.npy', 'legacy.npy'):
+        assert np.array_equal(load_npy_snapshots(str(tmp_path / name)), fields)
+        assert np.array_equal(open_snapshots(str(tmp_path / name)), fields.transpose(2, 3, 0, 1))
+    np.save(tmp_path / 'other.npy', np.zeros((3, 5)))
+    with pytest.raises(ValueError):
+        load_npy_snapshots(str(tmp_path / 'other.npy'))
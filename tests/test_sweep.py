@@ -0,0 +1,36 @@
+import os
+from Sweep.sweep import Job, run_sweep
+
+
+class grid:
+    Nx = 32; Ny = 32; Lx = 1.0; Ly = 1.0
+
+class params:
+    grid = grid
+
+
+class ScriptedJob(Job):
+    """ Job whose outcome is given by action (ok, raise or crash) instead of a config. """
+    def __init__(self, run_number, action):
+        super().__init__(run_number, 'Config.Run02721')
+        self.action = action
+
+    def params(self):
+        return params
+
+
+def scripted_run(job, resume=False):
+    if job.action == 'crash':
+        os._exit(137) # A worker killed, e.g. by the OOM killer
+    record = {'run_number': job.run_number, 'config': job.config, 'overrides': job.overrides, 'wall_time': 0.0}
+    if job.action == 'raise':
+        return dict(record, status='failed', error='ValueError: bad parameters')
+    return dict(record, status='done', steps=1, time=0.0, stopped=None)
+
+
+def test_crashing_job_does_not_fail_queued_jobs():
+    jobs = [ScriptedJob(1, 'raise'), ScriptedJob(2, 'crash'), ScriptedJob(3, 'ok'), ScriptedJob(4, 'ok')]
+    records = run_sweep(jobs, workers=1, retries=1, runner=scripted_run, log=lambda message: None)
+    assert [record['status'] for record in records] == ['failed', 'failed', 'done', 'done']
+    assert records[0]['error'].startswith('ValueError')
+    assert records[1]['error'] == 'Worker process died'